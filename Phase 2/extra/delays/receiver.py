@@ -1,13 +1,24 @@
 import socket
 import struct
+import hashlib
+import math
+import sys
 import time
 import random
 
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
 PACKET_SIZE = 1024
+TIMEOUT = 0.1  # The sender's, runner --timeout sets it on both sides
+FIN_MAX_WAIT = 0.5  # Longest the sender waits between EOFs while TIMEOUT is shorter, as in sender.py
+FIN_INFO = struct.Struct("!Q32s")  # EOF payload: total file length, SHA-256 of the file
+KERNEL_TIMESTAMPS = False  # Linux: read each packet's kernel arrival time (SO_TIMESTAMPNS) alongside it
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)  # Linux value, not every socket module build exports it
+TIMESPEC = struct.Struct("@qq")  # struct timespec: seconds, nanoseconds
 
 delay_count = 0
+read_delays = []  # Seconds each data packet sat in the socket buffer before Python read it
+latency_stats = {}
 
 def calculate_checksum(data):
     checksum = 0
@@ -21,34 +32,116 @@ def calculate_checksum(data):
 def is_corrupt(data, received_checksum):
     return received_checksum != calculate_checksum(data)
 
+def fin_matches(data, received, digest):
+    #EOF carries the sender's length and digest, completion is confirmed without another round trip
+    if len(data) != FIN_INFO.size:
+        return False
+    total, expected = FIN_INFO.unpack(data)
+    return total == received and expected == digest.digest()
+
+def enable_timestamps(sock):
+    #Returns False where the platform has no SO_TIMESTAMPNS, times then come from time.time() alone
+    if not KERNEL_TIMESTAMPS or not sys.platform.startswith("linux") or not hasattr(sock, "recvmsg"):
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError:
+        return False
+    return True
+
+def receive(sock, size, timestamps):
+    """recvfrom that also returns (kernel arrival, application arrival), both on the time.time() clock."""
+    if not timestamps:
+        data, addr = sock.recvfrom(size)
+        now = time.time()
+        return data, addr, now, now
+    data, ancdata, _, addr = sock.recvmsg(size, socket.CMSG_SPACE(TIMESPEC.size))
+    now = time.time()
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(payload) >= TIMESPEC.size:
+            seconds, nanoseconds = TIMESPEC.unpack_from(payload)
+            return data, addr, seconds + nanoseconds / 1e9, now
+    return data, addr, now, now
+
+def summary(samples):
+    #Milliseconds
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3
+    return {"count": len(ordered), "median": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": ordered[-1] * 1e3}
+
+def histogram(title, samples):
+    #Power-of-two buckets in microseconds
+    print(title)
+    buckets = {}
+    for sample in samples:
+        bucket = max(0, int(math.log2(max(sample * 1e6, 1))))
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+    widest = max(buckets.values())
+    for bucket in range(min(buckets), max(buckets) + 1):
+        count = buckets.get(bucket, 0)
+        print(f"  < {2 ** (bucket + 1):>8} us {count:>6} {'#' * math.ceil(40 * count / widest)}")
+
+def report_latency():
+    global latency_stats
+    if not read_delays:
+        return
+    latency_stats = {"kernel_timestamps": True, "read_delay_ms": summary(read_delays)}
+    histogram("Delay between the kernel receiving a packet and Python reading it:", read_delays)
+
+def make_eof_ack(matches, checksum):
+    #The verdict sits behind its own checksum, a flipped bit makes the sender resend EOF instead of misreading it
+    verdict = bytes([matches])
+    return struct.pack("!B2s", 255, checksum(verdict)) + verdict
+
+def linger(sock, eof_ack):
+    #TIME_WAIT: a lost EOF ACK makes the sender resend EOF, answer every copy until it goes quiet.
+    #The sender waits at most max(TIMEOUT, FIN_MAX_WAIT) between two EOFs, twice that covers one lost EOF ACK
+    sock.settimeout(2 * max(TIMEOUT, FIN_MAX_WAIT))
+    while True:
+        try:
+            packet, addr = sock.recvfrom(PACKET_SIZE + 3)
+        except socket.timeout:
+            break
+        if packet[:1] == b"\xff":
+            sock.sendto(eof_ack, addr)
+
 def main():
     global delay_count
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((UDP_IP, UDP_PORT))
+    timestamps = enable_timestamps(sock)
 
     expected_seq_num = 0
     last_ack = struct.pack("!B", 1 - expected_seq_num)
 
     with open("received.jpg", "wb") as f:
+        digest = hashlib.sha256()
         while True:
             print("Waiting for packets...")
-            packet, addr = sock.recvfrom(PACKET_SIZE + 3)
+            packet, addr, arrived, returned = receive(sock, PACKET_SIZE + 3, timestamps)
             print("Packet received!")
+            if timestamps:
+                read_delays.append(returned - arrived)
 
             seq_num, received_checksum = struct.unpack("!B2s", packet[:3])
             data = packet[3:]
 
             if seq_num == 255:
+                if is_corrupt(data, received_checksum):
+                    print("Corrupt EOF packet, waiting for the sender to resend it")
+                    continue
                 print("EOF received. Sending EOF ACK...")
                 time.sleep(random.uniform(0, 0.5))  # Simulated delay for EOF ACK
-                sock.sendto(struct.pack("!B", 255), addr)
-                break
+                eof_ack = make_eof_ack(fin_matches(data, f.tell(), digest), calculate_checksum)
+                sock.sendto(eof_ack, addr)
+                break  # Exit loop and close file
 
             print(f"Received packet {seq_num}, expected {expected_seq_num}")
             print(f"Received checksum: {received_checksum.hex()}, Computed checksum: {calculate_checksum(data).hex()}")
 
             if not is_corrupt(data, received_checksum) and seq_num == expected_seq_num:
                 f.write(data)
+                digest.update(data)
                 print(f"Packet {seq_num} received correctly, sending ACK {seq_num}")
                 ack_packet = struct.pack("!B", seq_num)
                 expected_seq_num = 1 - expected_seq_num
@@ -64,6 +157,8 @@ def main():
             
             sock.sendto(last_ack, addr)
 
+    report_latency()
+    linger(sock, eof_ack)
     sock.close()
 
 if __name__ == "__main__":
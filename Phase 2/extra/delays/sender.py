@@ -1,15 +1,30 @@
 import socket
 import struct
+import hashlib
+import math
+import sys
 import time
 import random
 
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
 PACKET_SIZE = 1024
+TIMEOUT = 0.1  # First ACK timeout, adapted to the measured RTT from then on
+FIN_RETRIES = 20  # EOF resends before giving up on the EOF ACK
+FIN_MIN_WAIT = 0.01  # First wait for the EOF ACK when the timeout passed in is shorter
+FIN_MAX_WAIT = 0.5  # Each resend doubles the wait up to this, or up to the timeout when that is longer
+FIN_INFO = struct.Struct("!Q32s")  # EOF payload: total file length, SHA-256 of the file
+KERNEL_TIMESTAMPS = False  # Linux: time ACKs by when the kernel queued them (SO_TIMESTAMPNS), not when recvfrom returned
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)  # Linux value, not every socket module build exports it
+TIMESPEC = struct.Struct("@qq")  # struct timespec: seconds, nanoseconds
 
 delay_count = 0
 retransmissions = 0
 total_delay = 0
+kernel_rtts = []  # RTT samples with the ACK timed by the kernel
+app_rtts = []  # Same samples, ACK timed once recvfrom returned to Python
+latency_stats = {}
+confirmed = None  # Whether the receiver confirmed the file's length and digest, set by main
 
 def calculate_checksum(data):
     checksum = 0
@@ -25,31 +40,109 @@ def make_packet(seq_num, data):
     header = struct.pack("!B2s", seq_num, checksum)
     return header + data
 
+def enable_timestamps(sock):
+    #Returns False where the platform has no SO_TIMESTAMPNS, times then come from time.time() alone
+    if not KERNEL_TIMESTAMPS or not sys.platform.startswith("linux") or not hasattr(sock, "recvmsg"):
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError:
+        return False
+    return True
+
+def receive(sock, size, timestamps):
+    """recvfrom that also returns (kernel arrival, application arrival), both on the time.time() clock."""
+    if not timestamps:
+        data, addr = sock.recvfrom(size)
+        now = time.time()
+        return data, addr, now, now
+    data, ancdata, _, addr = sock.recvmsg(size, socket.CMSG_SPACE(TIMESPEC.size))
+    now = time.time()
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(payload) >= TIMESPEC.size:
+            seconds, nanoseconds = TIMESPEC.unpack_from(payload)
+            return data, addr, seconds + nanoseconds / 1e9, now
+    return data, addr, now, now
+
+def summary(samples):
+    #Milliseconds
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3
+    return {"count": len(ordered), "median": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": ordered[-1] * 1e3}
+
+def histogram(title, samples):
+    #Power-of-two buckets in microseconds
+    print(title)
+    buckets = {}
+    for sample in samples:
+        bucket = max(0, int(math.log2(max(sample * 1e6, 1))))
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+    widest = max(buckets.values())
+    for bucket in range(min(buckets), max(buckets) + 1):
+        count = buckets.get(bucket, 0)
+        print(f"  < {2 ** (bucket + 1):>8} us {count:>6} {'#' * math.ceil(40 * count / widest)}")
+
+def report_latency(timestamps):
+    global latency_stats
+    if not app_rtts:
+        return
+    latency_stats = {"kernel_timestamps": timestamps, "app_rtt_ms": summary(app_rtts)}
+    histogram("RTT, ACK timed when recvfrom returned:", app_rtts)
+    if timestamps:
+        overhead = [app - kernel for app, kernel in zip(app_rtts, kernel_rtts)]
+        latency_stats["kernel_rtt_ms"] = summary(kernel_rtts)
+        latency_stats["python_delay_ms"] = summary(overhead)
+        histogram("RTT, ACK timed by the kernel:", kernel_rtts)
+        histogram("Delay between the kernel queueing an ACK and Python seeing it:", overhead)
+        print(f"Median RTT {latency_stats['kernel_rtt_ms']['median']:.3f} ms in the kernel, "
+              f"{latency_stats['app_rtt_ms']['median']:.3f} ms as Python sees it")
+
+def close_transfer(sock, addr, total, digest, timeout):
+    """Send EOF carrying the file's length and digest, returns True once the receiver confirms both."""
+    eof_packet = make_packet(255, FIN_INFO.pack(total, digest.digest()))
+    matched, mismatched = make_packet(255, b"\x01"), make_packet(255, b"\x00")  # The receiver's two EOF ACKs
+    sock.sendto(eof_packet, addr)
+    print("EOF packet sent. Waiting for EOF ACK...")
+    wait = max(timeout, FIN_MIN_WAIT)
+    resends = 0
+    while True:
+        sock.settimeout(wait)
+        try:
+            ack, _ = sock.recvfrom(len(matched))
+        except socket.timeout:
+            ack = None
+        if ack == matched:
+            print("EOF ACK received. File transfer complete.")
+            return True
+        if ack == mismatched:
+            print("EOF ACK received, but the receiver's length or digest does not match!")
+            return False
+        if ack is not None and ack[:1] != b"\xff":
+            print(f"Unexpected ACK {ack.hex()}, waiting for EOF ACK...")  # Stale data ACK, keep reading
+            continue
+        if resends == FIN_RETRIES:
+            break
+        resends += 1  # Only a resend spends a try, stale ACKs arriving meanwhile do not
+        wait = min(wait * 2, max(timeout, FIN_MAX_WAIT))  # A slow EOF ACK is not a lost one
+        print("Timeout! Resending EOF packet." if ack is None else "Corrupt EOF ACK! Resending EOF packet.")
+        sock.sendto(eof_packet, addr)
+    print(f"No EOF ACK after {FIN_RETRIES} resends, giving up.")  # Receiver is gone or the path is down
+    return False
+
 def send_file(filename, sock, addr):
     global retransmissions, total_delay, delay_count
+    timestamps = enable_timestamps(sock)
     with open(filename, "rb") as f:
+        digest = hashlib.sha256()
         seq_num = 0
-        timeout = 0.1  # Initial timeout
+        timeout = TIMEOUT
 
         while True:
             chunk = f.read(PACKET_SIZE)
+            digest.update(chunk)
             if not chunk:
-                eof_packet = struct.pack("!B2s", 255, b'\x00\x00')
-                sock.sendto(eof_packet, addr)
-                print("EOF packet sent. Waiting for EOF ACK...")
-                
-                while True:
-                    try:
-                        sock.settimeout(timeout)
-                        ack, _ = sock.recvfrom(1)
-                        ack_seq, = struct.unpack("!B", ack)
-                        
-                        if ack_seq == 255:
-                            print("EOF ACK received. File transfer complete.")
-                            return
-                    except socket.timeout:
-                        print("Timeout! Resending EOF packet.")
-                        sock.sendto(eof_packet, addr)
+                report_latency(timestamps)
+                return close_transfer(sock, addr, f.tell(), digest, timeout)
 
             packet = make_packet(seq_num, chunk)
             send_time = time.time()
@@ -69,11 +162,14 @@ def send_file(filename, sock, addr):
 
                 try:
                     sock.settimeout(timeout)
-                    ack, _ = sock.recvfrom(1)
+                    ack, _, arrived, returned = receive(sock, 1, timestamps)
                     ack_seq, = struct.unpack("!B", ack)
 
                     if ack_seq == seq_num:
-                        rtt = time.time() - send_time
+                        rtt = arrived - send_time  # Kernel arrival time when enabled, Python scheduling left out
+                        app_rtts.append(returned - send_time)
+                        if timestamps:
+                            kernel_rtts.append(rtt)
                         timeout = min(0.5, rtt * 1.5)  # Adaptive timeout
 
                         print(f"ACK {ack_seq} received, moving to next packet.")
@@ -93,6 +189,7 @@ def send_file(filename, sock, addr):
                     continue
 
 def main():
+    global confirmed
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     receiver_addr = (UDP_IP, UDP_PORT)
 
@@ -101,7 +198,7 @@ def main():
 
     filename = "image.jpg"
     start_time = time.time()
-    send_file(filename, sock, receiver_addr)
+    confirmed = send_file(filename, sock, receiver_addr)
     end_time = time.time()
 
     global retransmissions
@@ -109,6 +206,8 @@ def main():
     sock.close()
     print(f"Total transmission time: {end_time - start_time:.4f} seconds")
     print(f"Retransmissions: {retransmissions}")
+    if not confirmed:
+        print("The receiver did not confirm the file!")
 
 if __name__ == "__main__":
     main()
@@ -2,28 +2,89 @@ import sys
 import threading
 import socket
 import struct
+import hashlib
 import time
 import subprocess
+from collections import deque
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QLabel, QPushButton, QProgressBar,
     QGraphicsView, QGraphicsScene, QGraphicsEllipseItem, QVBoxLayout, QWidget, QHBoxLayout
 )
-from PyQt6.QtGui import QPixmap
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from PyQt6.QtGui import QPixmap, QPainter, QPen, QColor
+from PyQt6.QtCore import Qt, QTimer, QPointF, pyqtSignal
 
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
 PACKET_SIZE = 1024
+TIMEOUT = 1.0  # The sender's, runner --timeout sets it on both sides
+FIN_MAX_WAIT = 0.5  # Longest the sender waits between EOFs while TIMEOUT is shorter, as in sender.py
+FIN_INFO = struct.Struct("!Q32s")  # EOF payload: total file length, SHA-256 of the file
+FRAME_INTERVAL = 33  # ms between GUI refreshes (~30 fps), packets never touch the GUI directly
+HISTORY = 150  # Chart samples kept in each ring buffer (~5 s at 30 fps)
+
+def fin_matches(data, received, digest):
+    #EOF carries the sender's length and digest, completion is confirmed without another round trip
+    if len(data) != FIN_INFO.size:
+        return False
+    total, expected = FIN_INFO.unpack(data)
+    return total == received and expected == digest.digest()
+
+def make_eof_ack(matches, checksum):
+    #The verdict sits behind its own checksum, a flipped bit makes the sender resend EOF instead of misreading it
+    verdict = bytes([matches])
+    return struct.pack("!B2s", 255, checksum(verdict)) + verdict
+
+def linger(sock, eof_ack):
+    #TIME_WAIT: a lost EOF ACK makes the sender resend EOF, answer every copy until it goes quiet.
+    #The sender waits at most max(TIMEOUT, FIN_MAX_WAIT) between two EOFs, twice that covers one lost EOF ACK
+    sock.settimeout(2 * max(TIMEOUT, FIN_MAX_WAIT))
+    while True:
+        try:
+            packet, addr = sock.recvfrom(PACKET_SIZE + 3)
+        except socket.timeout:
+            break
+        if packet[:1] == b"\xff":
+            sock.sendto(eof_ack, addr)
+
+#Small line chart drawn straight from a ring buffer
+class SparkLine(QWidget):
+    def __init__(self, title, unit, color, parent=None):
+        super().__init__(parent)
+        self.title = title
+        self.unit = unit
+        self.color = QColor(color)
+        self.values = deque(maxlen=HISTORY)
+        self.setFixedHeight(60)
+
+    def add(self, value):
+        self.values.append(value)
+        self.update()
+
+    def clear(self):
+        self.values.clear()
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("white"))
+        latest = self.values[-1] if self.values else 0
+        painter.drawText(4, 14, f"{self.title}: {latest:.1f} {self.unit}")
+        if len(self.values) > 1:
+            top = max(self.values) or 1
+            step = self.width() / (HISTORY - 1)
+            height = self.height() - 20
+            points = [QPointF(i * step, self.height() - 2 - height * v / top) for i, v in enumerate(self.values)]
+            painter.setPen(QPen(self.color, 2))
+            painter.drawPolyline(points)
+        painter.end()
 
 class FileTransferApp(QMainWindow):
-    update_progress = pyqtSignal(int)  # Signal to update progress bar
-    update_fsm = pyqtSignal(str)       # Signal to update FSM state
-    
+    update_fsm = pyqtSignal(str)       # Signal to update FSM state, only sent on state changes
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("File Transfer & FSM")
         self.setGeometry(100, 100, 500, 500)
-        self.update_progress.connect(self.update_progress_bar)
         self.update_fsm.connect(self.update_fsm_state)
 
         # Layout
@@ -33,7 +94,8 @@ class FileTransferApp(QMainWindow):
 
         # Image Display (Data Transfer)
         self.image_label = QLabel(self)
-        self.image_label.setPixmap(QPixmap("background.jpg"))  # Initial image
+        self.full_image = QPixmap("background.jpg")  # Loaded once, cropped per frame
+        self.image_label.setPixmap(self.full_image)  # Initial image
         self.image_label.setScaledContents(True)
         self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.image_label.setFixedSize(800, 400)
@@ -57,6 +119,14 @@ class FileTransferApp(QMainWindow):
         self.progress_bar.setRange(0, 100)
         layout.addWidget(self.progress_bar)
 
+        # Live charts fed from ring buffers once per frame
+        self.throughput_chart = SparkLine("Throughput", "KB/s", "steelblue", self)
+        self.gap_chart = SparkLine("ACK to next packet", "ms", "darkorange", self)
+        self.retransmission_chart = SparkLine("Retransmissions", "/frame", "crimson", self)
+        layout.addWidget(self.throughput_chart)
+        layout.addWidget(self.gap_chart)
+        layout.addWidget(self.retransmission_chart)
+
         # Buttons
         self.start_button = QPushButton("Start Transfer", self)
         self.stop_button = QPushButton("Stop", self)
@@ -67,10 +137,16 @@ class FileTransferApp(QMainWindow):
         self.start_button.clicked.connect(self.start_transfer)
         self.stop_button.clicked.connect(self.stop_transfer)
 
-        # Timer for GUI Updates
+        # Timer for GUI Updates, polls the reception counters at a fixed frame rate
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_gui)
-        self.transfer_progress = 0
+        self.transfer_progress = -1
+
+        # Written by the reception thread, read by update_gui
+        self.received_size = 0
+        self.retransmissions = 0
+        self.gap_samples = deque(maxlen=4096)
+        self.last_frame = (0.0, 0, 0)  # time, bytes, retransmissions at the previous frame
 
         # Variables for Thread Handling
         self.transfer_active = False
@@ -79,8 +155,16 @@ class FileTransferApp(QMainWindow):
     def start_transfer(self):
         if not self.transfer_active:
             self.transfer_active = True
-            self.transfer_progress = 0
-            self.timer.start(500)  # Update every 500ms
+            self.transfer_progress = -1
+            self.received_size = 0
+            self.retransmissions = 0
+            self.gap_samples.clear()
+            # The protocol only tells the total in the EOF, so the bar stays busy until then
+            self.progress_bar.setRange(0, 0)
+            self.last_frame = (time.perf_counter(), 0, 0)
+            for chart in (self.throughput_chart, self.gap_chart, self.retransmission_chart):
+                chart.clear()
+            self.timer.start(FRAME_INTERVAL)
             self.receiver_thread = threading.Thread(target=self.begin_reception, daemon=True)
             self.receiver_thread.start()
             time.sleep(1)
@@ -90,13 +174,14 @@ class FileTransferApp(QMainWindow):
     def stop_transfer(self):
         self.transfer_active = False
         self.timer.stop()
+        self.progress_bar.setRange(0, 100)
         self.progress_bar.setValue(0)
         self.update_fsm_state("IDLE")
 
     # Update Image as Transfer Progresses
     def update_image_progress(self, progress):
         """Update image to reflect transfer progress"""
-        full_image = QPixmap("background.jpg")  # Load full image
+        full_image = self.full_image  # Cached, never reloaded from disk
         cropped_image = full_image.copy(0, 0, int(full_image.width() * (progress / 100)), full_image.height())
         self.image_label.setPixmap(cropped_image)
 
@@ -108,6 +193,9 @@ class FileTransferApp(QMainWindow):
     # Update FSM State
     def update_fsm_state(self, state):
         """Change FSM visualization based on sender/receiver states"""
+        if state == "COMPLETED" and self.transfer_active:
+            self.finish_reception(state)
+            return
         if state == "SENDING":
             self.sender_state.setBrush(Qt.GlobalColor.yellow)
             self.receiver_state.setBrush(Qt.GlobalColor.gray)
@@ -121,21 +209,32 @@ class FileTransferApp(QMainWindow):
             self.sender_state.setBrush(Qt.GlobalColor.gray)
             self.receiver_state.setBrush(Qt.GlobalColor.gray)
 
-    # Update GUI during Transfer
+    # Update GUI during Transfer, one frame per timer tick however many packets arrived
     def update_gui(self):
-        if self.transfer_active and self.transfer_progress < 100:
-            self.transfer_progress += 10
-            self.progress_bar.setValue(self.transfer_progress)
-            self.update_image_progress(self.transfer_progress)
-
-            # FSM Logic: Sending (0-50%), Receiving (50-100%)
-            if self.transfer_progress < 50:
-                self.update_fsm_state("SENDING")
-            else:
-                self.update_fsm_state("RECEIVING")
-        else:
-            self.timer.stop()
-            self.update_fsm_state("COMPLETED")  # Mark as completed
+        now = time.perf_counter()
+        received, retransmissions = self.received_size, self.retransmissions
+        last_time, last_received, last_retransmissions = self.last_frame
+        self.last_frame = (now, received, retransmissions)
+
+        elapsed = now - last_time
+        self.throughput_chart.add((received - last_received) / 1024 / elapsed if elapsed > 0 else 0)
+        self.retransmission_chart.add(retransmissions - last_retransmissions)
+        samples = []
+        while self.gap_samples:
+            samples.append(self.gap_samples.popleft())
+        if samples:
+            self.gap_chart.add(sum(samples) / len(samples) * 1000)
+
+        progress = 0 if self.transfer_active else 100
+        if progress != self.transfer_progress:  # Only re-crop the image when it visibly changes
+            self.transfer_progress = progress
+            if not self.transfer_active:
+                self.progress_bar.setRange(0, 100)  # Done, leave the busy state
+            self.update_progress_bar(progress)
+
+        if self.transfer_active:
+            # FSM Logic: waiting on the sender until the first byte lands, then receiving
+            self.update_fsm_state("RECEIVING" if received else "SENDING")
 
     # Custom 16-bit checksum
     def calculate_checksum(self, data):
@@ -149,28 +248,43 @@ class FileTransferApp(QMainWindow):
     def is_corrupt(self, data, received_checksum):
         return received_checksum != self.calculate_checksum(data)
 
+    def finish_reception(self, state):
+        """Runs on the GUI thread once the reception thread is done."""
+        self.transfer_active = False
+        self.update_gui()  # Last frame shows the final byte count
+        self.timer.stop()
+        self.update_fsm_state(state)
+
     def begin_reception(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.bind((UDP_IP, UDP_PORT))
 
-        received_size = 0
-        expected_size = 2048 * 100
+        last_ack_time = 0
         expected_seq_num = 0
         last_ack = struct.pack("!B", 1 - expected_seq_num)  # Default last ACK
 
         with open("received.jpg", "wb") as f:
+            digest = hashlib.sha256()
             while True:
                 print("Waiting for packets...")
                 packet, addr = sock.recvfrom(PACKET_SIZE + 3)
                 print("Packet received!")
+                if last_ack_time:
+                    # ACK out to next packet in: the RTT plus however long the sender took to send
+                    # again, or its timeout when the ACK was lost. Not the sender's RTT
+                    self.gap_samples.append(time.perf_counter() - last_ack_time)
 
                 seq_num, received_checksum = struct.unpack("!B2s", packet[:3])
                 data = packet[3:]
 
                 # Check for EOF (End of File) signal
                 if seq_num == 255:
+                    if self.is_corrupt(data, received_checksum):
+                        print("Corrupt EOF packet, waiting for the sender to resend it")
+                        continue
                     print("EOF received. Sending EOF ACK...")
-                    sock.sendto(struct.pack("!B", 255), addr)  # Send EOF ACK
+                    eof_ack = make_eof_ack(fin_matches(data, f.tell(), digest), self.calculate_checksum)
+                    sock.sendto(eof_ack, addr)
                     break  # Exit loop and close file
 
                 print(f"Received packet {seq_num}, expected {expected_seq_num}")
@@ -178,19 +292,21 @@ class FileTransferApp(QMainWindow):
 
                 if not self.is_corrupt(data, received_checksum) and seq_num == expected_seq_num:
                     f.write(data)
-                    received_size += len(data)
-                    progress = min(100, int((received_size / expected_size) * 100))
-                    self.update_progress.emit(progress)
-                    self.update_fsm.emit("RECEIVING")
+                    digest.update(data)
+                    self.received_size += len(data)  # Picked up by the next frame, no signal per packet
                     print(f"Packet {seq_num} received correctly, sending ACK {seq_num}")
                     ack_packet = struct.pack("!B", seq_num)  # Send ACK for the received packet
                     expected_seq_num = 1 - expected_seq_num  # Flip sequence number
                     last_ack = ack_packet  # Update last ACK
                 else:
+                    self.retransmissions += 1  # Corrupt or duplicate means the sender had to resend
                     print(f"Corrupt packet or unexpected sequence number! Resending last ACK {last_ack.hex()}")
 
                 sock.sendto(last_ack, addr)
-        sock.close()  # Close socket after transmission is complete
+                last_ack_time = time.perf_counter()
+        self.update_fsm.emit("COMPLETED")  # One queued signal for the whole transfer
+        linger(sock, eof_ack)  # GUI already shows COMPLETED meanwhile
+        sock.close()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,290 @@
+import argparse
+import contextlib
+import hashlib
+import itertools
+import math
+import mmap
+import os
+import struct
+import sys
+
+from receiver import bind
+from stream import IncompleteTransfer, receive, send_bytes, send_stream
+
+#rsync-style delta transfer over the pipelined transport. Three transfers make one update:
+#
+#   sender  -- request (port to answer on) ------------------------------>  receiver
+#   sender  <-- signatures of the receiver's copy, block by block --------  receiver
+#   sender  -- COPY block runs the receiver already has + LITERAL data -->  receiver
+#
+#The receiver rebuilds the new file next to the old one and only replaces it once the length and
+#SHA-256 in the delta header match, so a failed update leaves the old copy untouched.
+
+MOD = 1 << 16  # rsync's weak checksum keeps both halves mod 2^16
+BLOCK_MIN = 2048
+BLOCK_MAX = 64 * 1024
+STRONG_SIZE = 16  # BLAKE2b digest bytes per block, only checked when the weak checksum matches
+LITERAL_MAX = 1024 * 1024  # Longest LITERAL op, a long unmatched stretch is split
+COPY_CHUNK = 1024 * 1024  # Bytes copied from the old file per write
+
+REQUEST = struct.Struct("!4sH")  # magic, port the sender waits for signatures on
+SIGNATURE_HEADER = struct.Struct("!4sIQ")  # magic, block size, blocks
+SIGNATURE = struct.Struct(f"!I{STRONG_SIZE}s")  # weak checksum, strong hash
+DELTA_HEADER = struct.Struct("!4sIQ32s")  # magic, block size, new file length, SHA-256 of the new file
+COPY = struct.Struct("!cII")  # b"C", first block, blocks in the run
+LITERAL = struct.Struct("!cI")  # b"L", length, then that many bytes
+REQUEST_MAGIC = b"RDTQ"
+SIGNATURE_MAGIC = b"RDTS"
+DELTA_MAGIC = b"RDTD"
+
+def block_size_for(length):
+    #About sqrt(length) like rsync, as a power of two between BLOCK_MIN and BLOCK_MAX
+    size = 1 << max(0, int(math.sqrt(length)) - 1).bit_length()
+    return max(BLOCK_MIN, min(BLOCK_MAX, size))
+
+def weak_checksum(block):
+    #a = sum of bytes, b = sum of (len - i) * byte_i, which is the sum of the running sums of a
+    a = sum(block) % MOD
+    b = sum(itertools.accumulate(block)) % MOD
+    return a, b
+
+def strong_hash(block):
+    return hashlib.blake2b(block, digest_size=STRONG_SIZE).digest()
+
+def mapped(f):
+    #Whole-file view without reading it into memory, mmap refuses empty files
+    if os.fstat(f.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def signature_stream(data, block_size):
+    """Yields the signature message for data: header, then (weak, strong) per full block."""
+    blocks = len(data) // block_size  # A short tail block is left to be sent as literal data
+    yield SIGNATURE_HEADER.pack(SIGNATURE_MAGIC, block_size, blocks)
+    for index in range(blocks):
+        block = data[index * block_size:(index + 1) * block_size]
+        a, b = weak_checksum(block)
+        yield SIGNATURE.pack((b << 16) | a, strong_hash(block))
+
+def parse_signatures(message):
+    magic, block_size, blocks = SIGNATURE_HEADER.unpack_from(message)
+    if magic != SIGNATURE_MAGIC or len(message) != SIGNATURE_HEADER.size + blocks * SIGNATURE.size:
+        raise ValueError("malformed signature message")
+    index = {}  # weak -> [(block, strong)], collisions on the weak checksum are expected
+    for block, (weak, strong) in enumerate(SIGNATURE.iter_unpack(memoryview(message)[SIGNATURE_HEADER.size:])):
+        index.setdefault(weak, []).append((block, strong))
+    return block_size, index
+
+class DeltaEncoder:
+    """COPY/LITERAL ops that turn the receiver's copy into data, found with a rolling checksum."""
+
+    def __init__(self, data, block_size, index):
+        self.data = data
+        self.block_size = block_size
+        self.index = index
+        self.copied = 0  # Bytes the receiver takes from its old copy
+        self.literal = 0  # Bytes sent as they are
+
+    def ops(self):
+        data, size, index = self.data, self.block_size, self.index
+        end = len(data)
+        run = None  # [first block, count] of the COPY run being built
+        literal_start = pos = 0
+        a = b = None
+        while pos + size <= end:
+            if a is None:
+                a, b = weak_checksum(data[pos:pos + size])
+            match = None
+            candidates = index.get((b << 16) | a)
+            if candidates:
+                strong = strong_hash(data[pos:pos + size])
+                match = next((block for block, digest in candidates if digest == strong), None)
+            if match is None:
+                # Roll the window one byte: drop data[pos], take in data[pos + size]
+                if pos + size < end:
+                    out, new = data[pos], data[pos + size]
+                    a = (a - out + new) % MOD
+                    b = (b - size * out + a) % MOD
+                pos += 1
+                continue
+            if pos > literal_start:
+                yield from self.flush(run)
+                run = None
+                yield from self.literal_ops(literal_start, pos)
+            if run and run[0] + run[1] == match:
+                run[1] += 1
+            else:
+                yield from self.flush(run)
+                run = [match, 1]
+            pos += size
+            literal_start = pos
+            a = None
+        yield from self.flush(run)
+        yield from self.literal_ops(literal_start, end)
+
+    def flush(self, run):
+        if run:
+            self.copied += run[1] * self.block_size
+            yield COPY.pack(b"C", run[0], run[1])
+
+    def literal_ops(self, start, end):
+        for offset in range(start, end, LITERAL_MAX):
+            chunk = self.data[offset:min(end, offset + LITERAL_MAX)]
+            self.literal += len(chunk)
+            yield LITERAL.pack(b"L", len(chunk))
+            yield chunk
+
+class Patcher:
+    """Rebuilds the new file from the old copy and the delta, fed in chunks of any size."""
+
+    def __init__(self, old, out):
+        self.old = old
+        self.out = out
+        self.buffer = bytearray()
+        self.header = None  # (block size, length, digest) once read
+        self.remaining = 0  # Bytes of the current LITERAL still to come
+        self.digest = hashlib.sha256()
+        self.written = 0
+        self.copied = 0
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        while True:
+            if self.remaining:
+                if not self.buffer:
+                    return
+                take = bytes(self.buffer[:self.remaining])
+                del self.buffer[:len(take)]
+                self.remaining -= len(take)
+                self.write(take)
+            elif self.header is None:
+                if len(self.buffer) < DELTA_HEADER.size:
+                    return
+                magic, block_size, length, digest = DELTA_HEADER.unpack_from(self.buffer)
+                if magic != DELTA_MAGIC:
+                    raise ValueError("not a delta stream")
+                self.header = (block_size, length, digest)
+                del self.buffer[:DELTA_HEADER.size]
+            elif self.buffer[:1] == b"C":
+                if len(self.buffer) < COPY.size:
+                    return
+                _, first, count = COPY.unpack_from(self.buffer)
+                del self.buffer[:COPY.size]
+                self.copy(first * self.header[0], count * self.header[0])
+            elif self.buffer[:1] == b"L":
+                if len(self.buffer) < LITERAL.size:
+                    return
+                _, self.remaining = LITERAL.unpack_from(self.buffer)
+                del self.buffer[:LITERAL.size]
+            elif self.buffer:
+                raise ValueError(f"unknown delta op {bytes(self.buffer[:1])!r}")
+            else:
+                return
+
+    def copy(self, start, length):
+        if start + length > len(self.old):
+            raise ValueError("COPY beyond the end of the old file")
+        for offset in range(start, start + length, COPY_CHUNK):
+            self.write(self.old[offset:min(start + length, offset + COPY_CHUNK)])
+        self.copied += length
+
+    def write(self, data):
+        self.out.write(data)
+        self.digest.update(data)
+        self.written += len(data)
+
+    def matches(self):
+        #The rebuilt file has the length and digest the sender announced
+        return (self.header is not None and not self.remaining and not self.buffer
+                and self.written == self.header[1] and self.digest.digest() == self.header[2])
+
+def send_delta(path, addr):
+    """Update the receiver's copy at addr to match path, sending only what it lacks.
+
+    Returns the DeltaEncoder, whose copied/literal counts show how much was saved.
+    """
+    listen, _ = bind(("0.0.0.0", 0))
+    try:
+        request = send_bytes(REQUEST.pack(REQUEST_MAGIC, listen.getsockname()[1]), addr)
+        if not request.confirmed:
+            raise IncompleteTransfer("receiver did not confirm the delta request")
+        message = bytearray()
+        signatures = receive(message.extend, None, listen)
+        if not signatures.complete:
+            raise IncompleteTransfer("signatures arrived incomplete")
+    finally:
+        listen.close()
+    block_size, index = parse_signatures(message)
+
+    with open(path, "rb") as f:
+        data = mapped(f)
+        header = DELTA_HEADER.pack(DELTA_MAGIC, block_size, len(data), hashlib.sha256(data).digest())
+        encoder = DeltaEncoder(data, block_size, index)
+        sender = send_stream(itertools.chain([header], encoder.ops()), addr)
+    if not sender.confirmed:
+        raise IncompleteTransfer("receiver could not confirm the delta")
+    return encoder
+
+def receive_delta(path, addr, sock=None):
+    """Serve one delta update of path on addr, replacing path only if the result checks out.
+
+    A missing path counts as empty, so the first update is a plain transfer. Returns the Patcher.
+    """
+    own_socket = sock is None
+    if own_socket:
+        sock, _ = bind(addr)
+    try:
+        message = bytearray()
+        request = receive(message.extend, addr, sock)
+        magic, port = REQUEST.unpack(message)
+        if magic != REQUEST_MAGIC or not request.complete:
+            raise ValueError("expected a delta request")
+
+        with contextlib.ExitStack() as stack:
+            old = b""
+            if os.path.exists(path):
+                old = mapped(stack.enter_context(open(path, "rb")))
+            answer = send_stream(signature_stream(old, block_size_for(len(old))), (request.peer[0], port))
+            if not answer.confirmed:
+                raise IncompleteTransfer("sender did not confirm the signatures")
+
+            part = path + ".part"
+            with open(part, "wb") as out:
+                patcher = Patcher(old, out)
+                update = receive(patcher.feed, addr, sock)
+        if not (update.complete and patcher.matches()):
+            os.remove(part)
+            raise IncompleteTransfer("rebuilt file does not match the sender's length or digest")
+        os.replace(part, path)
+        return patcher
+    finally:
+        if own_socket:
+            sock.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update a remote copy of a file by sending only the changes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    send = commands.add_parser("send")
+    send.add_argument("path")
+    send.add_argument("host")
+    send.add_argument("port", type=int)
+    recv = commands.add_parser("recv")
+    recv.add_argument("path")
+    recv.add_argument("port", type=int)
+    recv.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "send":
+            encoder = send_delta(args.path, (args.host, args.port))
+            print(f"Sent {encoder.literal} literal bytes, receiver copied {encoder.copied} bytes it already had")
+        else:
+            patcher = receive_delta(args.path, (args.host, args.port))
+            print(f"Rebuilt {args.path}: {patcher.written} bytes, {patcher.copied} copied from the old version")
+    except IncompleteTransfer as e:
+        print(e)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import argparse
+import contextlib
+import io
+import socket
+import sys
+import threading
+import time
+
+import multicast
+from packet_cache import PacketCache, cache_key, prepare
+from sender import PipelinedSender
+
+#One file to many receivers without re-reading and re-checksumming it per receiver. The file is
+#framed once into shared packets; over unicast every receiver still gets its own PipelinedSender
+#(window, RTT, retransmissions, FIN), all of them handing out the same packet objects through a
+#private packet cache. --multicast sends the packets once to a group instead, see multicast.py.
+
+class FanOutSender:
+    """Sends one file to several pipelined receivers, packetized once for all of them."""
+
+    def __init__(self, addrs):
+        self.cache = PacketCache(budget=float("inf"))  # Only ever holds the one file being sent
+        self.senders = [PipelinedSender(socket.socket(socket.AF_INET, socket.SOCK_DGRAM), addr, cache=self.cache)
+                        for addr in addrs]
+
+    def send(self, path):
+        """Returns {receiver address: confirmed} once every receiver has answered its FIN."""
+        # Probe every path first, the shared packets have to fit the smallest of them
+        size = min(sender.probe_packet_size() for sender in self.senders)
+        for sender in self.senders:
+            sender.packet_size = size
+            sender.buffers = sender.size_buffers()
+        with open(path, "rb") as f:
+            self.cache.put(cache_key(f, size), prepare(f, size))
+
+        threads = [threading.Thread(target=self.send_one, args=(sender, path)) for sender in self.senders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for sender in self.senders:
+            sender.sock.close()
+        return {sender.addr: sender.confirmed for sender in self.senders}
+
+    def send_one(self, sender, path):
+        with open(path, "rb") as f:
+            sender.send(f)
+
+    def stats(self):
+        return [{"receiver": f"{host}:{port}", "confirmed": sender.confirmed, "cache_hit": sender.cache_hit,
+                 "retransmissions": sender.retransmissions} for sender in self.senders
+                for host, port in [sender.addr]]
+
+def parse_addr(text):
+    host, _, port = text.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send one file to many receivers, packetized once.")
+    parser.add_argument("path")
+    parser.add_argument("receivers", nargs="*", type=parse_addr, help="HOST:PORT of each pipelined receiver")
+    parser.add_argument("--multicast", action="store_true", help="send once to a group, receivers run multicast.py")
+    parser.add_argument("--expect", type=int, default=None,
+                        help="multicast receivers to wait for, otherwise stop once NAKs go quiet")
+    parser.add_argument("--group", default=multicast.GROUP)
+    parser.add_argument("--port", type=int, default=multicast.PORT)
+    parser.add_argument("--interface", default=multicast.INTERFACE)
+    parser.add_argument("--rate", type=float, default=multicast.RATE, help="multicast bytes per second")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    if args.multicast:
+        with open(args.path, "rb") as f:
+            prepared = prepare(f, multicast.PACKET_SIZE)
+        sender = multicast.MulticastSender(args.group, args.port, args.interface, args.rate)
+        done = sender.send(prepared, args.expect)
+        stats = sender.stats()
+        print(f"Execution time: {time.time() - start:.4f} seconds")
+        print(f"{stats['confirmed']}/{stats['receivers_done']} receivers confirmed, {stats['naks']} NAKs, "
+              f"{stats['repairs']} repairs ({stats['held_off']} held off as duplicates)")
+        return 0 if done and all(done.values()) and (args.expect is None or len(done) >= args.expect) else 1
+
+    if not args.receivers:
+        parser.error("give at least one HOST:PORT, or --multicast")
+    fanout = FanOutSender(args.receivers)
+    with contextlib.redirect_stdout(io.StringIO()):  # One line per receiver below instead of their progress
+        confirmed = fanout.send(args.path)
+    print(f"Execution time: {time.time() - start:.4f} seconds")
+    for row in fanout.stats():
+        print(f"{row['receiver']}: {'confirmed' if row['confirmed'] else 'NOT confirmed'}, "
+              f"{row['retransmissions']} retransmissions, packets {'shared' if row['cache_hit'] else 'framed again'}")
+    return 0 if all(confirmed.values()) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import multiprocessing
+import os
+import queue
+import select
+import socket
+import time
+
+import receiver
+from pipeline import BATCH_SIZE, Stage
+from receiver import PipelinedReceiver, receive_buffer_size
+from pacing import size_buffers, udp_counters, counter_delta, report_drops
+from pmtu import MAX_DATAGRAM
+
+#Receiver launcher that scales across cores: N worker processes bind the same port with
+#SO_REUSEPORT and the kernel hashes every sender's flow (address/port 4-tuple) to one of them.
+#A worker can get several senders, so it keeps one PipelinedReceiver per sender address.
+
+UDP_IP = "127.0.0.1"
+UDP_PORT = 5005
+ERROR_RATE = 0.0  # Handed to every worker's receiver stages
+WORKERS = os.cpu_count() or 1
+FLOWS = 0  # Transfers to wait for before shutting down, 0 runs until Ctrl-C
+
+errors = 0
+pipeline_stats = {}
+
+def reuseport_socket(ip, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((ip, port))
+    size_buffers(sock, receive_buffer_size(), send=False)
+    sock.setblocking(False)
+    return sock
+
+def output_name(addr):
+    #One file per sender, the source port tells concurrent senders on one host apart
+    return f"received_{addr[0]}_{addr[1]}.jpg"
+
+def worker(index, ip, port, stop, results):
+    """Serve every flow the kernel hands this process until stop is set."""
+    sock = reuseport_socket(ip, port)
+    stage = Stage("reader")
+    flows = {}  # addr -> (PipelinedReceiver, file)
+    finished = {}  # addr -> FIN_ACK/FIN_NAK as sent, repeated for FINs whose answer got lost
+    buffer = bytearray(MAX_DATAGRAM)
+    view = memoryview(buffer)
+    results.put(("ready", index, None))
+    while not stop.is_set():
+        readable, _, _ = select.select([sock], [], [], 0.05)
+        if readable:
+            start = time.perf_counter()
+            batches = {}
+            count = 0
+            while count < BATCH_SIZE:
+                try:
+                    size, addr = sock.recvfrom_into(buffer)
+                except BlockingIOError:
+                    break
+                batches.setdefault(addr, []).append(view[:size].tobytes())
+                count += 1
+            for addr, batch in batches.items():
+                if addr in finished:
+                    finished[addr].answer_late(batch, addr)
+                    continue
+                if addr not in flows:
+                    f = open(output_name(addr), "wb")
+                    flow = PipelinedReceiver(sock, f)
+                    flow.start()
+                    flows[addr] = (flow, f)
+                flows[addr][0].verified.put((addr, start, batch))
+            if count:
+                stage.done(start, count)
+
+        for addr, (flow, f) in list(flows.items()):
+            if flow.stopped.is_set():
+                flow.verified.put(None)
+                flow.join()
+                f.close()
+                del flows[addr]
+                finished[addr] = flow  # Answers the sender's duplicate FINs, or repeats its ABORT, from now on
+                results.put(("flow", index, (addr, flow.summary())))
+
+    for flow, f in flows.values():  # Shut down mid-transfer, keep what arrived
+        flow.verified.put(None)
+        flow.join()
+        f.close()
+    stage.finish()
+    sock.close()
+    results.put(("worker", index, {"packets": stage.items, "batches": stage.batches,
+                                   "utilization": stage.utilization()}))
+
+def merge(flows, workers):
+    """Fold per-flow summaries into per-worker rows and one total row."""
+    rows = {index: {"flows": 0, "bytes": 0, "corrupt": 0, "duplicates": 0, "ack_total": 0.0,
+                    "ack_count": 0, "ack_max": 0.0, "storage_max": 0.0, "disk_writes": 0}
+            for index in workers}
+    for index, (_, summary) in flows:
+        row = rows[index]
+        row["flows"] += 1
+        row["bytes"] += summary["bytes"]
+        row["corrupt"] += summary["corrupt"]
+        row["duplicates"] += summary["duplicates"]
+        row["ack_total"] += summary["ack_latency_total"]
+        row["ack_count"] += summary["ack_latency_count"]
+        row["ack_max"] = max(row["ack_max"], summary["ack_latency_max"])
+        row["storage_max"] = max(row["storage_max"], summary["writer"]["storage_latency_max"])
+        row["disk_writes"] += summary["writer"]["writes"]
+    total = {key: sum(row[key] for row in rows.values()) for key in
+             ("flows", "bytes", "corrupt", "duplicates", "ack_total", "ack_count", "disk_writes")}
+    total["ack_max"] = max((row["ack_max"] for row in rows.values()), default=0.0)
+    total["storage_max"] = max((row["storage_max"] for row in rows.values()), default=0.0)
+    for index, info in workers.items():
+        rows[index].update(info)
+    total["packets"] = sum(info["packets"] for info in workers.values())
+    return rows, total
+
+def report(rows, total, elapsed):
+    print(f"{'worker':<8}{'flows':>6}{'packets':>9}{'bytes':>11}{'corrupt':>9}{'dups':>6}"
+          f"{'reader':>8}{'ack avg':>10}{'ack max':>10}")
+    for index, row in sorted(rows.items()) + [("total", total)]:
+        ack_avg = row["ack_total"] / row["ack_count"] if row["ack_count"] else 0.0
+        utilization = f"{row['utilization']:.0%}" if "utilization" in row else ""
+        print(f"{index:<8}{row['flows']:>6}{row['packets']:>9}{row['bytes']:>11}{row['corrupt']:>9}"
+              f"{row['duplicates']:>6}{utilization:>8}{ack_avg * 1000:>8.3f}ms{row['ack_max'] * 1000:>8.3f}ms")
+    if elapsed > 0:
+        print(f"Aggregate goodput: {total['bytes'] / elapsed / 1e6:.2f} MB/s over {elapsed:.4f} seconds")
+
+def main():
+    global errors, pipeline_stats
+    receiver.ERROR_RATE = ERROR_RATE
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise SystemExit("SO_REUSEPORT is not available on this platform")
+    context = multiprocessing.get_context("fork")  # Workers inherit ERROR_RATE and the other globals
+    counters = udp_counters()
+    stop = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(index, UDP_IP, UDP_PORT, stop, results), daemon=True)
+                 for index in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        results.get()  # Every worker is bound before senders are told to go
+    print(f"{WORKERS} workers waiting for packets on port {UDP_PORT}...")
+
+    flows = []
+    try:
+        while not FLOWS or len(flows) < FLOWS:
+            try:
+                kind, index, payload = results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if kind == "flow":
+                flows.append((index, payload))
+                if payload[1]["error"]:
+                    state = f"ABORTED ({payload[1]['error']})"
+                else:
+                    state = "complete" if payload[1]["complete"] else "length/digest MISMATCH"
+                print(f"Worker {index} finished {payload[0]}: {payload[1]['bytes']} bytes, {state}")
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+
+    workers = {}
+    while len(workers) < len(processes):
+        kind, index, payload = results.get()
+        if kind == "flow":
+            flows.append((index, payload))
+        elif kind == "worker":
+            workers[index] = payload
+    for process in processes:
+        process.join()
+
+    rows, total = merge(flows, workers)
+    errors = total["corrupt"]
+    pipeline_stats = {"workers": rows, "total": total, "kernel_drops": counter_delta(counters, udp_counters())}
+    report(rows, total, elapsed(flows))
+    report_drops(pipeline_stats["kernel_drops"])
+    print("Receiver shutting down.")
+
+def elapsed(flows):
+    #First packet of any flow to the last FIN, the flows overlap so summing them would overcount
+    spans = [(summary["started"], summary["finished"]) for _, (_, summary) in flows if summary["started"]]
+    if not spans:
+        return 0.0
+    return max(end for _, end in spans) - min(start for start, _ in spans)
+
+if __name__ == "__main__":
+    error_input = int(input("Enter error rate (0 to 60): "))
+    ERROR_RATE = error_input / 100
+    WORKERS = int(input(f"Enter number of worker processes (default {WORKERS}): ") or WORKERS)
+    FLOWS = int(input("Enter number of transfers to wait for (0 runs until Ctrl-C): ") or 0)
+    main()
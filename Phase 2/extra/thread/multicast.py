@@ -0,0 +1,327 @@
+import argparse
+import hashlib
+import random
+import select
+import socket
+import struct
+import sys
+import time
+
+from pacing import TokenBucket, size_buffers
+from protocol import DATA, FIN, NAK, DONE, HEADER, RANGE, make_packet, parse_packet
+
+#One-to-many over IP multicast. The sender sends every packet once to the group and then repeats
+#a FIN (length + digest); receivers never ACK, they NAK the byte ranges they are missing and the
+#sender multicasts the repairs, so one repair serves every receiver that lost the same packet.
+#
+#NAKs go to the group as well (on PORT + 1) and every receiver listens to them. Before NAKing a
+#gap a receiver waits a random NAK_DELAY; if another receiver's NAK for the same range is heard
+#meanwhile its own is suppressed (SRM-style), so a loss shared by many receivers costs one NAK
+#instead of one per receiver. A receiver with the whole file and a matching digest answers the
+#FIN with a unicast DONE, which is how the sender knows when to stop.
+
+GROUP = "239.255.42.99"  # Administratively scoped, never leaves the site
+PORT = 5006  # DATA, repairs and FIN go to PORT, NAKs to PORT + 1
+INTERFACE = "127.0.0.1"  # Interface the group is joined and sent on, loopback carries multicast fine
+TTL = 1  # Stay on the local network
+PACKET_SIZE = 1024  # No size probing here, a probe would have to reach every member
+RATE = 20 * 1024 * 1024  # Bytes per second; with no ACK clock pacing is the only congestion control
+NAK_DELAY = (0.005, 0.03)  # Random wait before NAKing a gap, a NAK heard meanwhile suppresses ours
+REPAIR_WAIT = 0.1  # Seconds a NAKed range gets to be repaired before it is NAKed again
+REPAIR_HOLDOFF = 0.02  # The sender ignores NAKs for a packet it repaired this recently
+MAX_RANGES = 64  # Gaps per NAK, the rest wait for the next one
+POLL_EVERY = 16  # Packets sent between checks for NAKs during the first pass
+FIN_INTERVAL = 0.1
+QUIET = 1.0  # Without a receiver count the sender stops after this long with no NAKs after the FIN
+TIMEOUT = 60.0  # Give up on receivers that never finish
+LINGER = 0.5  # Receiver keeps answering FINs with DONE this long after the last one
+RECEIVE_BUFFER = 4 * 1024 * 1024  # SO_RCVBUF of a member, a slow one overflows it and NAKs the difference
+ERROR_RATE = 0.0  # Fraction (0 to 1) of incoming DATA a receiver drops on purpose, for testing repairs
+
+def membership(group, interface):
+    return struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton(interface))
+
+def group_socket(group, port, interface):
+    #Bound to the group so only its traffic arrives, shareable with other members on this host
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((group, port))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership(group, interface))
+    size_buffers(sock, RECEIVE_BUFFER, send=False)
+    sock.setblocking(False)
+    return sock
+
+def sending_socket(interface, ttl=TTL):
+    #Own unicast port, so DONEs can find the sender and NAKs/DONEs can tell receivers apart
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)  # Members on this host hear it too
+    sock.bind(("", 0))
+    sock.setblocking(False)
+    return sock
+
+def drain(sock):
+    #Everything queued on a non-blocking socket right now
+    while True:
+        try:
+            yield sock.recvfrom(65535)
+        except BlockingIOError:
+            return
+
+def uncovered(start, end, heard):
+    #Parts of [start, end) no recent NAK asked for, heard sorted by start
+    pieces = []
+    for low, high, _ in heard:
+        if high <= start or low >= end:
+            continue
+        if low > start:
+            pieces.append((start, low))
+        start = max(start, high)
+        if start >= end:
+            return pieces
+    pieces.append((start, end))
+    return pieces
+
+class MulticastSender:
+    """Sends one PreparedFile to the group and repairs whatever the receivers NAK."""
+
+    def __init__(self, group=GROUP, port=PORT, interface=INTERFACE, rate=RATE):
+        self.group = (group, port)
+        self.sock = sending_socket(interface)
+        self.control = group_socket(group, port + 1, interface)
+        self.pacer = TokenBucket(rate)
+        self.prepared = None
+        self.repaired = {}  # Packet index -> when it was last repaired
+        self.done = {}  # Receiver address -> whether its digest matched
+        self.last_nak = None
+        self.naks = 0
+        self.repairs = 0
+        self.held_off = 0  # Repairs skipped because the packet had just been repaired
+        self.fins = 0
+
+    def send(self, prepared, receivers=None, timeout=TIMEOUT):
+        """Send prepared, then FIN until `receivers` have confirmed (or QUIET passes with no NAKs).
+
+        Returns {receiver address: digest matched} for every receiver that sent a DONE.
+        """
+        self.prepared = prepared
+        for index, packet in enumerate(prepared.packets):
+            self.transmit(packet)
+            if index % POLL_EVERY == POLL_EVERY - 1:
+                self.serve(0)
+        total = sum(len(packet) - HEADER.size for packet in prepared.packets)
+        fin = make_packet(FIN, total, prepared.digest)
+        start = time.perf_counter()
+        next_fin = start
+        while True:
+            now = time.perf_counter()
+            if receivers and len(self.done) >= receivers:
+                break
+            if not receivers and now - max(start, self.last_nak or start) >= QUIET:
+                break
+            if now - start >= timeout:
+                break
+            if now >= next_fin:
+                self.transmit(fin)
+                self.fins += 1
+                next_fin = now + FIN_INTERVAL
+            self.serve(max(0.0, next_fin - now))
+        self.sock.close()
+        self.control.close()
+        return self.done
+
+    def transmit(self, packet):
+        self.pacer.wait(len(packet))
+        while True:
+            try:
+                self.sock.sendto(packet, self.group)
+                return
+            except BlockingIOError:
+                select.select([], [self.sock], [], 1.0)
+
+    def serve(self, timeout):
+        readable, _, _ = select.select([self.control, self.sock], [], [], timeout)
+        if self.control in readable:
+            for packet, _ in drain(self.control):
+                parsed = parse_packet(packet)
+                if parsed and parsed[0] == NAK and len(parsed[2]) % RANGE.size == 0:
+                    self.repair(parsed[2])
+        if self.sock in readable:
+            for packet, addr in drain(self.sock):
+                parsed = parse_packet(packet)
+                if parsed and parsed[0] == DONE:
+                    self.done[addr] = parsed[2] == b"\x01"
+
+    def repair(self, ranges):
+        now = time.perf_counter()
+        self.naks += 1
+        self.last_nak = now
+        size = self.prepared.packet_size
+        count = len(self.prepared.packets)
+        for start, end in RANGE.iter_unpack(ranges):
+            for index in range(start // size, min(count, (end + size - 1) // size)):
+                if now - self.repaired.get(index, float("-inf")) < REPAIR_HOLDOFF:
+                    self.held_off += 1  # Other receivers' NAKs for the same loss, already on its way
+                    continue
+                self.transmit(self.prepared.packets[index])
+                self.repaired[index] = now
+                self.repairs += 1
+
+    def stats(self):
+        return {"receivers_done": len(self.done), "confirmed": sum(self.done.values()), "naks": self.naks,
+                "repairs": self.repairs, "held_off": self.held_off, "fins": self.fins,
+                "pacing_wait": self.pacer.waited}
+
+class MulticastReceiver:
+    """Joins the group, hands the data to callback in order and NAKs the gaps."""
+
+    def __init__(self, callback, group=GROUP, port=PORT, interface=INTERFACE, error_rate=ERROR_RATE):
+        self.callback = callback
+        self.data = group_socket(group, port, interface)
+        self.control = group_socket(group, port + 1, interface)
+        self.reply = sending_socket(interface)
+        self.nak_addr = (group, port + 1)
+        self.error_rate = error_rate
+        self.next_offset = 0
+        self.parked = {}  # Offset -> data past a gap
+        self.high = 0  # End of the furthest data seen
+        self.digest = hashlib.sha256()
+        self.total = None  # From the FIN
+        self.expected = None
+        self.sender = None  # Where DONEs go, the FIN's source address
+        self.complete = None  # Digest matched, once everything is in
+        self.heard = []  # (start, end, when) of recent NAKs, ours and everyone else's
+        self.nak_at = None
+        self.naks = 0
+        self.suppressed = 0  # NAK rounds where others had already asked for every gap
+        self.dropped = 0
+        self.corrupt = 0
+        self.duplicates = 0
+
+    def run(self):
+        last_fin = None
+        while True:
+            now = time.perf_counter()
+            if self.complete is not None and now - last_fin >= LINGER:
+                break
+            waits = [self.nak_at - now if self.nak_at else None,
+                     last_fin + LINGER - now if self.complete is not None else None]
+            waits = [max(0.0, wait) for wait in waits if wait is not None]
+            readable, _, _ = select.select([self.data, self.control], [], [], min(waits) if waits else None)
+            if self.data in readable:
+                for packet, addr in drain(self.data):
+                    if self.packet(packet, addr) == FIN:
+                        last_fin = time.perf_counter()
+            if self.control in readable:
+                for packet, _ in drain(self.control):
+                    parsed = parse_packet(packet)
+                    if parsed and parsed[0] == NAK and len(parsed[2]) % RANGE.size == 0:
+                        now = time.perf_counter()
+                        self.heard += [(start, end, now) for start, end in RANGE.iter_unpack(parsed[2])]
+            if self.nak_at and time.perf_counter() >= self.nak_at:
+                self.send_nak()
+        self.data.close()
+        self.control.close()
+        self.reply.close()
+        return self
+
+    def packet(self, packet, addr):
+        parsed = parse_packet(packet)
+        if parsed is None:
+            self.corrupt += 1
+            return None
+        kind, offset, data = parsed
+        if kind == DATA:
+            if self.error_rate and random.random() < self.error_rate:
+                self.dropped += 1
+                return kind
+            self.data_packet(offset, data)
+        elif kind == FIN:
+            self.sender = addr
+            self.total, self.expected = offset, data
+            if self.next_offset == self.total:
+                if self.complete is None:
+                    self.complete = self.digest.digest() == self.expected
+                self.reply.sendto(make_packet(DONE, self.total, b"\x01" if self.complete else b"\x00"), addr)
+        if self.complete is None and self.missing() and self.nak_at is None:
+            self.nak_at = time.perf_counter() + random.uniform(*NAK_DELAY)
+        return kind
+
+    def data_packet(self, offset, data):
+        self.high = max(self.high, offset + len(data))
+        if offset == self.next_offset:
+            self.deliver(data)
+            while self.next_offset in self.parked:
+                self.deliver(self.parked.pop(self.next_offset))
+        elif offset > self.next_offset and offset not in self.parked:
+            self.parked[offset] = data
+        else:
+            self.duplicates += 1
+
+    def deliver(self, data):
+        self.callback(data)
+        self.digest.update(data)
+        self.next_offset += len(data)
+
+    def missing(self):
+        return bool(self.parked) or (self.total is not None and self.next_offset < self.total)
+
+    def gaps(self):
+        end = self.total if self.total is not None else self.high
+        gaps = []
+        position = self.next_offset
+        for offset in sorted(self.parked):
+            if offset > position:
+                gaps.append((position, offset))
+            position = max(position, offset + len(self.parked[offset]))
+        if position < end:
+            gaps.append((position, end))
+        return gaps
+
+    def send_nak(self):
+        now = time.perf_counter()
+        self.nak_at = None
+        self.heard = sorted(entry for entry in self.heard if now - entry[2] < REPAIR_WAIT)
+        gaps = self.gaps()
+        wanted = [piece for start, end in gaps for piece in uncovered(start, end, self.heard)][:MAX_RANGES]
+        if wanted:
+            ranges = b"".join(RANGE.pack(start, end) for start, end in wanted)
+            self.reply.sendto(make_packet(NAK, self.next_offset, ranges), self.nak_addr)
+            self.heard += [(start, end, now) for start, end in wanted]
+            self.naks += 1
+        elif gaps:
+            self.suppressed += 1
+        if gaps:
+            # Look again once these NAKs expire, jittered so suppression keeps working next round
+            self.nak_at = now + REPAIR_WAIT + random.uniform(*NAK_DELAY)
+
+    def stats(self):
+        return {"bytes": self.next_offset, "complete": self.complete, "naks": self.naks,
+                "suppressed": self.suppressed, "dropped": self.dropped, "corrupt": self.corrupt,
+                "duplicates": self.duplicates}
+
+def receive_multicast(path, group=GROUP, port=PORT, interface=INTERFACE, error_rate=ERROR_RATE):
+    with open(path, "wb") as f:
+        return MulticastReceiver(f.write, group, port, interface, error_rate).run()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive one file sent to a multicast group by fanout.py --multicast.")
+    parser.add_argument("path")
+    parser.add_argument("--group", default=GROUP)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--interface", default=INTERFACE)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE * 100, help="percent of DATA to drop, for testing")
+    args = parser.parse_args(argv)
+
+    receiver = receive_multicast(args.path, args.group, args.port, args.interface, args.error_rate / 100)
+    stats = receiver.stats()
+    print(f"Received {stats['bytes']} bytes, {stats['naks']} NAKs sent, {stats['suppressed']} suppressed, "
+          f"{stats['dropped']} packets dropped on purpose")
+    if not receiver.complete:
+        print("Digest does not match the sender's!")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import socket
+import time
+
+#Keeps the pipelined sender from causing its own loss: a token bucket spaces datagrams at a target
+#rate, socket buffers are sized to hold a bandwidth-delay product, and the kernel's UDP drop
+#counters tell buffer overflows apart from loss on the path.
+
+PACING_BURST = 16 * 1024  # Bytes that may leave back-to-back after an idle period
+PATH_RTT = 0.01  # Worst round trip the buffers should cover, queueing included
+
+class TokenBucket:
+    """Rate limiter that lets a sender run into debt and then sleeps it off."""
+
+    def __init__(self, rate, burst=PACING_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.perf_counter()
+        self.waited = 0.0  # Seconds spent sleeping for tokens
+        self.waits = 0
+
+    def delay(self, size):
+        #Takes size bytes worth of tokens, returns how long to wait before sending them
+        now = time.perf_counter()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= size
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def wait(self, size):
+        if not self.rate:
+            return  # Pacing off
+        delay = self.delay(size)
+        if delay > 0:
+            start = time.perf_counter()
+            time.sleep(delay)  # Oversleeping refills the bucket, so the average rate still holds
+            self.waited += time.perf_counter() - start
+            self.waits += 1
+
+def bdp_bytes(rate, rtt=PATH_RTT, floor=0):
+    #Bytes in flight at rate over one round trip, never less than floor (e.g. a full window)
+    return max(int(rate * rtt), floor)
+
+def size_buffers(sock, size, send=True, receive=True):
+    """Ask for size-byte socket buffers and return what the kernel actually granted.
+
+    Linux doubles the request for bookkeeping and silently caps it at net.core.rmem_max/wmem_max,
+    so the granted values are read back rather than assumed.
+    """
+    granted = {}
+    for enabled, option, name in ((send, socket.SO_SNDBUF, "sndbuf"), (receive, socket.SO_RCVBUF, "rcvbuf")):
+        if not enabled:
+            continue
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+        except OSError:
+            pass  # Keep the default, the read-back shows what we got
+        granted[name] = sock.getsockopt(socket.SOL_SOCKET, option)
+    return granted
+
+def udp_counters():
+    #System-wide UDP counters from /proc/net/snmp, empty where the file does not exist
+    try:
+        with open("/proc/net/snmp") as f:
+            lines = [line.split() for line in f if line.startswith("Udp:")]
+    except OSError:
+        return {}
+    if len(lines) < 2:
+        return {}
+    names, values = lines[0][1:], lines[1][1:]
+    return dict(zip(names, map(int, values)))
+
+def counter_delta(before, after, names=("RcvbufErrors", "SndbufErrors", "InErrors")):
+    return {name: after[name] - before[name] for name in names if name in before and name in after}
+
+def report_drops(delta):
+    """Print kernel-side drops; these are buffer overflows on this host, not loss on the path."""
+    if not delta:
+        print("Kernel UDP counters unavailable on this platform")
+        return
+    print("Kernel UDP drops (all sockets on this host): " +
+          ", ".join(f"{name} {value}" for name, value in delta.items()))
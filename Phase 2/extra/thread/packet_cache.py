@@ -0,0 +1,202 @@
+import hashlib
+import os
+import stat
+import struct
+import threading
+from collections import OrderedDict
+
+from protocol import DATA, HEADER, make_packet
+
+#Prepared packets for files that get sent again. A send already computes every packet checksum
+#and the file's SHA-256, so it leaves them behind keyed by (path, size, mtime, inode, packet size);
+#the next send of the unchanged file frames its packets from the cache instead of checksumming.
+#The memory cache also keeps the framed packets themselves while they fit in the budget, the disk
+#cache only the checksums and digest (2 bytes per packet) so separate processes can share them.
+
+BUDGET = 64 * 1024 * 1024  # Bytes of prepared data kept before the least recently used file goes
+CHECKSUM = slice(HEADER.size - 2, HEADER.size)  # Where the checksum sits in a framed packet
+ENTRY = struct.Struct("!4sI32sI")  # magic, packet size, SHA-256 of the file, key length
+MAGIC = b"RDTC"
+SUFFIX = ".pkt"
+
+def cache_key(f, packet_size):
+    #None for pipes, sockets and anything else that is not a named regular file
+    path = getattr(f, "name", None)
+    if not isinstance(path, str):
+        return None
+    try:
+        st = os.fstat(f.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return (os.path.realpath(path), st.st_size, st.st_mtime_ns, st.st_ino, packet_size)
+
+class PreparedFile:
+    """Checksums of one file cut into packet_size packets, its digest, maybe the framed packets."""
+
+    def __init__(self, packet_size, checksums, digest, packets=None):
+        self.packet_size = packet_size
+        self.checksums = checksums
+        self.digest = digest
+        self.packets = packets
+
+    def checksum(self, index):
+        return self.checksums[2 * index:2 * index + 2]
+
+    @property
+    def nbytes(self):
+        return len(self.checksums) + len(self.digest) + sum(map(len, self.packets or ()))
+
+class Recorder:
+    """Collects the checksums (and packets) of a send as they are framed, for PacketCache.put."""
+
+    def __init__(self, packet_size, packet_budget):
+        self.packet_size = packet_size
+        self.packet_budget = packet_budget
+        self.checksums = bytearray()
+        self.packets = [] if packet_budget > 0 else None
+        self.packet_bytes = 0
+        self.valid = True  # Offsets are index * packet_size, so only the last packet may be short
+        self.short = False
+
+    def add(self, packet, length):
+        if not self.valid:
+            return
+        if length != self.packet_size:
+            if self.short or length > self.packet_size:
+                self.valid = False  # Resized mid-file, the cache has no way to describe that
+                return
+            self.short = True
+        self.checksums += packet[CHECKSUM]
+        if self.packets is not None:
+            self.packets.append(packet)
+            self.packet_bytes += len(packet)
+            if self.packet_bytes > self.packet_budget:
+                self.packets = None
+
+    def prepared(self, digest):
+        if not self.valid:
+            return None
+        return PreparedFile(self.packet_size, bytes(self.checksums), digest, self.packets)
+
+class PacketCache:
+    """LRU of PreparedFiles under a byte budget, in memory or in a directory shared between runs."""
+
+    def __init__(self, budget=BUDGET, directory=None):
+        self.budget = budget
+        self.directory = directory
+        self.entries = OrderedDict()  # key -> PreparedFile, least recently used first
+        self.used = 0
+        self.lock = threading.Lock()  # Several senders may share one cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def recorder(self, packet_size):
+        #Framed packets only make sense in memory, a disk entry would just be a second copy of the file
+        return Recorder(packet_size, 0 if self.directory else self.budget)
+
+    def get(self, key):
+        with self.lock:
+            prepared = self.load(key) if self.directory else self.entries.get(key)
+            if prepared is None:
+                self.misses += 1
+                return None
+            if not self.directory:
+                self.entries.move_to_end(key)
+            self.hits += 1
+            return prepared
+
+    def put(self, key, prepared):
+        if prepared is None or prepared.nbytes > self.budget:
+            return
+        with self.lock:
+            if self.directory:
+                self.store(key, prepared)
+                self.evict_files()
+                return
+            if key in self.entries:
+                self.used -= self.entries.pop(key).nbytes
+            self.entries[key] = prepared
+            self.used += prepared.nbytes
+            while self.used > self.budget:
+                _, evicted = self.entries.popitem(last=False)
+                self.used -= evicted.nbytes
+                self.evictions += 1
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest()[:32] + SUFFIX)
+
+    def load(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < ENTRY.size:
+            return None
+        magic, packet_size, digest, key_length = ENTRY.unpack_from(data)
+        end = ENTRY.size + key_length
+        if magic != MAGIC or data[ENTRY.size:end] != repr(key).encode():
+            return None  # Torn write or a hash collision, treat as a miss
+        os.utime(path)  # The modification time is the LRU order on disk
+        return PreparedFile(packet_size, data[end:], digest)
+
+    def store(self, key, prepared):
+        #Written next to the final name and renamed, so a concurrent reader never sees half an entry
+        path = self.path(key)
+        encoded = repr(key).encode()
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temporary, "wb") as f:
+            f.write(ENTRY.pack(MAGIC, prepared.packet_size, prepared.digest, len(encoded)))
+            f.write(encoded)
+            f.write(prepared.checksums)
+        os.replace(temporary, path)
+
+    def evict_files(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        entries.sort()
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if used <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Another process evicted it first
+            used -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "directory": self.directory, "budget": self.budget}
+
+def prepare(f, packet_size):
+    """Frame all of f at packet_size in one pass, for senders that serve the same packets to many."""
+    digest = hashlib.sha256()
+    packets = []
+    offset = 0
+    while chunk := f.read(packet_size):
+        packets.append(make_packet(DATA, offset, chunk))
+        digest.update(chunk)
+        offset += len(chunk)
+    return PreparedFile(packet_size, b"".join(packet[CHECKSUM] for packet in packets), digest.digest(), packets)
+
+caches = {}
+
+def shared_cache(setting, budget=BUDGET):
+    """Process-wide cache for a setting of "memory" or a directory, None when setting is empty."""
+    if not setting:
+        return None
+    directory = None if setting == "memory" else setting
+    if (directory, budget) not in caches:
+        caches[directory, budget] = PacketCache(budget, directory)
+    return caches[directory, budget]
@@ -0,0 +1,90 @@
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from protocol import DATA, HEADER, packet_checksum
+
+#Parallel packetizer for large files: worker processes checksum whole byte ranges and leave the
+#2-byte checksums in one shared memory block, indexed by packet number. The sender only slices
+#the payload out of an mmap of the file and packs the header around the precomputed checksum.
+
+PARALLEL_THRESHOLD = 64 * 1024 * 1024  # Smaller files are packetized inline, process start-up costs more
+RANGE_BYTES = 4 * 1024 * 1024  # File bytes per task handed to a worker, whatever size the packets were probed at
+WORKERS = os.cpu_count() or 1
+
+def checksum_range(shm_name, path, first, count, packet_size):
+    """Checksum packets first..first+count of path into the shared block, runs in a worker."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        with open(path, "rb") as f:
+            f.seek(first * packet_size)
+            data = f.read(count * packet_size)
+        view = shm.buf
+        for i in range(0, len(data), packet_size):
+            index = first + i // packet_size
+            view[2 * index:2 * index + 2] = packet_checksum(DATA, index * packet_size, data[i:i + packet_size])
+        del view
+    finally:
+        shm.close()
+    return count
+
+class ParallelPacketizer:
+    """Yields batches of (offset, packet, length) in file order, checksums computed in a process pool."""
+
+    def __init__(self, path, packet_size, workers=WORKERS):
+        self.path = path
+        self.packet_size = packet_size
+        self.workers = workers
+        self.size = os.path.getsize(path)
+        self.packets = (self.size + packet_size - 1) // packet_size
+        self.range_packets = max(1, RANGE_BYTES // packet_size)
+
+    def batches(self, batch_size):
+        if not self.size:
+            return
+        # spawn, not fork: the sender already runs threads and forking those is unsafe
+        context = multiprocessing.get_context("spawn")
+        shm = shared_memory.SharedMemory(create=True, size=2 * self.packets)
+        try:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                    ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+                pending = deque()
+                ranges = iter(range(0, self.packets, self.range_packets))
+                # Keep a couple of ranges queued per worker, enough to hide the hand-off, few enough
+                # that a multi-GB file is not checksummed far ahead of the network
+                for first in ranges:
+                    pending.append((first, self.submit(pool, shm, first)))
+                    if len(pending) >= 2 * self.workers:
+                        break
+                while pending:
+                    first, future = pending.popleft()
+                    future.result()
+                    yield from self.frame(mm, shm.buf, first, batch_size)
+                    following = next(ranges, None)
+                    if following is not None:
+                        pending.append((following, self.submit(pool, shm, following)))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def submit(self, pool, shm, first):
+        count = min(self.range_packets, self.packets - first)
+        return pool.submit(checksum_range, shm.name, self.path, first, count, self.packet_size)
+
+    def frame(self, mm, checksums, first, batch_size):
+        #Header packing only, the checksum is already in shared memory
+        last = min(first + self.range_packets, self.packets)
+        batch = []
+        for index in range(first, last):
+            offset = index * self.packet_size
+            chunk = mm[offset:offset + self.packet_size]
+            batch.append((offset, HEADER.pack(DATA, offset, bytes(checksums[2 * index:2 * index + 2])) + chunk,
+                          len(chunk)))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -0,0 +1,109 @@
+import queue
+import time
+
+#Building blocks for the staged sender/receiver: bounded batch queues and per-stage accounting.
+#Stages hand each other lists of packets, not single packets, so queue locking is paid once per batch.
+
+BATCH_SIZE = 32  # Max packets per hand-off
+QUEUE_DEPTH = 64  # Max batches waiting between two stages, a full queue blocks the producer
+
+class Stage:
+    """Busy time and throughput of one pipeline thread."""
+
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.items = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+        self.stopped = None
+
+    def done(self, since, items=1):
+        #Call after handling a batch with the perf_counter() taken when work started
+        self.busy += time.perf_counter() - since
+        self.items += items
+        self.batches += 1
+
+    def finish(self):
+        self.stopped = time.perf_counter()
+
+    def utilization(self):
+        elapsed = (self.stopped or time.perf_counter()) - self.started
+        return self.busy / elapsed if elapsed > 0 else 0.0
+
+class BatchQueue:
+    """Bounded queue between two stages that samples its depth on every put."""
+
+    def __init__(self, name, maxsize=QUEUE_DEPTH):
+        self.name = name
+        self.queue = queue.Queue(maxsize)
+        self.maxsize = maxsize
+        self.puts = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.stalled = 0.0  # Seconds producers spent blocked on a full queue
+
+    def put(self, batch):
+        depth = self.queue.qsize()
+        self.puts += 1
+        self.depth_total += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if depth >= self.maxsize:
+            start = time.perf_counter()
+            self.queue.put(batch)  # Backpressure: wait for the consumer to catch up
+            self.stalled += time.perf_counter() - start
+        else:
+            self.queue.put(batch)
+
+    def get(self, timeout=None):
+        #Raises queue.Empty after timeout seconds
+        return self.queue.get(timeout=timeout)
+
+    def drain(self):
+        #Everything queued right now, without blocking
+        batches = []
+        try:
+            while True:
+                batches.append(self.queue.get_nowait())
+        except queue.Empty:
+            return batches
+
+    def average_depth(self):
+        return self.depth_total / self.puts if self.puts else 0.0
+
+class Latency:
+    """Count, mean and max of a latency measured in seconds."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+def report(stages, queues):
+    """Print how busy every stage was and how deep every queue got."""
+    print(f"{'stage':<12}{'items':>9}{'batches':>9}{'per batch':>11}{'busy':>8}")
+    for stage in stages:
+        per_batch = stage.items / stage.batches if stage.batches else 0
+        print(f"{stage.name:<12}{stage.items:>9}{stage.batches:>9}{per_batch:>11.1f}{stage.utilization():>8.0%}")
+    print(f"{'queue':<12}{'puts':>9}{'avg depth':>11}{'max':>6}{'stalled':>10}")
+    for q in queues:
+        print(f"{q.name:<12}{q.puts:>9}{q.average_depth():>11.1f}{q.max_depth:>6}{q.stalled:>9.3f}s")
+
+def stats(stages, queues):
+    #Same numbers as report() as a dict, for the runner/benchmark output
+    return {
+        "stages": {s.name: {"items": s.items, "batches": s.batches, "utilization": s.utilization()} for s in stages},
+        "queues": {q.name: {"puts": q.puts, "average_depth": q.average_depth(), "max_depth": q.max_depth,
+                            "stalled": q.stalled} for q in queues},
+    }
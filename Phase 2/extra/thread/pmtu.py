@@ -0,0 +1,36 @@
+import errno
+import socket
+import sys
+
+#Packet-size probing in the spirit of DPLPMTUD (RFC 8899): with the don't-fragment bit set, the
+#sender tries a few likely payload sizes from the largest down and keeps the first one the
+#receiver confirms. Oversized probes either fail locally with EMSGSIZE or are dropped on the way,
+#so a size that gets confirmed goes through in one unfragmented datagram.
+
+IP_UDP_OVERHEAD = 20 + 8  # IPv4 header without options, UDP header
+MAX_DATAGRAM = 65535 - IP_UDP_OVERHEAD  # Largest UDP payload over IPv4
+MTUS = (65536, 9000, 1500)  # Loopback, jumbo-frame LAN, Ethernet
+PROBE_TRIES = 3  # Probes of one size lost in a row before trying the next size down
+
+# Linux values, the socket module only exports these names on some builds
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+
+def dont_fragment(sock):
+    #Set DF on everything sock sends, returns False where the platform has no such option
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+    except OSError:
+        return False
+    return True
+
+def candidate_sizes(header_size, floor, limit):
+    """Payload sizes to probe, largest first, each filling one datagram of a common MTU."""
+    sizes = {min(mtu - IP_UDP_OVERHEAD, MAX_DATAGRAM) - header_size for mtu in MTUS}
+    sizes.add(limit)
+    return sorted((size for size in sizes if floor < size <= limit), reverse=True)
+
+def too_big(error):
+    return error.errno == errno.EMSGSIZE
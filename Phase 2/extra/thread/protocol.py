@@ -0,0 +1,64 @@
+import array
+import struct
+import sys
+
+#Packet formats shared by the pipelined sender and receiver.
+#Sequence numbers are byte offsets into the file so any number of packets can be in flight.
+
+DATA = 0     # offset = position of the payload in the file
+FIN = 1      # offset = total file length, payload = SHA-256 of the file, sent once everything is ACKed
+ACK = 2      # offset = next byte the receiver expects (cumulative), window = free receive buffer,
+             # corrupt = packets that failed the checksum so far (wraps at 2^32)
+FIN_ACK = 3
+PROBE = 4    # Zero-window probe, no payload, asks the receiver to re-advertise its window
+FIN_NAK = 5  # Answers FIN like FIN_ACK, but the received length or digest did not match
+SIZE_PROBE = 6  # offset = payload length, payload = padding, asks whether a datagram this big arrives
+SIZE_ACK = 7  # offset = payload length of the probe that arrived, window as in ACK
+NAK = 8  # Multicast only: offset = next byte the receiver expects, payload = RANGEs it is missing
+DONE = 9  # Multicast only: offset = total length, payload = b"\x01" if the digest matched, else b"\x00"
+ABORT = 10  # Receiver gave up, e.g. its writer failed; offset = next byte it expected, answers every later packet
+
+HEADER = struct.Struct("!BQ2s")  # 1 byte type, 8 bytes offset, 2 bytes checksum
+FIELDS = struct.Struct("!BQ")  # The part of HEADER the checksum covers
+ACK_HEADER = struct.Struct("!BQII")  # 1 byte type, 8 bytes offset, 4 bytes window, 4 bytes corrupt count
+RANGE = struct.Struct("!QQ")  # start, end of a gap in a NAK
+MAX_WINDOW = 0xFFFFFFFF
+
+def calculate_checksum(data):
+    #Same 16-bit one's complement checksum as the other options, summed a word at a time
+    #Folding the carries once at the end gives the same value as folding after every add
+    if len(data) & 1:
+        data = bytes(data) + b"\x00"
+    words = array.array("H", data)
+    if sys.byteorder == "big":
+        words.byteswap()  # Words are little-endian like the byte loop in the other options
+    checksum = sum(words)
+    while checksum >> 16:
+        checksum = (checksum & 0xFFFF) + (checksum >> 16)  # Wrap around carry
+    return (~checksum & 0xFFFF).to_bytes(2, "big")  # One’s complement
+
+def packet_checksum(kind, offset, data):
+    #Checksum covers the offset too, a flipped offset would otherwise land data in the wrong place
+    return calculate_checksum(FIELDS.pack(kind, offset) + b"\x00" + data)
+
+def make_packet(kind, offset, data=b""):
+    return HEADER.pack(kind, offset, packet_checksum(kind, offset, data)) + data
+
+def parse_packet(packet):
+    #Returns (type, offset, data) or None if the packet is corrupt or too short
+    if len(packet) < HEADER.size:
+        return None
+    kind, offset, received_checksum = HEADER.unpack_from(packet)
+    data = packet[HEADER.size:]
+    if received_checksum != packet_checksum(kind, offset, data):
+        return None
+    return kind, offset, data
+
+def make_ack(offset, window, kind=ACK, corrupt=0):
+    return ACK_HEADER.pack(kind, offset, min(window, MAX_WINDOW), corrupt & 0xFFFFFFFF)
+
+def parse_ack(packet):
+    #Returns (type, offset, window, corrupt) or None
+    if len(packet) < ACK_HEADER.size:
+        return None
+    return ACK_HEADER.unpack_from(packet)
@@ -1,30 +1,36 @@
 import socket
-import struct
+import select
+import queue
+import hashlib
 import random
 import threading
-import queue
-
-def calculate_checksum(data):
-    checksum = 0
-    for i in range(0, len(data), 2):
-        word = data[i] + (data[i+1] << 8) if i + 1 < len(data) else data[i]
-        checksum += word
-        checksum = (checksum & 0xFFFF) + (checksum >> 16)
-    
-    return (~checksum & 0xFFFF).to_bytes(2, "big")
+import time
 
+from protocol import HEADER, FIN, ACK, FIN_ACK, FIN_NAK, ABORT, PROBE, SIZE_PROBE, SIZE_ACK, parse_packet, make_ack
+from pipeline import BATCH_SIZE, Stage, BatchQueue, Latency, report, stats
+from writer import BUFFER_LIMIT, WriteBehind
+from pacing import bdp_bytes, size_buffers, udp_counters, counter_delta, report_drops
+from pmtu import MAX_DATAGRAM
+from sizing import flip_bits
 
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
-PACKET_SIZE = 1024
+PACKET_SIZE = 1024  # Payload size until the sender's probes agree on a larger one
 ERROR_RATE = 0.0  # Adjustable error rate (0 to 60)
+BIT_ERROR_RATE = 0.0  # Per-bit flip probability, unlike ERROR_RATE big packets get hit more often
+REORDER_LIMIT = 1024  # Out-of-order packets held while waiting for a gap to fill
+WRITE_BUFFER = BUFFER_LIMIT  # Bytes ACKed but not yet on disk
+FSYNC_POLICY = "none"  # "none", "mb" (every FSYNC_EVERY_MB and at close) or "close"
+FSYNC_EVERY_MB = 8
+EXPECTED_RATE = 40 * 1024 * 1024  # Bytes per second the sender paces at, sizes SO_RCVBUF
+BURST_PACKETS = 64  # A full sender window arriving back-to-back must fit in SO_RCVBUF too
+WINDOW_UPDATE = 16 * PACKET_SIZE  # Reopened window worth an unsolicited ACK after advertising less
+WINDOW_UPDATE_INTERVAL = 0.01  # How often the ACK stage checks for a reopened window when idle
+LINGER = 0.5  # TIME_WAIT: quiet seconds before closing, re-answering duplicate FINs until then
 
-packet_queue = queue.Queue()
-ack_queue = queue.Queue()
-process_lock = threading.Lock()
-
-def is_corrupt(data, received_checksum):
-    return received_checksum != calculate_checksum(data)
+errors = 0
+pipeline_stats = {}
+writer_stats = {}
 
 def introduce_errors(data, error_rate):
     if not data:
@@ -38,73 +44,324 @@ def introduce_errors(data, error_rate):
         return bytes(corrupted_data)
     return data
 
-def process_packets(sock):
-    expected_seq_num = 0
-    last_ack = struct.pack("!B", 1 - expected_seq_num)
+#reader -> verify -> reorder -> ACK, with the reorder stage handing data to a write-behind thread
+#Only the reader reads from the socket and only the ACK stage writes to it
+class PipelinedReceiver:
+    def __init__(self, sock, f=None, writer=None):
+        #Data goes to file f through a write-behind thread, or to any writer with the same interface
+        self.sock = sock
+        self.file = f
+        self.writer = writer or WriteBehind(f.fileno(), WRITE_BUFFER, FSYNC_POLICY, FSYNC_EVERY_MB)
+        self.ack_latency = Latency("ack")  # Packet read -> ACK sent, never waits on the disk
+        self.verified = BatchQueue("verify")
+        self.ordered = BatchQueue("reorder")
+        self.acks = BatchQueue("acks")
+        self.stages = []
+        self.stopped = threading.Event()
+        self.corrupt = 0
+        self.duplicates = 0
+        self.received_bytes = 0
+        self.digest = hashlib.sha256()  # Of the data handed to the writer, in file order
+        self.complete = False  # FIN's length and digest matched what was written
+        self.final_ack = None  # FIN_ACK/FIN_NAK as sent, repeated for duplicate FINs, or the ABORT
+        self.error = None  # What aborted the transfer, re-raised by run()
+        self.parked_bytes = 0  # Out-of-order data held in memory, counts against the window
+        self.advertised = None  # Window in the last ACK sent
+        self.last_ack = None  # (addr, acked) of the last ACK, for window updates
+        self.peer = None  # Address the data came from
+        self.started = None  # Wall clock of the first packet and of the FIN, comparable across processes
+        self.finished = None
+        self.packet_size = PACKET_SIZE  # Largest payload a size probe has confirmed
+        self.buffer = bytearray(MAX_DATAGRAM)  # Any datagram fits, nothing gets silently truncated
 
-    with open("received.jpg", "wb") as f:
+    def read_packets(self):
+        #Waits for the socket to turn readable, then drains whatever the kernel already holds
+        stage = Stage("reader")
+        self.stages.append(stage)
+        while not self.stopped.is_set():
+            readable, _, _ = select.select([self.sock], [], [], 0.05)
+            if not readable:
+                continue
+            start = time.perf_counter()
+            batch = []
+            view = memoryview(self.buffer)
+            while len(batch) < BATCH_SIZE:
+                try:
+                    size, addr = self.sock.recvfrom_into(self.buffer)
+                except BlockingIOError:
+                    break
+                batch.append(view[:size].tobytes())
+            if not batch:
+                continue
+            self.verified.put((addr, start, batch))
+            stage.done(start, len(batch))
+        self.verified.put(None)
+        stage.finish()
+
+    def verify_packets(self):
+        stage = Stage("verify")
+        self.stages.append(stage)
         while True:
-            packet = packet_queue.get()
-            addr = packet[1]
-            packet = packet[0]
+            item = self.verified.get()
+            if item is None:
+                break
+            start = time.perf_counter()
+            addr, arrived, batch = item
+            good = []
+            for packet in batch:
+                if ERROR_RATE:
+                    packet = packet[:HEADER.size] + introduce_errors(packet[HEADER.size:], ERROR_RATE)
+                if BIT_ERROR_RATE:
+                    packet = packet[:HEADER.size] + flip_bits(packet[HEADER.size:], BIT_ERROR_RATE)
+                parsed = parse_packet(packet)
+                if parsed is None:
+                    self.corrupt += 1
+                else:
+                    good.append(parsed)
+            # Forward even an all-corrupt batch so the sender gets a duplicate ACK
+            self.ordered.put((addr, arrived, good))
+            stage.done(start, len(batch))
+        self.ordered.put(None)
+        stage.finish()
 
-            seq_num, received_checksum = struct.unpack("!B2s", packet[:3])
-            data = packet[3:]
+    def reorder_and_write(self):
+        #Queues contiguous data for the writer in order, parks anything ahead of a gap until the gap fills
+        stage = Stage("reorder")
+        self.stages.append(stage)
+        next_offset = 0
+        parked = {}
+        try:
+            while True:
+                item = self.ordered.get()
+                if item is None:
+                    break
+                if self.writer.error:
+                    raise self.writer.error  # Failed between writes, nothing else would notice
+                start = time.perf_counter()
+                if self.started is None:
+                    self.started = time.time()
+                addr, arrived, packets = item
+                self.peer = addr
+                finished = False
+                probed = 0
+                for kind, offset, data in packets:
+                    if kind == FIN:
+                        finished = offset == next_offset
+                        self.complete = self.complete or (finished and data == self.digest.digest())
+                    elif kind == PROBE:
+                        continue  # Only wants the ACK every batch gets, with the current window
+                    elif kind == SIZE_PROBE:
+                        probed = max(probed, len(data))
+                    elif offset == next_offset:
+                        self.writer.write(offset, data)
+                        self.digest.update(data)
+                        next_offset += len(data)
+                        while next_offset in parked:
+                            data = parked.pop(next_offset)
+                            self.parked_bytes -= len(data)
+                            self.writer.write(next_offset, data)
+                            self.digest.update(data)
+                            next_offset += len(data)
+                    elif offset > next_offset and offset not in parked and len(parked) < REORDER_LIMIT:
+                        parked[offset] = data
+                        self.parked_bytes += len(data)
+                    else:
+                        self.duplicates += 1
+                self.received_bytes = next_offset
+                if finished:
+                    self.finished = time.time()
+                    self.writer.close()  # FIN_ACK promises the file is complete, flush (and fsync) first
+                self.acks.put((addr, next_offset, finished, arrived, probed))
+                stage.done(start, len(packets))
+        except Exception as e:
+            #The writer (or a CallbackWriter's callback) failed, the transfer cannot complete. Stop the
+            #reader and drain, the verify stage must not block on a full queue
+            self.error = e
+            self.stopped.set()
+            while self.ordered.get() is not None:
+                pass
+        self.acks.put(None)
+        stage.finish()
 
-            data = introduce_errors(data, ERROR_RATE)
+    def window(self):
+        #Bytes the receiver can take beyond the cumulative ACK without blocking on the writer
+        return max(0, self.writer.free_space() - self.parked_bytes)
 
-            if seq_num == 255:
-                print("EOF received. Sending EOF ACK...")
-                sock.sendto(struct.pack("!B", 255), addr)
+    def send_acks(self):
+        #Coalesces everything queued into one cumulative ACK per wakeup
+        stage = Stage("ack")
+        self.stages.append(stage)
+        while True:
+            try:
+                item = self.acks.get(timeout=WINDOW_UPDATE_INTERVAL)
+            except queue.Empty:
+                self.update_window()
+                continue
+            if item is None:
                 break
+            start = time.perf_counter()
+            batch = [item] + self.acks.drain()
+            closing = batch[-1] is None
+            batch = [b for b in batch if b is not None]
+            addr, acked, _, _, _ = batch[-1]
+            probed = max(probed for _, _, _, _, probed in batch)
+            if probed:
+                self.confirm_size(probed, addr)
+            self.send_ack(acked, addr)
+            self.ack_latency.observe(time.perf_counter() - min(arrived for _, _, _, arrived, _ in batch))
+            if any(finished for _, _, finished, _, _ in batch):
+                self.send_ack(acked, addr, FIN_ACK if self.complete else FIN_NAK)
+                self.stopped.set()
+            stage.done(start, len(batch))
+            if closing:
+                break
+        if self.error and self.peer:
+            self.send_ack(self.received_bytes, self.peer, ABORT)  # The sender would otherwise retransmit forever
+        stage.finish()
 
-            print(f"Received packet {seq_num}, expected {expected_seq_num}")
-            print(f"Received checksum: {received_checksum.hex()}, Computed checksum: {calculate_checksum(data).hex()}")
+    def confirm_size(self, size, addr):
+        #A probe of this size arrived whole; grow SO_RCVBUF so a burst of such packets still fits
+        if size > self.packet_size:
+            self.packet_size = size
+            size_buffers(self.sock, receive_buffer_size(size), send=False)
+        self.send_ack(size, addr, SIZE_ACK)
 
-            if not is_corrupt(data, received_checksum) and seq_num == expected_seq_num:
-                with process_lock:
-                    f.write(data)
-                    print(f"Packet {seq_num} received correctly, sending ACK {seq_num}")
-                    ack_packet = struct.pack("!B", seq_num)
-                    expected_seq_num = 1 - expected_seq_num
-                    last_ack = ack_packet
-            else:
-                print(f"Corrupt packet or unexpected sequence number! Resending last ACK {last_ack.hex()}")
+    def update_window(self):
+        #The sender stops at a closed window and only probes now and then, so announce the
+        #reopening as soon as the writer has drained enough instead of waiting for its probe
+        if self.last_ack is None or self.stopped.is_set():
+            return
+        if self.advertised < WINDOW_UPDATE and self.window() >= WINDOW_UPDATE:
+            addr, acked = self.last_ack
+            self.send_ack(acked, addr)
 
-            ack_queue.put((last_ack, addr))
+    def send_ack(self, acked, addr, kind=ACK):
+        window = self.window()
+        self.advertised = window
+        if kind == ACK:
+            self.last_ack = (addr, acked)
+        ack = make_ack(acked, window, kind, self.corrupt)
+        if kind in (FIN_ACK, FIN_NAK, ABORT):
+            self.final_ack = ack
+        try:
+            self.sock.sendto(ack, addr)
+        except BlockingIOError:
+            pass  # Send buffer full, the next cumulative ACK covers this one
 
-def send_acks(sock):
-    while True:
-        ack, addr = ack_queue.get()
-        sock.sendto(ack, addr)
+    def start(self):
+        #Starts every stage but the reader, batches can then be fed into self.verified directly
+        self.threads = [threading.Thread(target=target, daemon=True)
+                        for target in (self.verify_packets, self.reorder_and_write, self.send_acks)]
+        for thread in self.threads:
+            thread.start()
 
-def main():
-    global ERROR_RATE
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((UDP_IP, UDP_PORT))
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+        if not self.error:
+            self.writer.close()
+
+    def run(self):
+        self.sock.setblocking(False)  # Waits happen in select(), never inside a socket call
+        self.start()
+        self.read_packets()
+        self.join()
+        self.linger()
+        if self.error:
+            raise self.error
+
+    def linger(self):
+        #TIME_WAIT: a lost FIN_ACK makes the sender resend its FIN, answer every copy until it goes quiet
+        if self.final_ack is None:
+            return
+        while select.select([self.sock], [], [], LINGER)[0]:
+            try:
+                while True:
+                    packet, addr = self.sock.recvfrom(MAX_DATAGRAM)
+                    self.answer_late([packet], addr)
+            except BlockingIOError:
+                pass  # Drained, wait for the next copy or the end of LINGER
 
-    process_thread = threading.Thread(target=process_packets, args=(sock,))
-    process_thread.daemon = True
-    process_thread.start()
+    def answer_late(self, packets, addr):
+        #Packets after the transfer ended: an aborted one repeats its ABORT to anything, in case the
+        #first got lost, a finished one answers the last FIN
+        if self.error:
+            self.sock.sendto(self.final_ack, addr)
+            return
+        fins = [packet for packet in packets if packet[:1] == bytes([FIN])]
+        if fins:
+            self.answer_fin(fins[-1], addr)
 
-    ack_thread = threading.Thread(target=send_acks, args=(sock,))
-    ack_thread.daemon = True
-    ack_thread.start()
+    def answer_fin(self, packet, addr):
+        #A FIN_NAK may only mean the FIN's digest got damaged past the checksum, the sender then resends
+        #the FIN, so a later copy that matches still turns the answer into a FIN_ACK
+        parsed = parse_packet(packet)
+        if not self.complete and parsed and parsed[1] == self.received_bytes and parsed[2] == self.digest.digest():
+            self.complete = True
+            self.send_ack(self.received_bytes, addr, FIN_ACK)
+        else:
+            self.sock.sendto(self.final_ack, addr)
 
-    while True:
-        print("Waiting for packets...")
-        packet, addr = sock.recvfrom(PACKET_SIZE + 3)
-        print("Packet received!")
+    def summary(self):
+        #Picklable totals for one transfer, merged across processes by multi_receiver
+        return {
+            "bytes": self.received_bytes,
+            "corrupt": self.corrupt,
+            "complete": self.complete,
+            "error": str(self.error) if self.error else None,
+            "duplicates": self.duplicates,
+            "ack_latency_total": self.ack_latency.total,
+            "ack_latency_count": self.ack_latency.count,
+            "ack_latency_max": self.ack_latency.max,
+            "started": self.started,
+            "finished": self.finished or time.time(),
+            "writer": self.writer.stats(),
+            "pipeline": stats(self.stages, self.queues()),
+        }
 
-        # Check if it's an EOF packet (seq_num == 255)
-        seq_num, _ = struct.unpack("!B2s", packet[:3])
-        if seq_num == 255:
-            print("EOF packet received. Terminating receiver.")
-            sock.sendto(struct.pack("!B", 255), addr)
-            break  # Exit the loop when EOF packet is received
+    def queues(self):
+        return [self.verified, self.ordered, self.acks]
 
-        packet_queue.put((packet, addr))  # Add packet to the queue
+def receive_buffer_size(packet_size=PACKET_SIZE):
+    return bdp_bytes(EXPECTED_RATE, floor=BURST_PACKETS * (packet_size + HEADER.size))
+
+def bind(addr):
+    #Receiving socket with SO_RCVBUF sized for the expected rate, returns it and the granted sizes
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(addr)
+    return sock, size_buffers(sock, receive_buffer_size(), send=False)
+
+def main():
+    global errors, pipeline_stats, writer_stats
+    sock, buffers = bind((UDP_IP, UDP_PORT))
+    counters = udp_counters()
+
+    print("Waiting for packets...")
+    start_time = time.time()
+    with open("received.jpg", "wb") as f:
+        receiver = PipelinedReceiver(sock, f)
+        receiver.run()
 
+    errors = receiver.corrupt
+    pipeline_stats = stats(receiver.stages, receiver.queues())
+    writer_stats = receiver.writer.stats()
+    writer_stats["ack_latency_avg"] = receiver.ack_latency.average()
+    writer_stats["ack_latency_max"] = receiver.ack_latency.max
+    pipeline_stats["buffers"] = buffers
+    pipeline_stats["kernel_drops"] = counter_delta(counters, udp_counters())
+    if not receiver.complete:
+        print("Length or digest in EOF does not match the received file!")
+    print(f"Received {receiver.received_bytes} bytes in {time.time() - start_time:.4f} seconds")
+    print(f"Corrupt packets: {receiver.corrupt}, duplicates: {receiver.duplicates}")
+    report(receiver.stages, receiver.queues())
+    print(f"ACK latency: avg {receiver.ack_latency.average() * 1000:.3f} ms, max {receiver.ack_latency.max * 1000:.3f} ms")
+    print(f"Storage latency: avg {writer_stats['storage_latency_avg'] * 1000:.3f} ms, "
+          f"max {writer_stats['storage_latency_max'] * 1000:.3f} ms")
+    print(f"Disk writes: {writer_stats['writes']} ({writer_stats['bytes_per_write'] / 1024:.1f} KB each), "
+          f"fsyncs: {writer_stats['fsyncs']} ({writer_stats['fsync_time']:.3f}s), "
+          f"buffer full: {writer_stats['stalled']:.3f}s")
+    print(f"Socket buffers: {buffers}")
+    report_drops(pipeline_stats["kernel_drops"])
     print("Receiver shutting down.")
     sock.close()
 
@@ -0,0 +1,198 @@
+import argparse
+import contextlib
+import io
+import select
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+from pacing import TokenBucket
+from sender import PACING_RATE, PipelinedSender
+
+#Weighted fair sharing of one sending path between concurrent transfers. Each transfer gets a Flow;
+#its PipelinedSender hands packets to the flow instead of the socket, and one scheduler thread
+#takes them out by deficit round robin (Shreedhar & Varghese): every round a backlogged flow may
+#send weight * QUANTUM more bytes, so over time bytes split in proportion to the weights whatever
+#the packet sizes. The scheduler paces the sum of all flows at one rate, so a bulk transfer can
+#only fill the link up to its share while a small, heavily weighted one is active.
+
+QUANTUM = 64 * 1024  # Bytes per round for weight 1, at least one full-size packet so every round moves
+FLOW_ROUNDS = 2  # A flow queues up to this many rounds of its quantum before its sender blocks
+
+class Flow:
+    """One transfer's queue in the scheduler, with what it got out of it."""
+
+    def __init__(self, scheduler, sock, addr, weight, name):
+        if weight <= 0:
+            raise ValueError(f"weight must be positive, not {weight}")
+        self.scheduler = scheduler
+        self.sock = sock
+        self.addr = addr
+        self.weight = weight
+        self.name = name
+        self.queue = deque()
+        self.queued = 0  # Bytes waiting in queue
+        self.limit = FLOW_ROUNDS * scheduler.quantum * weight
+        self.deficit = 0
+        self.bytes = 0
+        self.packets = 0
+        self.queue_wait = 0.0  # Seconds its packets spent queued behind other flows
+        self.errors = 0  # sendto failures, the packet counts as lost
+        self.started = time.perf_counter()
+        self.first_sent = self.last_sent = self.finished = None
+
+    def put(self, packet):
+        #Blocks while the flow is FLOW_ROUNDS behind, which holds its sender back like a full socket
+        cond = self.scheduler.cond
+        with cond:
+            while self.queue and self.queued + len(packet) > self.limit:
+                cond.wait()
+            self.queue.append((packet, time.perf_counter()))
+            self.queued += len(packet)
+            cond.notify_all()
+
+    def send(self, packet):
+        while True:
+            try:
+                self.sock.sendto(packet, self.addr)
+                break
+            except BlockingIOError:
+                select.select([], [self.sock], [], 1.0)
+            except OSError:
+                self.errors += 1  # ICMP errors and the like, the sender's timers treat it as loss
+                return
+        now = time.perf_counter()
+        if self.first_sent is None:
+            self.first_sent = now
+        self.last_sent = now
+        self.bytes += len(packet)
+        self.packets += 1
+
+    def close(self):
+        self.scheduler.remove(self)
+        self.finished = time.perf_counter()
+
+    def stats(self):
+        active = (self.last_sent or 0.0) - (self.first_sent or 0.0)
+        return {"name": self.name, "weight": self.weight, "bytes": self.bytes, "packets": self.packets,
+                "throughput": self.bytes / active if active > 0 else None,
+                "completion": (self.finished or time.perf_counter()) - self.started,
+                "queue_wait": self.queue_wait / self.packets if self.packets else 0.0, "errors": self.errors}
+
+class FairScheduler:
+    """Deficit round robin over the flows sharing one sending path, paced at one aggregate rate."""
+
+    def __init__(self, rate=PACING_RATE, quantum=QUANTUM):
+        self.pacer = TokenBucket(rate)
+        self.quantum = quantum
+        self.flows = []
+        self.cond = threading.Condition()
+        self.closed = False
+        self.rounds = 0
+        self.thread = threading.Thread(target=self.run, name="fair-scheduler", daemon=True)
+        self.thread.start()
+
+    def flow(self, sock, addr, weight=1.0, name=None):
+        flow = Flow(self, sock, addr, weight, name or f"{addr[0]}:{addr[1]}")
+        with self.cond:
+            self.flows.append(flow)
+        return flow
+
+    def remove(self, flow):
+        with self.cond:
+            if flow in self.flows:
+                self.flows.remove(flow)
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not any(flow.queue for flow in self.flows):
+                    if self.closed:
+                        return
+                    self.cond.wait()
+                flows = list(self.flows)
+            self.rounds += 1
+            for flow in flows:
+                self.serve(flow)
+
+    def serve(self, flow):
+        #One DRR visit: add the flow's quantum, send while the head packet fits in its deficit
+        with self.cond:
+            if not flow.queue:
+                flow.deficit = 0  # Idle flows do not bank credit
+                return
+            flow.deficit += self.quantum * flow.weight
+        while True:
+            with self.cond:
+                if not flow.queue:
+                    flow.deficit = 0
+                    return
+                packet, queued = flow.queue[0]
+                if len(packet) > flow.deficit:
+                    return
+                flow.queue.popleft()
+                flow.queued -= len(packet)
+                flow.deficit -= len(packet)
+                self.cond.notify_all()
+            self.pacer.wait(len(packet))
+            flow.queue_wait += time.perf_counter() - queued
+            flow.send(packet)
+
+def send_concurrently(jobs, rate=PACING_RATE):
+    """Send (path, addr, weight) jobs at once through one FairScheduler, returns each flow's stats."""
+    scheduler = FairScheduler(rate)
+    results = [None] * len(jobs)
+
+    def run(index, path, addr, weight):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        flow = scheduler.flow(sock, addr, weight, name=path)
+        sender = PipelinedSender(sock, addr, flow=flow)
+        try:
+            with open(path, "rb") as f:
+                sender.send(f)
+        finally:
+            flow.close()
+            sock.close()
+            results[index] = dict(flow.stats(), confirmed=sender.confirmed, retransmissions=sender.retransmissions)
+
+    threads = [threading.Thread(target=run, args=(index, *job)) for index, job in enumerate(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+    return results
+
+def parse_job(text):
+    #PATH@HOST:PORT[*WEIGHT]
+    path, _, rest = text.rpartition("@")
+    target, _, weight = rest.partition("*")
+    host, _, port = target.rpartition(":")
+    return path, (host or "127.0.0.1", int(port)), float(weight or 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send several files at once, sharing the link by weight.")
+    parser.add_argument("jobs", nargs="+", type=parse_job, help="PATH@HOST:PORT[*WEIGHT], e.g. small.bin@:5006*8")
+    parser.add_argument("--rate", type=float, default=PACING_RATE, help="bytes per second for all transfers together")
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):  # The senders' progress lines would interleave
+        results = send_concurrently(args.jobs, args.rate)
+    print(f"{'transfer':<30}{'weight':>7}{'bytes':>12}{'MB/s':>8}{'done after s':>14}{'queued ms':>11}")
+    for row in results:
+        throughput = f"{row['throughput'] / 1e6:.2f}" if row["throughput"] else "-"
+        print(f"{row['name']:<30}{row['weight']:>7g}{row['bytes']:>12}{throughput:>8}{row['completion']:>14.3f}"
+              f"{row['queue_wait'] * 1e3:>11.2f}{'' if row['confirmed'] else '  NOT confirmed'}")
+    return 0 if all(row["confirmed"] for row in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,100 +1,550 @@
 import socket
-import struct
+import select
 import time
 import threading
 import queue
+import os
+import hashlib
+from collections import OrderedDict
 
-def calculate_checksum(data):
-    checksum = 0
-    for i in range(0, len(data), 2):
-        word = data[i] + (data[i+1] << 8) if i + 1 < len(data) else data[i]
-        checksum += word
-        checksum = (checksum & 0xFFFF) + (checksum >> 16)
-    
-    return (~checksum & 0xFFFF).to_bytes(2, "big")
-
+from protocol import DATA, FIN, ACK, FIN_ACK, FIN_NAK, ABORT, PROBE, SIZE_PROBE, SIZE_ACK, HEADER, make_packet, parse_ack
+from pipeline import BATCH_SIZE, Stage, BatchQueue, report, stats
+from packetizer import PARALLEL_THRESHOLD, ParallelPacketizer
+from pacing import TokenBucket, bdp_bytes, size_buffers, udp_counters, counter_delta, report_drops
+from pmtu import MAX_DATAGRAM, IP_UDP_OVERHEAD, PROBE_TRIES, dont_fragment, candidate_sizes, too_big
+from sizing import PayloadSizer
+from packet_cache import cache_key, shared_cache
 
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
-PACKET_SIZE = 1024
+PACKET_SIZE = 1024  # Payload size every receiver takes, used as is when probing finds nothing larger
+MAX_PACKET_SIZE = MAX_DATAGRAM - HEADER.size  # Largest payload worth probing for, 0 turns probing off
+MIN_PACKET_SIZE = 512  # Smallest payload corruption may shrink packets to
+ADAPTIVE_SIZE = True  # Resize payloads from the corruption the receiver reports
+WINDOW = 64  # Packets in flight before waiting for ACKs
+INITIAL_RTO = 0.1
+MIN_RTO = 0.05  # Same 50ms floor as the Phase 3 timers, GIL hand-offs alone can take 5ms
+MAX_RTO = 1.0
+DUP_ACK_THRESHOLD = 3  # Duplicate ACKs before resending the oldest packet early
+PACING_RATE = 40 * 1024 * 1024  # Bytes per second, 0 sends as fast as the window allows
+FIN_RETRIES = 20  # FIN resends, backing off like data, before giving up on the FIN_ACK
+PACKET_CACHE = os.environ.get("RDT_PACKET_CACHE", "")  # "" off, "memory", or a directory shared between runs
+PACKET_CACHE_BUDGET = 64 * 1024 * 1024  # Bytes of prepared packets the cache keeps
 
-ack_queue = queue.Queue()  # Thread-safe queue for ACKs
-send_lock = threading.Lock()  # Lock for thread-safe packet transmission
+retransmissions = 0
+pipeline_stats = {}
+confirmed = None  # Whether the receiver confirmed the file's length and digest
 
-def make_packet(seq_num, data):
-    checksum = calculate_checksum(data)
-    header = struct.pack("!B2s", seq_num, checksum)
-    return header + data
+#Smoothed RTT and retransmission timeout, RFC 6298 style
+class RttEstimator:
+    def __init__(self, rto=INITIAL_RTO):
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = rto
+        self.backoff = 1
 
-def send_file(filename, sock, addr):
-    with open(filename, "rb") as f:
-        seq_num = 0  # Sequence numbers: 0 or 1
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+        self.backoff = 1
+
+    def timeout(self):
+        return min(MAX_RTO, self.rto * self.backoff)
+
+    def expired(self):
+        self.backoff = min(self.backoff * 2, 64)
+
+    def progress(self):
+        #New data was ACKed, the path works again so drop the backoff
+        self.backoff = 1
+
+#One packet waiting for its ACK
+class InFlight:
+    __slots__ = ("packet", "length", "first_sent", "last_sent", "retransmitted")
+
+    def __init__(self, packet, length, now):
+        self.packet = packet
+        self.length = length
+        self.first_sent = now
+        self.last_sent = now
+        self.retransmitted = False
+
+#packetize -> send <- ACK demux
+#Only the ACK demux thread reads from the socket and only the send stage writes to it
+class PipelinedSender:
+    def __init__(self, sock, addr, window=WINDOW, cache=None, flow=None):
+        self.sock = sock
+        self.addr = addr
+        self.window = window
+        self.packets = BatchQueue("packets")
+        self.acks = BatchQueue("acks")
+        self.stages = []
+        self.rtt = RttEstimator()
+        self.stopped = threading.Event()
+        self.ack_thread = threading.Thread(target=self.listen_for_acks, daemon=True)
+        self.retransmissions = 0
+        self.total = None
+        self.digest = hashlib.sha256()  # Of everything packetized, sent in the FIN
+        self.file_digest = None  # Same, but taken from the packet cache
+        self.cache = cache  # PacketCache for files sent before, None packetizes every send from scratch
+        self.cache_hit = False
+        self.flow = flow  # scheduler.Flow sharing the link with other transfers, None sends directly
+        if flow and sock.getsockname()[1] == 0:
+            sock.bind(("", 0))  # Packets leave from the scheduler's thread, the ACK thread needs the port now
+        self.confirmed = None  # True/False once the receiver answered the FIN, None if it never did
+        self.acked = 0  # Cumulative ACK, everything before it has reached the receiver
+        self.pacer = TokenBucket(PACING_RATE)
+        self.peer_window = window * PACKET_SIZE  # Receiver's free buffer, until its first ACK says otherwise
+        self.probes = 0
+        self.packetize_error = None  # What stopped the packetizer thread, re-raised by send()
+        self.packet_size = PACKET_SIZE  # Payload per packet, raised by probe_packet_size()
+        self.size_probes = 0
+        self.probed = False  # Probing runs once, a fan-out may do it before send()
+        self.sizer = None  # PayloadSizer once the maximum is known, None keeps packet_size fixed
+        self.buffers = self.size_buffers()
+
+    def size_buffers(self):
+        # Room for a whole window even when the pacing rate times the RTT is smaller
+        floor = self.window * (self.packet_size + HEADER.size)
+        return size_buffers(self.sock, bdp_bytes(PACING_RATE, floor=floor))
+
+    def probe_packet_size(self):
+        """Agree on the largest payload that reaches the receiver in one unfragmented datagram.
 
+        Probes go out with DF set, largest candidate first; a size counts once the receiver
+        echoes it in a SIZE_ACK. Runs before any data is sent, so it owns the ACK queue.
+        """
+        if self.probed:
+            return self.packet_size
+        self.probed = True
+        self.sock.setblocking(False)
+        if not MAX_PACKET_SIZE or not dont_fragment(self.sock):
+            return self.packet_size
+        for size in candidate_sizes(HEADER.size, self.packet_size, MAX_PACKET_SIZE):
+            probe = make_packet(SIZE_PROBE, size, bytes(size))
+            for _ in range(PROBE_TRIES):
+                try:
+                    self.transmit(probe, scheduled=False)  # EMSGSIZE has to come back to this thread
+                except OSError as e:
+                    if not too_big(e):
+                        raise
+                    break  # Bigger than the local interface or a known path MTU, no need to wait
+                self.size_probes += 1
+                if self.await_size_ack(size):
+                    self.packet_size = size
+                    self.buffers = self.size_buffers()
+                    return size
+        return self.packet_size
+
+    def await_size_ack(self, size):
+        deadline = time.perf_counter() + self.rtt.timeout()
+        while True:
+            try:
+                _, acks = self.acks.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                return False
+            for kind, acked, window, _ in acks:
+                if kind == SIZE_ACK and acked == size:
+                    self.peer_window = window
+                    return True
+
+    def packetize(self, f):
+        #Packetizer thread: a failure still ends the stream, send() raises it instead of waiting forever
+        try:
+            self.packetize_file(f)
+        except BaseException as e:
+            self.packetize_error = e
+            self.packets.put(None)
+
+    def packetize_file(self, f):
+        #Read and frame anything with read(n), handing batches to the send stage. Pipes and other
+        #non-seekable sources work too, only regular files are big enough for the process pool
+        stage = Stage("packetize")
+        self.stages.append(stage)
+        key = cache_key(f, self.packet_size) if self.cache else None
+        recorder = None
+        offset = 0
+        if key:
+            prepared = self.cache.get(key)
+            if prepared:
+                offset = self.packetize_prepared(f, prepared, stage)
+                if offset is None:
+                    return
+                # Resized mid-file: hash what the cache covered, frame the rest the usual way
+                f.seek(0)
+                self.digest.update(f.read(offset))
+            else:
+                recorder = self.cache.recorder(self.packet_size)
+        path = getattr(f, "name", None)
+        if not offset and isinstance(path, str) and os.path.isfile(path) and os.path.getsize(path) >= PARALLEL_THRESHOLD:
+            self.packetize_parallel(f.name, stage, recorder)
+        else:
+            self.packetize_inline(f, offset, stage, recorder)
+        if recorder:
+            self.cache.put(key, recorder.prepared(self.digest.digest()))
+
+    def packetize_inline(self, f, offset, stage, recorder=None):
+        ready = getattr(f, "ready", None)  # Live sources say whether read() would block
+        end = False
+        while not end:
+            start = time.perf_counter()
+            batch = []
+            while len(batch) < BATCH_SIZE:
+                if batch and ready and not ready():
+                    break  # Send what there is instead of holding it until more data turns up
+                chunk = f.read(self.sizer.size if self.sizer else self.packet_size)
+                if not chunk:
+                    end = True
+                    break
+                packet = make_packet(DATA, offset, chunk)
+                batch.append((offset, packet, len(chunk)))
+                if recorder:
+                    recorder.add(packet, len(chunk))
+                self.digest.update(chunk)
+                offset += len(chunk)
+            stage.done(start, len(batch))
+            if batch:
+                self.packets.put(batch)
+        self.total = offset
+        self.packets.put(None)  # End of file
+        stage.finish()
+
+    def packetize_prepared(self, f, prepared, stage):
+        #Cache hit: frame with the stored checksums, or hand over the stored packets as they are.
+        #Returns None when done, or the offset to carry on from if the sizer moved off the cached size
+        size = prepared.packet_size
+        count = len(prepared.checksums) // 2
+        f.seek(0)
+        for first in range(0, count, BATCH_SIZE):
+            if self.sizer and self.sizer.size != size:
+                return first * size
+            start = time.perf_counter()
+            batch = []
+            for index in range(first, min(first + BATCH_SIZE, count)):
+                offset = index * size
+                if prepared.packets:
+                    packet = prepared.packets[index]
+                else:
+                    packet = HEADER.pack(DATA, offset, prepared.checksum(index)) + f.read(size)
+                batch.append((offset, packet, len(packet) - HEADER.size))
+            stage.done(start, len(batch))
+            self.packets.put(batch)
+        self.cache_hit = True
+        self.file_digest = prepared.digest
+        self.total = f.seek(0, os.SEEK_END)
+        self.packets.put(None)
+        stage.finish()
+        return None
+
+    def packetize_parallel(self, path, stage, recorder=None):
+        #Large files: checksums come from a process pool, this thread only frames and queues.
+        #Workers cut the file into fixed ranges up front, so packets keep the probed size here
+        offset = 0
+        batches = ParallelPacketizer(path, self.packet_size).batches(BATCH_SIZE)
         while True:
-            chunk = f.read(PACKET_SIZE)
-            if not chunk:
-                eof_packet = struct.pack("!B2s", 255, b'\x00\x00')  # 255 indicates EOF
-                sock.sendto(eof_packet, addr)
-                print("EOF packet sent. Waiting for EOF ACK...")
-                while True:
-                    try:
-                        sock.settimeout(1.0)  # Timeout for retransmission
-                        ack, _ = sock.recvfrom(1)
-                        ack_seq, = struct.unpack("!B", ack)
-                        if ack_seq == 255:
-                            print("EOF ACK received. File transfer complete.")
-                            return
-                        else:
-                            print(f"Unexpected ACK {ack_seq}, waiting for EOF ACK...")
-                    except socket.timeout:
-                        print("Timeout! Resending EOF packet.")
-                        sock.sendto(eof_packet, addr)
-
-            packet = make_packet(seq_num, chunk)
+            start = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                break
+            offset = batch[-1][0] + batch[-1][2]
+            for _, packet, length in batch:
+                self.digest.update(memoryview(packet)[HEADER.size:])
+                if recorder:
+                    recorder.add(packet, length)
+            stage.done(start, len(batch))
+            self.packets.put(batch)
+        self.total = offset
+        self.packets.put(None)
+        stage.finish()
+
+    def listen_for_acks(self):
+        #Sole reader of the socket, drains whatever ACKs are queued in the kernel per wakeup
+        stage = Stage("ack-demux")
+        self.stages.append(stage)
+        while not self.stopped.is_set():
+            readable, _, _ = select.select([self.sock], [], [], 0.05)
+            if not readable:
+                continue
+            start = time.perf_counter()
+            batch = []
+            while len(batch) < BATCH_SIZE:
+                try:
+                    ack, _ = self.sock.recvfrom(64)
+                except BlockingIOError:
+                    break
+                batch.append(ack)
+            acks = [parsed for parsed in map(parse_ack, batch) if parsed]
+            self.acks.put((start, acks))
+            stage.done(start, len(batch))
+        stage.finish()
+
+    def transmit(self, packet, scheduled=True):
+        if self.flow and scheduled:
+            self.flow.put(packet)  # The scheduler paces it against the other transfers and sends it
+        else:
+            self.pacer.wait(len(packet))
             while True:
-                with send_lock:
-                    sock.sendto(packet, addr)
-                    print(f"Sent packet {seq_num}, waiting for ACK...")
+                try:
+                    self.sock.sendto(packet, self.addr)
+                    break
+                except BlockingIOError:
+                    select.select([], [self.sock], [], 1.0)  # Send buffer full, wait for room
+        if not self.ack_thread.is_alive() and not self.stopped.is_set():
+            self.ack_thread.start()  # The first sendto bound the socket, safe to read now
+
+    def send(self, f):
+        """Send everything f.read() returns, returns once the receiver has answered the FIN."""
+        self.sock.setblocking(False)  # Waits happen in select(), never inside a socket call
+        self.probe_packet_size()
+        if ADAPTIVE_SIZE:
+            self.sizer = PayloadSizer(min(MIN_PACKET_SIZE, self.packet_size), self.packet_size,
+                                      HEADER.size + IP_UDP_OVERHEAD)
+        packetizer = threading.Thread(target=self.packetize, args=(f,), daemon=True)
+        packetizer.start()
+        stage = Stage("send")
+        self.stages.append(stage)
 
+        in_flight = OrderedDict()  # offset -> InFlight, oldest first
+        pending = []  # Packets taken from the packetizer but not sent yet
+        end_of_file = False
+        base = 0  # Lowest offset not yet ACKed
+        duplicates = 0
+        recover = -1  # Highest offset in flight when loss recovery started
+        persist = self.rtt.timeout()  # Zero-window probe interval, doubles while the window stays shut
+
+        while True:
+            # Refill from the packetizer, only block for long when there is nothing else to do
+            if not pending and not end_of_file:
                 try:
-                    sock.settimeout(1.0)
-                    ack, _ = sock.recvfrom(1)
-                    ack_seq, = struct.unpack("!B", ack)
-
-                    if ack_seq == seq_num:
-                        print(f"ACK {ack_seq} received, moving to next packet.")
-                        seq_num = 1 - seq_num
-                        break
+                    batch = self.packets.get(timeout=0.001 if in_flight else None)
+                    if batch is None:
+                        if self.packetize_error:
+                            self.stopped.set()  # Lets the ACK thread exit
+                            raise self.packetize_error
+                        end_of_file = True
                     else:
-                        print(f"Unexpected ACK {ack_seq}, resending packet {seq_num}")
-                except socket.timeout:
-                    print(f"Timeout! Resending packet {seq_num}")
+                        pending = batch
+                except queue.Empty:
+                    pass
+            start = time.perf_counter()
+            handled = 0
+
+            # Fill the window
+            now = time.perf_counter()
+            sent = 0
+            limited = False  # Stopped by the receiver's window rather than our own
+            while sent < len(pending) and len(in_flight) < self.window:
+                offset, packet, length = pending[sent]
+                if offset + length > base + self.peer_window:
+                    limited = True
+                    break
+                self.transmit(packet)
+                if self.sizer:
+                    self.sizer.sent(length)
+                in_flight[offset] = InFlight(packet, length, now)
+                sent += 1
+            if sent:
+                pending = pending[sent:]
+                handled += sent
+
+            if end_of_file and not pending and not in_flight:
+                stage.done(start, handled)
+                break
+
+            # Retransmit the oldest packet once its timer runs out
+            if in_flight:
+                oldest = next(iter(in_flight.values()))
+                if now - oldest.last_sent > self.rtt.timeout():
+                    self.resend(oldest, now)
+                    self.rtt.expired()
+                    handled += 1
+
+            # Wait for ACKs when the window is full or nothing is left to send
+            ack_batches = self.acks.drain()
+            if not ack_batches and in_flight and (len(in_flight) >= self.window or limited or
+                                                  (end_of_file and not pending)):
+                oldest = next(iter(in_flight.values()))
+                wait = max(0.0, oldest.last_sent + self.rtt.timeout() - time.perf_counter())
+                stage.done(start, handled)
+                try:
+                    ack_batches = [self.acks.get(timeout=wait)]
+                except queue.Empty:
+                    continue
+                start = time.perf_counter()
+                handled = 0
+            elif not ack_batches and limited:
+                # Window shut with nothing in flight, so no ACK is coming back on its own. Probe
+                # until the receiver re-advertises, in case its window update got lost
+                stage.done(start, handled)
+                try:
+                    ack_batches = [self.acks.get(timeout=persist)]
+                except queue.Empty:
+                    self.transmit(make_packet(PROBE, base))
+                    self.probes += 1
+                    persist = min(MAX_RTO, persist * 2)
+                    continue
+                start = time.perf_counter()
+                handled = 0
 
-def listen_for_acks(sock):
-    while True:
-        ack, _ = sock.recvfrom(1)
-        ack_queue.put(ack)
+            for received_at, acks in ack_batches:
+                for kind, acked, window, corrupt in acks:
+                    if self.sizer:
+                        self.sizer.report(corrupt)
+                    if kind == ABORT:
+                        self.abort(acked)
+                    if kind != ACK or acked < base:
+                        continue
+                    updated = window != self.peer_window
+                    self.peer_window = window
+                    if window:
+                        persist = self.rtt.timeout()
+                    if acked > base:
+                        base = self.acked = acked
+                        duplicates = 0
+                        self.rtt.progress()
+                        newest = None
+                        clean = True
+                        while in_flight:
+                            offset, entry = next(iter(in_flight.items()))
+                            if offset + entry.length > acked:
+                                break
+                            del in_flight[offset]
+                            newest = entry
+                            clean = clean and not entry.retransmitted
+                        # Karn: no sample once a resend is covered, packets parked behind a
+                        # hole would otherwise count the whole recovery as RTT
+                        if newest and clean:
+                            self.rtt.sample(received_at - newest.first_sent)
+                        if in_flight and acked < recover:
+                            # Partial ACK: the next hole was already in flight when the first
+                            # loss was seen, resend it now instead of waiting for its timer
+                            self.resend(next(iter(in_flight.values())), time.perf_counter())
+                    elif in_flight and acked == base and not updated:
+                        # A changed window means a window update, not a hint of loss
+                        duplicates += 1
+                        if duplicates == DUP_ACK_THRESHOLD:
+                            recover = next(reversed(in_flight))
+                            self.resend(next(iter(in_flight.values())), time.perf_counter())
+                handled += len(acks)
+            stage.done(start, handled)
+
+        stage.finish()
+        packetizer.join()
+        if self.packetize_error:
+            self.stopped.set()
+            raise self.packetize_error  # Failed after the last batch, e.g. storing to the packet cache
+        self.finish()
+
+    def resend(self, entry, now):
+        self.transmit(entry.packet)
+        if self.sizer:
+            self.sizer.sent(entry.length)
+        entry.last_sent = now
+        entry.retransmitted = True
+        self.retransmissions += 1
+
+    def finish(self):
+        #FIN carries the total length and digest, so its answer confirms the file in one round trip
+        fin_packet = make_packet(FIN, self.total, self.file_digest or self.digest.digest())
+        self.transmit(fin_packet)
+        resends = 0
+        while True:
+            try:
+                _, acks = self.acks.get(timeout=self.rtt.timeout())
+            except queue.Empty:
+                acks = None
+            else:
+                aborted = [acked for kind, acked, _, _ in acks if kind == ABORT]
+                if aborted:
+                    self.abort(aborted[0])  # Its writer failed at close, after the last data
+                answers = [kind for kind, acked, _, _ in acks if kind in (FIN_ACK, FIN_NAK) and acked == self.total]
+                if FIN_ACK in answers:
+                    self.confirmed = True
+                    break
+                if not answers:
+                    continue  # Late data ACKs, keep waiting
+                # FIN_NAK: the FIN's digest may have been damaged on the way, only a NAK to every resend is final
+                self.confirmed = False
+            if resends == FIN_RETRIES:
+                break
+            resends += 1  # Only a resend spends a try, late data ACKs arriving meanwhile do not
+            self.transmit(fin_packet)
+            if acks is None:
+                self.rtt.expired()
+        self.stopped.set()
+        if self.ack_thread.is_alive():
+            self.ack_thread.join()
+
+    def abort(self, acked):
+        self.stopped.set()
+        if self.ack_thread.is_alive():
+            self.ack_thread.join()  # Done with the socket before the caller closes it
+        raise ConnectionAbortedError(f"receiver aborted the transfer after {acked} bytes")
+
+    def queues(self):
+        return [self.packets, self.acks]
+
+def send_file(filename, sock, addr):
+    global retransmissions, pipeline_stats, confirmed
+    sender = PipelinedSender(sock, addr, cache=shared_cache(PACKET_CACHE, PACKET_CACHE_BUDGET))
+    counters = udp_counters()
+    with open(filename, "rb") as f:
+        sender.send(f)
+    retransmissions = sender.retransmissions
+    confirmed = sender.confirmed
+    pipeline_stats = stats(sender.stages, sender.queues())
+    pipeline_stats["buffers"] = sender.buffers
+    pipeline_stats["pacing_wait"] = sender.pacer.waited
+    pipeline_stats["zero_window_probes"] = sender.probes
+    pipeline_stats["packet_size"] = sender.packet_size
+    pipeline_stats["size_probes"] = sender.size_probes
+    if sender.sizer:
+        pipeline_stats["adaptive_size"] = sender.sizer.stats()
+    pipeline_stats["confirmed"] = sender.confirmed
+    if sender.cache:
+        pipeline_stats["packet_cache"] = dict(sender.cache.stats(), hit=sender.cache_hit)
+    pipeline_stats["kernel_drops"] = counter_delta(counters, udp_counters())
+    if sender.confirmed:
+        print("EOF ACK received. File transfer complete.")
+    elif sender.confirmed is None:
+        print(f"No EOF ACK after {FIN_RETRIES} resends, giving up.")  # Receiver gone or path down
+    else:
+        print("EOF ACK received, but the receiver's length or digest does not match!")
+    report(sender.stages, sender.queues())
+    print(f"Socket buffers: {sender.buffers}, paced at {PACING_RATE / 1e6:.1f} MB/s "
+          f"({sender.pacer.waits} waits, {sender.pacer.waited:.3f}s)")
+    report_drops(pipeline_stats["kernel_drops"])
+    print(f"Payload size: {sender.packet_size} bytes ({sender.size_probes} size probes)")
+    if sender.sizer and sender.sizer.resizes:
+        sizer = sender.sizer
+        print(f"Corruption resized payloads {sizer.resizes} times, down to {sizer.smallest} bytes, "
+              f"ending at {sizer.size} (bit-error rate {sizer.ber:.2e})")
+    if sender.cache:
+        print(f"Packet cache: {'hit' if sender.cache_hit else 'miss'} ({sender.cache.hits} hits, "
+              f"{sender.cache.misses} misses, {sender.cache.evictions} evictions)")
+    if sender.probes:
+        print(f"Zero-window probes: {sender.probes}")
 
 def main():
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     receiver_addr = (UDP_IP, UDP_PORT)
 
     filename = "image.jpg"
-    ack_thread = threading.Thread(target=listen_for_acks, args=(sock,))
-    ack_thread.daemon = True
-    ack_thread.start()
-
-    send_thread = threading.Thread(target=send_file, args=(filename, sock, receiver_addr))
-    send_thread.start()
 
     start_time = time.time()
-    send_thread.join()
+    send_file(filename, sock, receiver_addr)
     end_time = time.time()
 
     sock.close()
 
     execution_time = end_time - start_time
     print(f"Execution time: {execution_time:.4f} seconds")
+    print(f"Retransmissions: {retransmissions}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
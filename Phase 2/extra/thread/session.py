@@ -0,0 +1,262 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+from sender import PipelinedSender
+from stream import IncompleteTransfer, receive
+
+#Many files over one long-lived transfer. A Session keeps a single PipelinedSender running and
+#feeds it records back to back, so the size probe, the RTT estimate, the window and the FIN
+#handshake are paid once per session instead of once per file:
+#
+#   RECORD (stream id, data length, name length) | name | data | SHA-256 of data
+#
+#The receiver splits the byte stream back into files as it arrives and checks each digest on the
+#spot; the FIN at close still confirms the session as a whole. A file counts as delivered once the
+#cumulative ACK has passed the end of its record.
+
+RECORD = struct.Struct("!IQH")  # stream id, data length, name length
+DIGEST_SIZE = 32
+READ_SIZE = 1024 * 1024  # Bytes read from a file per write into the session
+BUFFERED = 8 * 1024 * 1024  # Bytes queued ahead of the packetizer before send_file blocks
+WAIT_POLL = 0.001
+
+class LiveReader:
+    """Byte queue between writers and the packetizer; read() blocks until data arrives or close()."""
+
+    def __init__(self, limit=BUFFERED):
+        self.limit = limit
+        self.chunks = deque()
+        self.buffered = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def write(self, data):
+        with self.cond:
+            while self.buffered >= self.limit and not self.closed:
+                self.cond.wait()
+            if self.closed:
+                raise ValueError("session is closed")
+            self.chunks.append(memoryview(data))
+            self.buffered += len(data)
+            self.cond.notify_all()
+
+    def ready(self):
+        return bool(self.buffered) or self.closed
+
+    def read(self, size):
+        with self.cond:
+            while not self.chunks and not self.closed:
+                self.cond.wait()
+            parts = []
+            while self.chunks and size > 0:
+                chunk = self.chunks.popleft()
+                if len(chunk) > size:
+                    self.chunks.appendleft(chunk[size:])
+                    chunk = chunk[:size]
+                parts.append(chunk)
+                size -= len(chunk)
+                self.buffered -= len(chunk)
+            self.cond.notify_all()
+            return b"".join(parts)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class Session:
+    """Long-lived sender; send_file() queues a file and returns its stream id, wait() its delivery."""
+
+    def __init__(self, addr, sock=None):
+        self.own_socket = sock is None
+        self.sock = sock or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sender = PipelinedSender(self.sock, addr)
+        self.reader = LiveReader()
+        self.lock = threading.Lock()  # One record at a time, records must not interleave
+        self.next_id = 1
+        self.offset = 0  # Session bytes queued so far
+        self.ends = {}  # Stream id -> session offset just past its record
+        self.thread = threading.Thread(target=self.sender.send, args=(self.reader,), daemon=True)
+        self.thread.start()
+
+    def send_file(self, path, name=None):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            return self.send_stream(f, size, name or os.path.basename(path))
+
+    def send_bytes(self, data, name):
+        return self.send_stream(io.BytesIO(data), len(data), name)
+
+    def send_stream(self, f, size, name):
+        #Exactly size bytes of f become one record
+        encoded = name.encode()
+        with self.lock:
+            stream_id = self.next_id
+            self.next_id += 1
+            self.reader.write(RECORD.pack(stream_id, size, len(encoded)) + encoded)
+            digest = hashlib.sha256()
+            left = size
+            while left:
+                chunk = f.read(min(READ_SIZE, left))
+                if not chunk:
+                    raise ValueError(f"{name} ended {left} bytes short of the {size} announced")
+                digest.update(chunk)
+                self.reader.write(chunk)
+                left -= len(chunk)
+            self.reader.write(digest.digest())
+            self.offset += RECORD.size + len(encoded) + size + DIGEST_SIZE
+            self.ends[stream_id] = self.offset
+        return stream_id
+
+    def delivered(self, stream_id):
+        return self.sender.acked >= self.ends[stream_id]
+
+    def wait(self, stream_id, timeout=None):
+        """True once the receiver has ACKed the whole record, False on timeout."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not self.delivered(stream_id):
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            time.sleep(WAIT_POLL)
+        return True
+
+    def close(self):
+        """Ends the session with the FIN handshake, returns whether the receiver confirmed it."""
+        self.reader.close()
+        self.thread.join()
+        if self.own_socket:
+            self.sock.close()
+        return self.sender.confirmed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SessionDemux:
+    """Splits a session's byte stream back into files, fed in chunks of any size."""
+
+    def __init__(self, directory, on_file=None):
+        self.directory = directory
+        self.on_file = on_file  # Called with (stream id, path, digest matched) as each file completes
+        self.buffer = bytearray()
+        self.current = None  # [stream id, path, bytes left, file, digest, length] of the record being read
+        self.files = []  # (stream id, path, length, digest matched)
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        while True:
+            if self.current is None:
+                if len(self.buffer) < RECORD.size:
+                    return
+                stream_id, length, name_length = RECORD.unpack_from(self.buffer)
+                if len(self.buffer) < RECORD.size + name_length:
+                    return
+                # A name that is not UTF-8 still gets a file, the record must not end the session
+                name = bytes(self.buffer[RECORD.size:RECORD.size + name_length]).decode(errors="replace")
+                del self.buffer[:RECORD.size + name_length]
+                self.start(stream_id, name, length)
+            elif self.current[2]:
+                if not self.buffer:
+                    return
+                data = bytes(self.buffer[:self.current[2]])
+                del self.buffer[:len(data)]
+                if self.current[3]:
+                    self.current[3].write(data)
+                self.current[4].update(data)
+                self.current[2] -= len(data)
+            else:
+                if len(self.buffer) < DIGEST_SIZE:
+                    return
+                expected = bytes(self.buffer[:DIGEST_SIZE])
+                del self.buffer[:DIGEST_SIZE]
+                self.finish(expected)
+
+    def start(self, stream_id, name, length):
+        # Names come off the wire, keep them inside the directory; "." and ".." would name the directory itself
+        name = os.path.basename(name)
+        if name in ("", ".", ".."):
+            name = f"stream-{stream_id}"
+        path = os.path.join(self.directory, name)
+        try:
+            f = open(path + ".part", "wb")
+        except (OSError, ValueError) as e:  # ValueError: a NUL byte in the name
+            print(f"Cannot write {path}: {e}")
+            f = None  # The record is still read to its end, the file just fails
+        self.current = [stream_id, path, length, f, hashlib.sha256(), length]
+
+    def finish(self, expected):
+        #One bad file reports matched=False, it must not take the rest of the session with it
+        stream_id, path, _, f, digest, length = self.current
+        matched = f is not None and digest.digest() == expected
+        if f:
+            f.close()
+            try:
+                if matched:
+                    os.replace(path + ".part", path)
+                else:
+                    os.remove(path + ".part")
+            except OSError as e:
+                print(f"Cannot finish {path}: {e}")
+                matched = False
+                with contextlib.suppress(OSError):
+                    os.remove(path + ".part")
+        self.files.append((stream_id, path, length, matched))
+        self.current = None
+        if self.on_file:
+            self.on_file(stream_id, path, matched)
+
+def receive_session(directory, addr, on_file=None, sock=None):
+    """Receive one session's files into directory, returns the SessionDemux once the FIN is in."""
+    os.makedirs(directory, exist_ok=True)
+    demux = SessionDemux(directory, on_file)
+    receiver = receive(demux.feed, addr, sock)
+    if not receiver.complete:
+        raise IncompleteTransfer("length or digest in FIN does not match the session")
+    return demux
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send many files over one pipelined session.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    send = commands.add_parser("send")
+    send.add_argument("host")
+    send.add_argument("port", type=int)
+    send.add_argument("paths", nargs="+")
+    recv = commands.add_parser("recv")
+    recv.add_argument("port", type=int)
+    recv.add_argument("directory")
+    recv.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    if args.command == "send":
+        with contextlib.redirect_stdout(io.StringIO()):
+            session = Session((args.host, args.port))
+            for path in args.paths:
+                session.send_file(path)
+            confirmed = session.close()
+        print(f"Sent {len(args.paths)} files in {time.time() - start:.4f} seconds, "
+              f"{session.sender.retransmissions} retransmissions")
+        return 0 if confirmed else 1
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            demux = receive_session(args.directory, (args.host, args.port))
+        except IncompleteTransfer as e:
+            print(e)
+            return 1
+    bad = [path for _, path, _, matched in demux.files if not matched]
+    print(f"Received {len(demux.files)} files into {args.directory}" + (f", {len(bad)} failed their digest" if bad else ""))
+    return 1 if bad else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import math
+import random
+
+#Payload size that maximises goodput on a channel with random bit errors. A datagram of b bits
+#survives with probability (1 - BER)^b, so big packets waste less on headers but lose more to
+#corruption. The receiver reports its running count of checksum failures in every ACK, the sender
+#turns that into a bit-error rate and picks the size with the best expected efficiency.
+
+EPOCH_PACKETS = 128  # Packets sent between estimates
+SMOOTHING = 0.25  # Weight of the newest estimate in the running BER
+SIZE_STEP = 64  # Sizes are rounded down to this, so tiny BER changes do not reshuffle every packet
+COUNTER_MASK = 0xFFFFFFFF  # The corrupt count travels as a 32-bit field and wraps
+
+def optimal_size(ber, overhead, minimum, maximum):
+    """Payload bytes maximising size / (size + overhead) * (1 - ber) ** (8 * (size + overhead)).
+
+    Setting the derivative of the log to zero gives size^2 + overhead*size - overhead/q = 0
+    with q = -8 * ln(1 - ber), the bit-error cost per byte.
+    """
+    if ber <= 0:
+        return maximum
+    q = -8 * math.log1p(-min(ber, 0.5))
+    size = (-overhead + math.sqrt(overhead * overhead + 4 * overhead / q)) / 2
+    size = int(size) // SIZE_STEP * SIZE_STEP
+    return max(minimum, min(maximum, size))
+
+def flip_bits(data, ber):
+    #Bit-error channel for tests: a packet is hit with the probability that any of its bits flips
+    if not data or random.random() >= 1 - (1 - ber) ** (8 * len(data)):
+        return data
+    corrupted = bytearray(data)
+    bit = random.randrange(8 * len(data))
+    corrupted[bit // 8] ^= 1 << (bit % 8)
+    return bytes(corrupted)
+
+class PayloadSizer:
+    """Tracks the receiver's checksum failures and the payload size they call for."""
+
+    def __init__(self, minimum, maximum, overhead):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.overhead = overhead  # Bytes per datagram beyond the payload, headers of every layer
+        self.size = maximum
+        self.ber = 0.0
+        self.reported = None  # Last corrupt count from the receiver
+        self.packets = 0
+        self.bytes = 0
+        self.corrupt = 0
+        self.smallest = maximum
+        self.resizes = 0
+
+    def sent(self, length):
+        self.packets += 1
+        self.bytes += length + self.overhead
+
+    def report(self, count):
+        #Cumulative count from an ACK; reordered ACKs carry older counts and are skipped
+        if self.reported is not None:
+            new = (count - self.reported) & COUNTER_MASK
+            if new > COUNTER_MASK // 2:
+                return
+            self.corrupt += new
+        self.reported = count
+        if self.packets >= EPOCH_PACKETS:
+            self.estimate()
+
+    def estimate(self):
+        failed = min(self.corrupt / self.packets, 1 - 1 / (self.packets + 1))
+        bits = 8 * self.bytes / self.packets  # Average datagram, in bits
+        sample = -math.expm1(math.log1p(-failed) / bits)  # 1 - (1 - failed)^(1/bits)
+        self.ber += SMOOTHING * (sample - self.ber)
+        size = optimal_size(self.ber, self.overhead, self.minimum, self.maximum)
+        if size != self.size:
+            self.size = size
+            self.smallest = min(self.smallest, size)
+            self.resizes += 1
+        self.packets = self.bytes = self.corrupt = 0
+
+    def stats(self):
+        return {"payload_size": self.size, "smallest": self.smallest, "resizes": self.resizes,
+                "bit_error_rate": self.ber}
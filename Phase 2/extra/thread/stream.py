@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import contextlib
+import queue
+import socket
+import sys
+import threading
+
+from pipeline import QUEUE_DEPTH
+from receiver import PipelinedReceiver, bind
+from sender import PipelinedSender
+from writer import CallbackWriter
+
+#Library entry points for the pipelined transport, for callers that do not want to stage
+#payloads as image.jpg/received.jpg. Every source is read one packet at a time and every sink is
+#fed from the write-behind buffer, so memory stays bounded whatever the transfer size.
+#
+#   send_stream(chunks, ("127.0.0.1", 5005))          for chunk in recv_stream(("127.0.0.1", 5005)):
+#   send_stream(sys.stdin.buffer, addr)                    ...
+#   send_bytes(b"payload", addr)                       data = recv_bytes(addr)
+
+class IncompleteTransfer(ConnectionError):
+    """The receiver got a FIN whose length or digest does not match the data it received."""
+
+class IterableReader:
+    """read(n) over an iterable of bytes-like objects, holding at most one of them at a time."""
+
+    def __init__(self, buffers):
+        self.buffers = iter(buffers)
+        self.current = memoryview(b"")
+
+    def read(self, size):
+        parts = []
+        while size > 0:
+            if not self.current:
+                buffer = next(self.buffers, None)
+                if buffer is None:
+                    break
+                self.current = memoryview(buffer).cast("B")
+                continue
+            part = self.current[:size]
+            self.current = self.current[size:]
+            parts.append(part)
+            size -= len(part)
+        return b"".join(parts)
+
+def send_stream(source, addr, sock=None):
+    """Send one transfer from a file-like object (anything with read(n), pipes included) or an
+    iterable of bytes-like objects. Returns the PipelinedSender; its confirmed flag says whether
+    the receiver matched the length and digest."""
+    reader = source if hasattr(source, "read") else IterableReader(source)
+    own_socket = sock is None
+    if own_socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sender = PipelinedSender(sock, addr)
+        sender.send(reader)
+    finally:
+        if own_socket:
+            sock.close()
+    return sender
+
+def send_bytes(data, addr, sock=None):
+    return send_stream([data], addr, sock)
+
+def receive(callback, addr, sock=None):
+    """Receive one transfer on addr, calling callback(chunk) with the data in order.
+
+    Blocks until the sender's FIN has been answered and the linger period is over. Returns the
+    PipelinedReceiver; a slow callback shrinks the advertised window instead of losing data.
+    """
+    own_socket = sock is None
+    if own_socket:
+        sock, _ = bind(addr)
+    try:
+        receiver = PipelinedReceiver(sock, writer=CallbackWriter(callback))
+        receiver.run()
+    finally:
+        if own_socket:
+            sock.close()
+    return receiver
+
+def recv_stream(addr, sock=None):
+    """Iterator over the chunks of one transfer, ends once the FIN is answered and the linger is over.
+
+    Raises IncompleteTransfer at the end if the FIN's length or digest did not match.
+    """
+    chunks = queue.Queue(QUEUE_DEPTH)  # Full queue blocks the writer, which closes the window
+    done = object()
+    state = {}
+
+    def run():
+        try:
+            receiver = PipelinedReceiver(sock, writer=CallbackWriter(chunks.put, on_close=lambda: chunks.put(done)))
+            state["receiver"] = receiver
+            receiver.run()
+        except BaseException as e:
+            state["error"] = e
+            chunks.put(done)
+
+    own_socket = sock is None
+    if own_socket:
+        sock, _ = bind(addr)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    finished = False
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        # The last chunk arrives before the FIN_ACK goes out, a caller that exits right after
+        # returning would otherwise leave the sender without an answer
+        thread.join()
+        finished = True
+    finally:
+        if own_socket and finished:
+            sock.close()
+        elif own_socket:  # Abandoned mid-transfer, let the receiver wind down on its own
+            threading.Thread(target=lambda: (thread.join(), sock.close()), daemon=True).start()
+    if "error" in state:
+        raise state["error"]
+    if not state["receiver"].complete:
+        raise IncompleteTransfer("length or digest in FIN does not match the received data")
+
+def recv_bytes(addr, sock=None):
+    return b"".join(recv_stream(addr, sock))
+
+async def arecv_stream(addr, sock=None):
+    """Async iterator version of recv_stream, the transport itself keeps running on threads."""
+    chunks = recv_stream(addr, sock)
+    done = object()
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+def main(argv=None):
+    #Pipe-friendly front end: `stream.py send HOST PORT < data`, `stream.py recv PORT > data`
+    parser = argparse.ArgumentParser(description="Send stdin to, or receive stdout from, the pipelined transport.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    send = commands.add_parser("send")
+    send.add_argument("host")
+    send.add_argument("port", type=int)
+    recv = commands.add_parser("recv")
+    recv.add_argument("port", type=int)
+    recv.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args(argv)
+
+    if args.command == "send":
+        with contextlib.redirect_stdout(sys.stderr):
+            sender = send_stream(sys.stdin.buffer, (args.host, args.port))
+        return 0 if sender.confirmed else 1
+    out = sys.stdout.buffer
+    with contextlib.redirect_stdout(sys.stderr):  # Progress messages must not mix with the data
+        receiver = receive(out.write, (args.host, args.port))
+        out.flush()
+        if not receiver.complete:
+            print("length or digest in FIN does not match the received data")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+#Write-behind stage for the receiver: the reorder stage hands over in-order chunks and returns
+#immediately, a background thread gathers them into large pwritev() calls.
+#ACKs therefore only wait for memory, not for the disk.
+
+BUFFER_LIMIT = 4 * 1024 * 1024  # Bytes accepted but not yet written, a full buffer blocks the caller
+MAX_IOVECS = 1024  # IOV_MAX on Linux
+FSYNC_NONE = "none"
+FSYNC_MB = "mb"  # fsync every fsync_mb megabytes and at close
+FSYNC_CLOSE = "close"
+
+class WriteBehind:
+    def __init__(self, fd, limit=BUFFER_LIMIT, fsync_policy=FSYNC_NONE, fsync_mb=8):
+        if fsync_policy not in (FSYNC_NONE, FSYNC_MB, FSYNC_CLOSE):
+            raise ValueError(f"unknown fsync policy {fsync_policy!r}")
+        self.fd = fd
+        self.limit = limit
+        self.fsync_policy = fsync_policy
+        self.fsync_bytes = fsync_mb * 1024 * 1024
+        self.cond = threading.Condition()
+        self.chunks = []  # (offset, data, queued_at), always contiguous and in order
+        self.buffered = 0
+        self.closing = False
+        self.error = None
+        # Stats
+        self.writes = 0
+        self.written = 0
+        self.write_time = 0.0
+        self.fsyncs = 0
+        self.fsync_time = 0.0
+        self.stalled = 0.0  # Time callers spent blocked on a full buffer
+        self.latency_total = 0.0  # Queued -> on disk, summed per chunk
+        self.latency_max = 0.0
+        self.latency_count = 0
+        self.unsynced = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, offset, data):
+        with self.cond:
+            if self.buffered + len(data) > self.limit and self.buffered:
+                start = time.perf_counter()
+                while self.buffered + len(data) > self.limit and self.buffered and not self.error:
+                    self.cond.wait()
+                self.stalled += time.perf_counter() - start
+            if self.error:
+                raise self.error
+            self.chunks.append((offset, data, time.perf_counter()))
+            self.buffered += len(data)
+            self.cond.notify_all()
+
+    def free_space(self):
+        #How much more the buffer takes before write() blocks
+        return max(0, self.limit - self.buffered)
+
+    def _take(self):
+        #Called with the lock held, returns the next run of chunks to write
+        count = min(len(self.chunks), MAX_IOVECS)
+        run = self.chunks[:count]
+        del self.chunks[:count]
+        return run
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.chunks and not self.closing:
+                    self.cond.wait()
+                if not self.chunks and self.closing:
+                    return
+                run = self._take()
+            try:
+                self._write_run(run)
+            except Exception as e:  # Disk errors, but also whatever a CallbackWriter's callback raises
+                with self.cond:
+                    self.error = e
+                    self.cond.notify_all()
+                return
+            size = sum(len(data) for _, data, _ in run)
+            with self.cond:
+                self.buffered -= size
+                self.cond.notify_all()
+
+    def _write_run(self, run):
+        offset = run[0][0]
+        buffers = [data for _, data, _ in run]
+        size = sum(len(data) for data in buffers)
+        start = time.perf_counter()
+        self.output(offset, buffers, size)
+        now = time.perf_counter()
+        self.writes += 1
+        self.written += size
+        self.write_time += now - start
+        for _, _, queued_at in run:
+            latency = now - queued_at
+            self.latency_total += latency
+            self.latency_count += 1
+            if latency > self.latency_max:
+                self.latency_max = latency
+
+        self.unsynced += size
+        if self.fsync_policy == FSYNC_MB and self.unsynced >= self.fsync_bytes:
+            self.sync()
+
+    def output(self, offset, buffers, size):
+        done = 0
+        while done < size:
+            if hasattr(os, "pwritev"):
+                n = os.pwritev(self.fd, buffers, offset + done)
+            else:
+                n = os.pwrite(self.fd, b"".join(buffers), offset + done)
+            done += n
+            if done < size:
+                buffers = [memoryview(b"".join(buffers))[n:]]  # Short write, retry the rest
+
+    def sync(self):
+        start = time.perf_counter()
+        os.fsync(self.fd)
+        self.fsync_time += time.perf_counter() - start
+        self.fsyncs += 1
+        self.unsynced = 0
+
+    def close(self):
+        """Flush everything, fsync as the policy asks and stop the thread."""
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        self.thread.join()
+        if self.error:
+            raise self.error
+        if self.fsync_policy != FSYNC_NONE and self.unsynced:
+            self.sync()
+
+    def stats(self):
+        return {
+            "writes": self.writes,
+            "bytes": self.written,
+            "bytes_per_write": self.written / self.writes if self.writes else 0,
+            "write_time": self.write_time,
+            "fsyncs": self.fsyncs,
+            "fsync_time": self.fsync_time,
+            "stalled": self.stalled,
+            "storage_latency_avg": self.latency_total / self.latency_count if self.latency_count else 0.0,
+            "storage_latency_max": self.latency_max,
+        }
+
+class CallbackWriter(WriteBehind):
+    """Same write-behind stage, but in-order data goes to callback(bytes) instead of a file.
+
+    A slow callback fills the buffer like a slow disk would, so it closes the advertised window.
+    on_close runs once everything has been handed over.
+    """
+
+    def __init__(self, callback, limit=BUFFER_LIMIT, on_close=None):
+        self.callback = callback
+        self.on_close = on_close
+        super().__init__(None, limit)
+
+    def output(self, offset, buffers, size):
+        self.callback(buffers[0] if len(buffers) == 1 else b"".join(buffers))
+
+    def close(self):
+        closing = not self.closing
+        super().close()
+        if closing and self.on_close:
+            self.on_close()
@@ -1,9 +1,13 @@
 import socket
 import struct
+import hashlib
 
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
 PACKET_SIZE = 1024
+TIMEOUT = 1.0  # The sender's, runner --timeout sets it on both sides
+FIN_MAX_WAIT = 0.5  # Longest the sender waits between EOFs while TIMEOUT is shorter, as in sender.py
+FIN_INFO = struct.Struct("!Q32s")  # EOF payload: total file length, SHA-256 of the file
 
 def calculate_checksum(data):
 #Custom 16-bit checksum
@@ -19,6 +23,30 @@ def is_corrupt(data, received_checksum):
     #Verify if checksum is correct
     return received_checksum != calculate_checksum(data)
 
+def fin_matches(data, received, digest):
+    #EOF carries the sender's length and digest, completion is confirmed without another round trip
+    if len(data) != FIN_INFO.size:
+        return False
+    total, expected = FIN_INFO.unpack(data)
+    return total == received and expected == digest.digest()
+
+def make_eof_ack(matches, checksum):
+    #The verdict sits behind its own checksum, a flipped bit makes the sender resend EOF instead of misreading it
+    verdict = bytes([matches])
+    return struct.pack("!B2s", 255, checksum(verdict)) + verdict
+
+def linger(sock, eof_ack):
+    #TIME_WAIT: a lost EOF ACK makes the sender resend EOF, answer every copy until it goes quiet.
+    #The sender waits at most max(TIMEOUT, FIN_MAX_WAIT) between two EOFs, twice that covers one lost EOF ACK
+    sock.settimeout(2 * max(TIMEOUT, FIN_MAX_WAIT))
+    while True:
+        try:
+            packet, addr = sock.recvfrom(PACKET_SIZE + 3)
+        except socket.timeout:
+            break
+        if packet[:1] == b"\xff":
+            sock.sendto(eof_ack, addr)
+
 def main():
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((UDP_IP, UDP_PORT))
@@ -27,6 +55,7 @@ def main():
     last_ack = struct.pack("!B", 1 - expected_seq_num)  # Default last ACK
 
     with open("received.jpg", "wb") as f:
+        digest = hashlib.sha256()
         while True:
             print("Waiting for packets...")
             packet, addr = sock.recvfrom(PACKET_SIZE + 3)
@@ -37,8 +66,12 @@ def main():
 
             # Check for EOF (End of File) signal
             if seq_num == 255:
+                if is_corrupt(data, received_checksum):
+                    print("Corrupt EOF packet, waiting for the sender to resend it")
+                    continue
                 print("EOF received. Sending EOF ACK...")
-                sock.sendto(struct.pack("!B", 255), addr)  # Send EOF ACK
+                eof_ack = make_eof_ack(fin_matches(data, f.tell(), digest), calculate_checksum)
+                sock.sendto(eof_ack, addr)
                 break  # Exit loop and close file
 
             print(f"Received packet {seq_num}, expected {expected_seq_num}")
@@ -46,6 +79,7 @@ def main():
 
             if not is_corrupt(data, received_checksum) and seq_num == expected_seq_num:
                 f.write(data)
+                digest.update(data)
                 print(f"Packet {seq_num} received correctly, sending ACK {seq_num}")
                 ack_packet = struct.pack("!B", seq_num)  # Send ACK for the received packet
                 expected_seq_num = 1 - expected_seq_num  # Flip sequence number
@@ -55,6 +89,7 @@ def main():
 
             sock.sendto(last_ack, addr)
 
+    linger(sock, eof_ack)
     sock.close()  # Close socket after transmission is complete
 
 if __name__ == "__main__":
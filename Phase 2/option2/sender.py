@@ -1,14 +1,21 @@
 import socket
 import struct
+import hashlib
 import time
 import random
 
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
 PACKET_SIZE = 1024
+TIMEOUT = 1.0  # Seconds to wait for an ACK before resending
+FIN_RETRIES = 20  # EOF resends before giving up on the EOF ACK
+FIN_MIN_WAIT = 0.01  # First wait for the EOF ACK when the timeout passed in is shorter
+FIN_MAX_WAIT = 0.5  # Each resend doubles the wait up to this, or up to the timeout when that is longer
+FIN_INFO = struct.Struct("!Q32s")  # EOF payload: total file length, SHA-256 of the file
 
 retransmissions = 0
 errors = 0
+confirmed = None  # Whether the receiver confirmed the file's length and digest, set by main
 
 def calculate_checksum(data):
     #Custom 16-bit checksum similar to UDP#
@@ -36,33 +43,49 @@ def introduce_ack_error(ack_seq, error_rate):
         return corrupted_ack
     return ack_seq
 
+def close_transfer(sock, addr, total, digest, timeout):
+    """Send EOF carrying the file's length and digest, returns True once the receiver confirms both."""
+    eof_packet = make_packet(255, FIN_INFO.pack(total, digest.digest()))
+    matched, mismatched = make_packet(255, b"\x01"), make_packet(255, b"\x00")  # The receiver's two EOF ACKs
+    sock.sendto(eof_packet, addr)
+    print("EOF packet sent. Waiting for EOF ACK...")
+    wait = max(timeout, FIN_MIN_WAIT)
+    resends = 0
+    while True:
+        sock.settimeout(wait)
+        try:
+            ack, _ = sock.recvfrom(len(matched))
+        except socket.timeout:
+            ack = None
+        if ack == matched:
+            print("EOF ACK received. File transfer complete.")
+            return True
+        if ack == mismatched:
+            print("EOF ACK received, but the receiver's length or digest does not match!")
+            return False
+        if ack is not None and ack[:1] != b"\xff":
+            print(f"Unexpected ACK {ack.hex()}, waiting for EOF ACK...")  # Stale data ACK, keep reading
+            continue
+        if resends == FIN_RETRIES:
+            break
+        resends += 1  # Only a resend spends a try, stale ACKs arriving meanwhile do not
+        wait = min(wait * 2, max(timeout, FIN_MAX_WAIT))  # A slow EOF ACK is not a lost one
+        print("Timeout! Resending EOF packet." if ack is None else "Corrupt EOF ACK! Resending EOF packet.")
+        sock.sendto(eof_packet, addr)
+    print(f"No EOF ACK after {FIN_RETRIES} resends, giving up.")  # Receiver is gone or the path is down
+    return False
+
 def send_file(filename, sock, addr, error_rate):
     global retransmissions
     with open(filename, "rb") as f:
+        digest = hashlib.sha256()
         seq_num = 0  # Sequence numbers: 0 or 1
 
         while True:
             chunk = f.read(PACKET_SIZE)
+            digest.update(chunk)
             if not chunk:
-                # Send EOF packet with special seq_num = 255
-                eof_packet = struct.pack("!B2s", 255, b'\x00\x00')  # 255 indicates EOF
-                sock.sendto(eof_packet, addr)
-                print("EOF packet sent. Waiting for EOF ACK...")
-
-                while True:
-                    try:
-                        sock.settimeout(1.0)  # Timeout for retransmission
-                        ack, _ = sock.recvfrom(1)  # Expect 1-byte EOF ACK
-                        ack_seq, = struct.unpack("!B", ack)
-                        
-                        if ack_seq == 255:
-                            print("EOF ACK received. File transfer complete.")
-                            return  # Exit function
-                        else:
-                            print(f"Unexpected ACK {ack_seq}, waiting for EOF ACK...")
-                    except socket.timeout:
-                        print("Timeout! Resending EOF packet.")
-                        sock.sendto(eof_packet, addr)
+                return close_transfer(sock, addr, f.tell(), digest, TIMEOUT)
 
             packet = make_packet(seq_num, chunk)
             while True:
@@ -70,7 +93,7 @@ def send_file(filename, sock, addr, error_rate):
                 print(f"Sent packet {seq_num}, waiting for ACK...")
                 
                 try:
-                    sock.settimeout(1.0)  # Timeout for retransmission
+                    sock.settimeout(TIMEOUT)  # Timeout for retransmission
                     ack, _ = sock.recvfrom(1)  # Expect 1-byte ACK
                     ack_seq, = struct.unpack("!B", ack)
 
@@ -89,6 +112,7 @@ def send_file(filename, sock, addr, error_rate):
                     retransmissions += 1
 
 def main():
+    global confirmed
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     receiver_addr = (UDP_IP, UDP_PORT)
 
@@ -99,7 +123,7 @@ def main():
     filename = "image.jpg"
 
     start_time = time.time()
-    send_file(filename, sock, receiver_addr, error_rate)
+    confirmed = send_file(filename, sock, receiver_addr, error_rate)
     end_time = time.time()
 
     sock.close()
@@ -110,6 +134,8 @@ def main():
     print(f"Execution time: {execution_time:.4f} seconds")
     print(f"Retransmissions: {retransmissions}")
     print(f"Errors Introduced: {errors}")
+    if not confirmed:
+        print("The receiver did not confirm the file!")
 
 if __name__ == "__main__":
     main()
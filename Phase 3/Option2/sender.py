@@ -1,5 +1,6 @@
 import socket
 import struct
+import hashlib
 import time
 import random
 
@@ -17,10 +18,15 @@ def calculate_checksum(data):
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
 PACKET_SIZE = 1024
+FIN_RETRIES = 20  # EOF resends before giving up on the EOF ACK
+FIN_MIN_WAIT = 0.01  # First wait for the EOF ACK when the timeout passed in is shorter
+FIN_MAX_WAIT = 0.5  # Each resend doubles the wait up to this, or up to the timeout when that is longer
+FIN_INFO = struct.Struct("!Q32s")  # EOF payload: total file length, SHA-256 of the file
 TIMEOUT = 0.05  # 50ms timeout
 ERROR_PROBABILITY = 0 #% chance of ACK bit-error
 
 retransmissions = 0
+confirmed = None  # Whether the receiver confirmed the file's length and digest, set by main
 
 def make_packet(seq_num, data):
 #Create packet with sequence number and custom checksum
@@ -40,27 +46,49 @@ def introduce_error(ack_packet):
         return bytes(ack_packet)
     return ack_packet
 
+def close_transfer(sock, addr, total, digest, timeout):
+    """Send EOF carrying the file's length and digest, returns True once the receiver confirms both."""
+    eof_packet = make_packet(255, FIN_INFO.pack(total, digest.digest()))
+    matched, mismatched = make_packet(255, b"\x01"), make_packet(255, b"\x00")  # The receiver's two EOF ACKs
+    sock.sendto(eof_packet, addr)
+    print("EOF packet sent. Waiting for EOF ACK...")
+    wait = max(timeout, FIN_MIN_WAIT)
+    resends = 0
+    while True:
+        sock.settimeout(wait)
+        try:
+            ack, _ = sock.recvfrom(len(matched))
+            ack = introduce_error(ack)  # Introduce error in ACK
+        except socket.timeout:
+            ack = None
+        if ack == matched:
+            print("EOF ACK received. File transfer complete.")
+            return True
+        if ack == mismatched:
+            print("EOF ACK received, but the receiver's length or digest does not match!")
+            return False
+        if ack is not None and ack[:1] != b"\xff":
+            print(f"Unexpected ACK {ack.hex()}, waiting for EOF ACK...")  # Stale data ACK, keep reading
+            continue
+        if resends == FIN_RETRIES:
+            break
+        resends += 1  # Only a resend spends a try, stale ACKs arriving meanwhile do not
+        wait = min(wait * 2, max(timeout, FIN_MAX_WAIT))  # A slow EOF ACK is not a lost one
+        print("Timeout! Resending EOF packet." if ack is None else "Corrupt EOF ACK! Resending EOF packet.")
+        sock.sendto(eof_packet, addr)
+    print(f"No EOF ACK after {FIN_RETRIES} resends, giving up.")  # Receiver is gone or the path is down
+    return False
+
 def send_file(filename, sock, addr):
     global retransmissions
     with open(filename, "rb") as f:
+        digest = hashlib.sha256()
         seq_num = 0
         while True:
             chunk = f.read(PACKET_SIZE)
+            digest.update(chunk)
             if not chunk:
-                eof_packet = struct.pack("!B2s", 255, b'\x00\x00')
-                sock.sendto(eof_packet, addr)
-                print("EOF packet sent. Waiting for EOF ACK...")
-                while True:
-                    try:
-                        sock.settimeout(TIMEOUT)
-                        ack, _ = sock.recvfrom(1)
-                        ack = introduce_error(ack)  # Introduce error in ACK
-                        if struct.unpack("!B", ack)[0] == 255:
-                            print("EOF ACK received. Transfer complete.")
-                            return
-                    except socket.timeout:
-                        print("Timeout! Resending EOF packet.")
-                        sock.sendto(eof_packet, addr)
+                return close_transfer(sock, addr, f.tell(), digest, TIMEOUT)
 
             packet = make_packet(seq_num, chunk)
             while True:
@@ -87,6 +115,7 @@ def send_file(filename, sock, addr):
                     break
 
 def main():
+    global confirmed
     global ERROR_PROBABILITY
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     receiver_addr = (UDP_IP, UDP_PORT)
@@ -95,10 +124,12 @@ def main():
     ERROR_PROBABILITY = int(input("Enter error rate: ")) / 100
 
     start_time = time.time()
-    send_file(filename, sock, receiver_addr)
+    confirmed = send_file(filename, sock, receiver_addr)
     print(f"Execution time: {time.time() - start_time:.4f} seconds")
     print(f"Retransmissions: {retransmissions}")
     sock.close()
+    if not confirmed:
+        print("The receiver did not confirm the file!")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
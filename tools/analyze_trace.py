@@ -0,0 +1,154 @@
+"""Offline analysis of traces written by tools/tracing.py.
+
+    python tools/analyze_trace.py sender.trace --receiver receiver.trace --plot run1
+
+Loads a trace into NumPy arrays, prints the event counts, RTT percentiles and
+a breakdown of why packets were retransmitted, and with --plot saves a
+time-sequence graph, the RTT series and the cause breakdown as PNGs.
+matplotlib is only needed for --plot.
+"""
+import argparse
+import json
+
+import numpy as np
+
+import tracing
+
+DTYPE = np.dtype([("ns", "<u8"), ("event", "u1"), ("pad", "u1"), ("length", "<u4"),
+                  ("seq", "<u4"), ("offset", "<u8")])
+assert DTYPE.itemsize == tracing.RECORD.size
+
+
+def load(path):
+    """Return the trace as a structured array, timestamps left in ns."""
+    with open(path, "rb") as f:
+        magic, version, size = tracing.HEADER.unpack(f.read(tracing.HEADER.size))
+    if magic != tracing.MAGIC or size != DTYPE.itemsize:
+        raise ValueError(f"{path} is not an RDT trace (version {version})")
+    return np.fromfile(path, dtype=DTYPE, offset=tracing.HEADER.size)
+
+
+def events(records, *kinds):
+    return records[np.isin(records["event"], kinds)]
+
+
+def time_sequence(records):
+    #Seconds since the first event and byte offset, per event kind
+    start = records["ns"][0] if len(records) else 0
+    series = {}
+    for kind in (tracing.SEND, tracing.RETRANSMIT, tracing.ACK, tracing.TIMEOUT):
+        picked = events(records, kind)
+        series[tracing.EVENT_NAMES[kind]] = ((picked["ns"] - start) / 1e9, picked["offset"])
+    return series
+
+
+def rtt_series(records):
+    """RTT of each ACK against the latest transmission before it, in seconds."""
+    sent = events(records, tracing.SEND, tracing.RETRANSMIT)["ns"]
+    acks = events(records, tracing.ACK)["ns"]
+    if not len(sent) or not len(acks):
+        return np.empty(0), np.empty(0)
+    index = np.searchsorted(sent, acks, side="right") - 1
+    valid = index >= 0
+    start = records["ns"][0]
+    return (acks[valid] - start) / 1e9, (acks[valid] - sent[index[valid]]) / 1e9
+
+
+def retransmission_causes(sender, receiver=None):
+    """Count what preceded each retransmission.
+
+    From the sender trace alone a retransmission follows either a timeout or
+    an unexpected ACK.  With the receiver trace the timeouts are split further
+    by comparing both sides: datagrams that never arrived, datagrams the
+    receiver dropped or ignored, checksum failures and ACKs lost on the way back.
+    """
+    kinds = sender["event"]
+    retransmits = np.flatnonzero(kinds == tracing.RETRANSMIT)
+    previous = kinds[retransmits[retransmits > 0] - 1]
+    causes = {
+        "timeout": int(np.count_nonzero(previous == tracing.TIMEOUT)),
+        "unexpected_ack": int(np.count_nonzero(previous == tracing.ACK)),
+    }
+    if receiver is not None:
+        counts = np.bincount(receiver["event"], minlength=max(tracing.EVENT_NAMES) + 1)
+        sent_counts = np.bincount(kinds, minlength=max(tracing.EVENT_NAMES) + 1)
+        transmitted = sent_counts[tracing.SEND] + sent_counts[tracing.RETRANSMIT]
+        causes["data_lost"] = int(max(0, transmitted - counts[tracing.RECEIVE]))
+        causes["receiver_dropped"] = int(max(0, counts[tracing.RECEIVE] - counts[tracing.ACK_SENT]))
+        causes["corrupt"] = int(counts[tracing.CORRUPT])
+        causes["ack_lost"] = int(max(0, counts[tracing.ACK_SENT] - sent_counts[tracing.ACK]))
+    return causes
+
+
+def summarize(sender, receiver=None):
+    counts = np.bincount(sender["event"], minlength=max(tracing.EVENT_NAMES) + 1)
+    _, rtt = rtt_series(sender)
+    summary = {
+        "duration": float((sender["ns"][-1] - sender["ns"][0]) / 1e9) if len(sender) else 0.0,
+        "events": {name: int(counts[kind]) for kind, name in tracing.EVENT_NAMES.items() if counts[kind]},
+        "retransmission_causes": retransmission_causes(sender, receiver),
+    }
+    if len(rtt):
+        summary["rtt"] = {"p50": float(np.percentile(rtt, 50)), "p90": float(np.percentile(rtt, 90)),
+                          "p99": float(np.percentile(rtt, 99)), "max": float(rtt.max())}
+    if receiver is not None:
+        delivered = events(receiver, tracing.DELIVER)
+        summary["delivered_bytes"] = int(delivered["length"].sum())
+    return summary
+
+
+def plot(sender, summary, prefix):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+    styles = {"send": ("tab:blue", "."), "retransmit": ("tab:red", "x"),
+              "ack": ("tab:green", "|"), "timeout": ("black", "v")}
+    for name, (t, offset) in time_sequence(sender).items():
+        if len(t):
+            color, marker = styles[name]
+            ax.scatter(t, offset, s=6, c=color, marker=marker, label=name)
+    ax.set_xlabel("time (s)")
+    ax.set_ylabel("byte offset")
+    ax.set_title("Time-sequence graph")
+    ax.legend()
+    fig.savefig(f"{prefix}_sequence.png", dpi=120)
+    plt.close(fig)
+
+    t, rtt = rtt_series(sender)
+    fig, ax = plt.subplots(figsize=(10, 4))
+    ax.plot(t, rtt * 1e3, ".", markersize=3)
+    ax.set_xlabel("time (s)")
+    ax.set_ylabel("RTT (ms)")
+    ax.set_title("RTT series")
+    fig.savefig(f"{prefix}_rtt.png", dpi=120)
+    plt.close(fig)
+
+    causes = summary["retransmission_causes"]
+    fig, ax = plt.subplots(figsize=(7, 4))
+    ax.bar(list(causes), list(causes.values()))
+    ax.set_ylabel("count")
+    ax.set_title("Retransmission causes")
+    fig.tight_layout()
+    fig.savefig(f"{prefix}_causes.png", dpi=120)
+    plt.close(fig)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze an RDT packet trace")
+    parser.add_argument("trace", help="sender-side trace")
+    parser.add_argument("--receiver", default=None, help="receiver-side trace of the same run")
+    parser.add_argument("--plot", default=None, metavar="PREFIX", help="save PREFIX_{sequence,rtt,causes}.png")
+    args = parser.parse_args(argv)
+
+    sender = load(args.trace)
+    receiver = load(args.receiver) if args.receiver else None
+    summary = summarize(sender, receiver)
+    print(json.dumps(summary, indent=2))
+    if args.plot:
+        plot(sender, summary, args.plot)
+
+
+if __name__ == "__main__":
+    main()
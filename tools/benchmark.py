@@ -0,0 +1,286 @@
+"""Sweep every Phase 2/3 option across error rate, timeout and file size.
+
+Each run gets a scratch directory holding the payload as image.jpg, a free
+UDP port, and a receiver + sender pair launched through tools/runner.py.
+Runs are spread across cores, repeated for confidence intervals, and written
+out as one CSV row per run plus a JSON file with the per-configuration
+aggregates.
+
+    python tools/benchmark.py --options "Phase 3" --error-rates 0,10,20 --repeats 5
+"""
+import argparse
+import concurrent.futures
+import csv
+import filecmp
+import glob
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNNER = os.path.join(REPO, "tools", "runner.py")
+# The GUI receiver is a Qt app without a main(), it can't be driven headless
+SKIP = ("extra/gui",)
+# Two-sided 95% t critical values by degrees of freedom, normal beyond 30
+T95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+       2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+       2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+METRICS = ("goodput", "wall_time", "cpu_time", "retransmissions", "drops", "errors", "allocated_bytes_per_packet",
+           "retained_bytes_per_packet")
+# Row fields that make up one configuration in the summary
+KEY = ("option", "error_rate", "timeout", "bytes")
+
+
+def discover_options():
+    #Every directory that has both a sender.py and a receiver.py
+    options = []
+    for sender in sorted(glob.glob(os.path.join(REPO, "Phase *", "**", "sender.py"), recursive=True)):
+        folder = os.path.dirname(sender)
+        name = os.path.relpath(folder, REPO).replace(os.sep, "/")
+        if os.path.exists(os.path.join(folder, "receiver.py")) and not any(s in name for s in SKIP):
+            options.append(name)
+    return options
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_size(text):
+    #"native" keeps the option's own image.jpg, otherwise 64K / 2M / 1000
+    text = text.strip()
+    if text == "native":
+        return None
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if text[-1].upper() in units:
+        return int(float(text[:-1]) * units[text[-1].upper()])
+    return int(text)
+
+
+def make_payload(size, folder, seed):
+    path = os.path.join(folder, f"payload_{size}.bin")
+    if not os.path.exists(path):
+        rng = random.Random(seed)
+        with open(path, "wb") as f:
+            f.write(rng.randbytes(size))
+    return path
+
+
+def runner_command(script, port, config, seed, ready, result):
+    command = [sys.executable, RUNNER, script, "--port", str(port),
+               "--error-rate", str(config["error_rate"]), "--delay-count", str(config["delay_count"]),
+               "--seed", str(seed), "--result", result]
+    if config["timeout"] is not None:
+        command += ["--timeout", str(config["timeout"])]
+    if ready:
+        command += ["--ready", ready]
+    return command
+
+
+def wait_for(path, limit):
+    deadline = time.monotonic() + limit
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def read_result(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_once(config, payload, scratch, run_timeout):
+    """Run one receiver/sender pair and return a flat result row."""
+    folder = os.path.join(REPO, config["option"])
+    run_dir = tempfile.mkdtemp(prefix="run_", dir=scratch)
+    shutil.copyfile(payload, os.path.join(run_dir, "image.jpg"))
+    ready = os.path.join(run_dir, "ready")
+    receiver_result = os.path.join(run_dir, "receiver.json")
+    sender_result = os.path.join(run_dir, "sender.json")
+    port = free_port()
+    seed = config["seed"]
+
+    row = dict(config)
+    row["bytes"] = os.path.getsize(payload)
+    row["ok"] = False
+    receiver = subprocess.Popen(
+        runner_command(os.path.join(folder, "receiver.py"), port, config, seed, ready, receiver_result),
+        cwd=run_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        if not wait_for(ready, 10):
+            row["failure"] = "receiver never bound"
+            return row
+        sender = subprocess.Popen(
+            runner_command(os.path.join(folder, "sender.py"), port, config, seed + 1, None, sender_result),
+            cwd=run_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            sender.wait(run_timeout)
+        except subprocess.TimeoutExpired:
+            sender.kill()
+            row["failure"] = "sender timed out"
+            return row
+        try:
+            receiver.wait(5)
+        except subprocess.TimeoutExpired:
+            receiver.kill()
+    finally:
+        if receiver.poll() is None:
+            receiver.kill()
+        receiver.wait()
+
+    sent = read_result(sender_result)
+    received = read_result(receiver_result)
+    if not sent:
+        row["failure"] = "sender crashed"
+        return row
+    received_path = os.path.join(run_dir, "received.jpg")
+    row["ok"] = os.path.exists(received_path) and filecmp.cmp(payload, received_path, shallow=False)
+    if row["ok"] and not sent.get("confirmed", True):  # An identical file still fails if the sender never heard so
+        row["ok"] = False
+        row["failure"] = "receiver never confirmed the file"
+    row["effective_timeout"] = sent.get("timeout")  # What the script ran with, "timeout" stays the configured key
+    row["wall_time"] = sent["wall_time"]
+    row["goodput"] = row["bytes"] / sent["wall_time"] if row["ok"] else 0.0
+    row["cpu_time"] = sent["cpu_time"] + received.get("cpu_time", 0.0)
+    row["sender_cpu_time"] = sent["cpu_time"]
+    row["receiver_cpu_time"] = received.get("cpu_time")
+    # Same counter can live on either side depending on the option
+    for name in ("retransmissions", "drops", "errors"):
+        row[name] = sent.get(name, 0) + received.get(name, 0)
+    # Only with --memory: bytes both processes allocated, and kept alive, per data packet in the steady state
+    for name in ("allocated_bytes_per_packet", "retained_bytes_per_packet"):
+        figures = [side["memory"][name] for side in (sent, received) if "memory" in side]
+        if figures and None not in figures:
+            row[name] = sum(figures)
+    shutil.rmtree(run_dir, ignore_errors=True)
+    return row
+
+
+def confidence(values):
+    """Mean, sample stdev and 95% confidence half-width."""
+    mean = statistics.fmean(values)
+    if len(values) < 2:
+        return mean, 0.0, 0.0
+    stdev = statistics.stdev(values)
+    df = len(values) - 1
+    t = T95[df - 1] if df <= len(T95) else 1.96
+    return mean, stdev, t * stdev / math.sqrt(len(values))
+
+
+def aggregate(rows, key=KEY):
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[name] for name in key), []).append(row)
+
+    summary = []
+    for values, group in sorted(groups.items(), key=lambda kv: str(kv[0])):
+        entry = dict(zip(key, values))
+        entry.update(runs=len(group), completed=sum(r["ok"] for r in group))
+        done = [r for r in group if "wall_time" in r]
+        for metric in METRICS:
+            values = [r[metric] for r in done if r.get(metric) is not None]
+            if values:
+                mean, stdev, ci = confidence(values)
+                entry[metric] = {"mean": mean, "stdev": stdev, "ci95": ci}
+        summary.append(entry)
+    return summary
+
+
+def write_csv(path, rows):
+    fields = []
+    for row in rows:
+        fields += [k for k in row if k not in fields]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def split_list(text, cast):
+    return [cast(v) for v in text.split(",") if v.strip()]
+
+
+def optional_float(text):
+    return None if text.strip() in ("default", "none") else float(text)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark every RDT option across a parameter sweep")
+    parser.add_argument("--options", default="", help="comma-separated substrings to select options")
+    parser.add_argument("--error-rates", default="0", help="percentages, e.g. 0,10,20")
+    parser.add_argument("--timeouts", default="default", help="seconds, 'default' keeps the script's own")
+    parser.add_argument("--sizes", default="native", help="e.g. native,64K,1M")
+    parser.add_argument("--delay-count", type=int, default=0, help="for the extra/delays option")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--run-timeout", type=float, default=300.0, help="seconds before a run is killed")
+    parser.add_argument("--csv", default="benchmark.csv")
+    parser.add_argument("--json", default="benchmark.json")
+    parser.add_argument("--memory", action="store_true", help="trace allocations in every run, see tools/memory.py")
+    parser.add_argument("--list", action="store_true", help="print the discovered options and exit")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = discover_options()
+    if args.options:
+        wanted = split_list(args.options, str)
+        options = [o for o in options if any(w in o for w in wanted)]
+    if args.list:
+        print("\n".join(options))
+        return
+
+    if args.memory:
+        os.environ["RDT_MEMORY"] = "1"  # Inherited by every runner.py launched below
+    scratch = tempfile.mkdtemp(prefix="rdt_bench_")
+    configs = []
+    for option, size, error_rate, timeout, repeat in itertools.product(
+            options, split_list(args.sizes, parse_size), split_list(args.error_rates, int),
+            split_list(args.timeouts, optional_float), range(args.repeats)):
+        payload = (os.path.join(REPO, option, "image.jpg") if size is None
+                   else make_payload(size, scratch, args.seed))
+        config = {"option": option, "error_rate": error_rate, "timeout": timeout,
+                  "delay_count": args.delay_count, "repeat": repeat,
+                  "seed": args.seed * 1000 + repeat * 2}
+        configs.append((config, payload))
+
+    print(f"{len(configs)} runs over {len(options)} options, {args.jobs} at a time")
+    rows = []
+    # Work happens in the child processes, threads only babysit them
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(run_once, config, payload, scratch, args.run_timeout)
+                   for config, payload in configs]
+        for future in concurrent.futures.as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            status = "ok" if row["ok"] else row.get("failure", "corrupt output")
+            print(f"[{len(rows)}/{len(configs)}] {row['option']} err={row['error_rate']} "
+                  f"timeout={row['timeout']} bytes={row['bytes']}: {status}")
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    rows.sort(key=lambda r: (r["option"], r["bytes"], r["error_rate"], str(r["timeout"]), r["repeat"]))
+    write_csv(args.csv, rows)
+    with open(args.json, "w") as f:
+        json.dump({"runs": rows, "summary": aggregate(rows)}, f, indent=2)
+    print(f"Results written to {args.csv} and {args.json}")
+
+
+if __name__ == "__main__":
+    main()
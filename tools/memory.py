@@ -0,0 +1,180 @@
+"""Per-transfer memory report for any sender/receiver run through tools/runner.py.
+
+Turned on with runner.py --memory or the RDT_MEMORY environment variable
+(which also reaches every run tools/benchmark.py --memory launches).
+tracemalloc traces every Python allocation from the moment the probe is
+built, and a thread samples the traced total and the process RSS every few
+milliseconds, so the growth can be read against the packets moved so far.
+
+Like the profiler, the steady state runs from the skip-th datagram to the
+first EOF/FIN. Two figures per packet come out of it:
+
+    allocated  the traced peak is reset at every data packet, so how far memory
+               rose above its level at the previous packet is what handling one
+               packet allocated; a lower bound, as memory freed before the next
+               allocation is reused within the same rise
+    retained   one snapshot at each end of the steady state, their difference
+               is the memory still alive per packet, and the sites it came from
+
+The JSON result gets the peaks and the per-packet figures.
+<prefix>.memory.txt holds the top sites, and <prefix>.memory.csv holds the
+samples.
+
+Tracing costs time: expect transfers to run about twice as slowly while it is on.
+"""
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from probe import Probe
+
+SKIP = 32  # Datagrams before the steady state is considered reached
+INTERVAL = 0.01  # Seconds between samples
+TOP = 20
+FRAMES = 1  # Traceback depth kept per allocation, deeper costs memory and time
+EOF_MARKER = 255  # First byte of the stop-and-wait EOF packet and its ACK
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# The snapshots and this probe's own samples are not the transfer's
+OWN = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+
+
+def rss():
+    #Resident bytes now; where /proc is missing, the peak so far is the best there is
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss()
+
+
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports kilobytes, macOS bytes
+
+
+class MemoryProbe(Probe):
+    """Traces allocations for the whole run, compares the two ends of the steady state."""
+
+    def __init__(self, prefix, top=TOP, skip=SKIP, interval=INTERVAL, frames=FRAMES):
+        self.prefix = prefix
+        self.count = top
+        self.skip = skip
+        self.interval = interval
+        self.marker = EOF_MARKER
+        self.packets = 0  # Datagrams in the direction the data flows
+        self.state = "waiting"  # -> "recording" -> "done"
+        self.first = self.last = None  # Snapshots at both ends of the steady state
+        self.window = [0, 0]  # Packet count at both ends
+        self.level = 0  # Traced bytes at the previous data packet
+        self.allocated = 0  # Sum over steady-state packets of how far memory rose above that level
+        self.peak = 0  # Overall peak, per-packet resets would lose it otherwise
+        self.samples = []  # (seconds, packets, traced bytes, RSS bytes)
+        self.started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="memory-sampler", daemon=True)
+        self.thread.start()
+
+    def attach(self, module):
+        self.marker = getattr(module, "FIN", EOF_MARKER)
+        if self.skip <= 0:
+            self.begin()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        self.samples.append((time.perf_counter() - self.started, self.packets,
+                             tracemalloc.get_traced_memory()[0], rss()))
+
+    def begin(self):
+        self.state = "recording"
+        self.window[0] = self.packets
+        self.first = tracemalloc.take_snapshot()
+        self.reset()
+
+    def reset(self):
+        #Starts a new high-water window, returns how far memory rose in the one that ends here
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        rise = max(0, peak - self.level)
+        tracemalloc.reset_peak()
+        self.level = current
+        return rise
+
+    def end(self):
+        if self.state == "recording":
+            self.window[1] = self.packets
+            self.last = tracemalloc.take_snapshot()
+        self.state = "done"
+
+    def seen(self, data, carries_data):
+        if self.state == "done":
+            return
+        if data[:1] and data[0] == self.marker:
+            self.end()
+            return
+        if carries_data:
+            self.packets += 1
+            if self.state == "recording":
+                self.allocated += self.reset()
+        if self.state == "waiting" and self.packets >= self.skip:
+            self.begin()
+
+    def sent(self, data, now, receiving):
+        self.seen(data, not receiving)
+
+    def received(self, data, now, receiving):
+        self.seen(data, receiving)
+
+    def finish(self, result):
+        self.end()
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+        peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        report = {"peak_traced": peak, "peak_rss": max([peak_rss()] + [row[3] for row in self.samples]),
+                  "packets": self.packets,
+                  "peak_bytes_per_packet": (peak - self.baseline) / self.packets if self.packets else None,
+                  "steady_packets": 0, "allocated_bytes_per_packet": None, "retained_blocks_per_packet": None,
+                  "retained_bytes_per_packet": None,
+                  "files": [self.prefix + ".memory.txt", self.prefix + ".memory.csv"], "top": []}
+        if self.first and self.last:
+            stats = self.last.filter_traces(OWN).compare_to(self.first.filter_traces(OWN), "lineno")
+            moved = self.window[1] - self.window[0]
+            report["steady_packets"] = moved
+            if moved:
+                report["allocated_bytes_per_packet"] = self.allocated / moved
+                report["retained_blocks_per_packet"] = sum(row.count_diff for row in stats) / moved
+                report["retained_bytes_per_packet"] = sum(row.size_diff for row in stats) / moved
+            report["top"] = [{"site": f"{os.path.basename(row.traceback[0].filename)}:{row.traceback[0].lineno}",
+                              "size": row.size, "size_diff": row.size_diff, "count_diff": row.count_diff}
+                             for row in stats[:self.count]]
+        tracemalloc.stop()
+        with open(report["files"][0], "w") as f:
+            f.write(self.render(report))
+        with open(report["files"][1], "w") as f:
+            f.write("seconds,packets,traced_bytes,rss_bytes\n")
+            f.writelines(f"{seconds:.4f},{packets},{traced},{resident}\n"
+                         for seconds, packets, traced, resident in self.samples)
+        result["memory"] = report
+
+    def render(self, report):
+        window = f"steady state after {self.skip} datagrams" if self.skip > 0 else "whole run"
+        allocated = report["allocated_bytes_per_packet"]
+        retained = report["retained_blocks_per_packet"]
+        lines = [f"memory, {window}: {report['steady_packets']} of {report['packets']} packets",
+                 f"peak traced {report['peak_traced'] / 1e6:.2f} MB, peak RSS {report['peak_rss'] / 1e6:.2f} MB",
+                 "bytes allocated per packet: " + ("-" if allocated is None else f"{allocated:.1f}"),
+                 "retained per packet: " + ("-" if retained is None else
+                 f"{retained:.3f} blocks ({report['retained_bytes_per_packet']:.1f} bytes)"),
+                 f"{'size':>12}{'grew by':>12}{'blocks':>10}  site"]
+        lines += [f"{row['size']:>12}{row['size_diff']:>+12}{row['count_diff']:>+10}  {row['site']}"
+                  for row in report["top"]]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,258 @@
+"""Counters and latency histograms for a running transfer.
+
+A Registry holds Counters, Histograms and callback gauges and renders them in
+the Prometheus text format.  It can be scraped from a local HTTP endpoint
+(serve_http) or dumped to a file every few seconds (StatsFileWriter) while a
+long transfer is still going.
+
+Updates are plain attribute arithmetic so they stay in the ~100 ns range:
+Counter.inc is one add, Histogram.observe is a bisect plus two adds.
+"""
+import bisect
+import http.server
+import json
+import os
+import threading
+import time
+
+from probe import Probe, SendTracker
+
+# Latency buckets in seconds, 10 us up to ~10 s
+LATENCY_BUCKETS = tuple(10e-6 * 2 ** i for i in range(21))
+
+
+class Counter:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter",
+                f"{self.name} {self.value}"]
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    #Value read through a callback at scrape time, costs nothing on the hot path
+    __slots__ = ("name", "help", "read")
+
+    def __init__(self, name, read, help=""):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.read()}"]
+
+    def snapshot(self):
+        return self.read()
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() takes seconds."""
+    __slots__ = ("name", "help", "bounds", "counts", "sum", "count")
+
+    def __init__(self, name, help="", bounds=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        #Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {seen}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+    def snapshot(self):
+        return {"count": self.count, "sum": self.sum,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+
+class Registry:
+    def __init__(self, prefix="rdt_"):
+        self.prefix = prefix
+        self.metrics = {}
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help=""):
+        return self.metrics.get(self.prefix + name) or self._add(Counter(self.prefix + name, help))
+
+    def histogram(self, name, help="", bounds=LATENCY_BUCKETS):
+        return self.metrics.get(self.prefix + name) or self._add(Histogram(self.prefix + name, help, bounds))
+
+    def gauge(self, name, read, help=""):
+        return self._add(Gauge(self.prefix + name, read, help))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {name[len(self.prefix):]: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+def serve_http(registry, port, host="127.0.0.1"):
+    """Serve registry.render() on http://host:port/metrics from a daemon thread."""
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # Keep scrapes out of the transfer's output
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StatsFileWriter:
+    """Rewrite path every interval seconds; .json gets a snapshot, anything else Prometheus text."""
+
+    def __init__(self, registry, path, interval=1.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def write(self):
+        if self.path.endswith(".json"):
+            text = json.dumps({"time": time.time(), "metrics": self.registry.snapshot()}, indent=2)
+        else:
+            text = self.registry.render()
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            f.write(text)
+        os.replace(temp, self.path)  # Readers never see a half-written file
+
+    def _loop(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
+
+
+class MetricsProbe(Probe):
+    """Feeds a Registry from the runner's socket hooks and the script's globals."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.packets_sent = registry.counter("packets_sent_total", "datagrams handed to sendto")
+        self.packets_received = registry.counter("packets_received_total", "datagrams returned by recvfrom")
+        self.retransmitted = registry.counter("packets_retransmitted_total", "data packet sent again, by sequence number or offset")
+        self.corrupt = registry.counter("packets_corrupt_total", "is_corrupt() returned True")
+        self.timeouts = registry.counter("timeouts_total", "recvfrom timed out")
+        self.bytes_sent = registry.counter("bytes_sent_total", "bytes handed to sendto")
+        self.bytes_received = registry.counter("bytes_received_total", "bytes returned by recvfrom")
+        self.rtt = registry.histogram("rtt_seconds", "last send to next ACK, sender side")
+        self.ack_latency = registry.histogram("ack_latency_seconds", "packet arrival to ACK sent, receiver side")
+        self.window_time = registry.histogram("time_in_window_seconds", "first send of a packet to its ACK")
+        self.sends = SendTracker()
+        self.first_send = 0
+        self.last_send = 0
+        self.last_ack = 0
+        self.last_recv = 0
+
+    def attach(self, module):
+        # The scripts' own counters, read only when scraped
+        for name in ("retransmissions", "drops", "errors"):
+            if hasattr(module, name):
+                self.registry.gauge(f"script_{name}", lambda name=name: getattr(module, name),
+                                    f"the script's {name} global")
+        if hasattr(module, "is_corrupt"):
+            original = module.is_corrupt
+            corrupt = self.corrupt
+
+            def is_corrupt(*args):
+                bad = original(*args)
+                if bad:
+                    corrupt.value += 1
+                return bad
+
+            module.is_corrupt = is_corrupt
+        self.sends.attach(module)
+
+    def sent(self, data, now, receiving):
+        self.packets_sent.value += 1
+        self.bytes_sent.value += len(data)
+        if receiving:
+            if self.last_recv:
+                self.ack_latency.observe((now - self.last_recv) / 1e9)
+                self.last_recv = 0
+            return
+        resent, _, _, _ = self.sends.classify(data)
+        if resent:
+            self.retransmitted.value += 1
+        elif resent is not None and self.sends.header is None:
+            # A new packet means the previous one was ACKed (stop-and-wait only, the pipelined
+            # engine has many in flight and keeps its own RTT and window figures)
+            if self.first_send and self.last_ack > self.first_send:
+                self.window_time.observe((self.last_ack - self.first_send) / 1e9)
+            self.first_send = now
+        self.last_send = now
+
+    def received(self, data, now, receiving):
+        self.packets_received.value += 1
+        self.bytes_received.value += len(data)
+        if receiving:
+            self.last_recv = now
+        elif self.last_send and self.sends.header is None:
+            self.rtt.observe((now - self.last_send) / 1e9)
+            self.last_ack = now
+
+    def timed_out(self, now):
+        self.timeouts.value += 1
+
+    def finish(self, result):
+        result["metrics"] = self.registry.snapshot()
@@ -0,0 +1,268 @@
+"""Microbenchmarks for the per-packet hot path, checked against a JSON baseline.
+
+Times the functions every packet goes through (checksum/CRC, make_packet,
+is_corrupt, header unpacking, ACK handling) straight out of the option
+scripts, in ns/packet and MB/s for each payload size.  Options that carry an
+identical copy of a function are timed once.  With a baseline on disk the run
+fails (exit 1) when any case got slower than the threshold; --save writes the
+current numbers as the new baseline.
+
+Every case is timed in turns with a fixed calibration loop and compared as a
+multiple of it, so a baseline taken on one machine still means something on a
+faster, slower or busier one.  How much that multiple moves between repeats is
+stored with it: a case only counts as regressed once its slowdown is beyond
+both the threshold and SIGMAS times the combined spread of the baseline and
+this run, so a noisy case cannot fail the gate on its own noise.  Noise only
+widens the gate up to MAX_ALLOWANCE thresholds, and every case past the plain
+threshold is timed again first, so noise cannot hide a real slowdown either.
+
+    python tools/microbench.py                       # compare against tools/microbench_baseline.json
+    python tools/microbench.py --save --repeats 15   # accept the current numbers, on a quiet machine
+    python tools/microbench.py --filter crc --sizes 1024 --threshold 0.25
+"""
+import argparse
+import inspect
+import json
+import math
+import os
+import platform
+import statistics
+import struct
+import sys
+import time
+
+import benchmark
+import runner
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microbench_baseline.json")
+SIZES = (64, 512, 1024)
+THRESHOLD = 0.15  # Fractional slowdown that counts as a regression, at the least
+SIGMAS = 3  # Slowdowns within this many standard deviations of the measured noise are not counted
+MAX_ALLOWANCE = 2  # However noisy a case, the allowed slowdown stays within this many thresholds
+MIN_TIME = 0.05  # Seconds per timed repeat
+REPEATS = 5
+RETRIES = 2  # Re-timings of a case that looks regressed before it counts, shared machines are noisy
+THREAD = "Phase 2/extra/thread"
+# Inline code the stop-and-wait scripts run per packet, written out once here
+SEQ_HEADER = struct.Struct("!B2s")
+ACK_SEQ = struct.Struct("!B")
+
+
+def calibration():
+    #Fixed pure-Python loop that stands in for "how fast is this interpreter on this machine"
+    total = 0
+    for i in range(1024):
+        total = (total + (i << 8)) & 0xFFFF
+    return total
+
+
+def loop_count(func, arg, min_time=MIN_TIME):
+    """Calls per timed repeat, doubled until one repeat lasts min_time."""
+    number = 1
+    while run_loop(func, arg, number) < min_time * 1e9:
+        number *= 2
+    return number
+
+
+def run_loop(func, arg, number):
+    start = time.perf_counter_ns()
+    for _ in range(number):
+        func(arg)
+    return time.perf_counter_ns() - start
+
+
+def stop_and_wait_cases(option, seen):
+    #(name, function taking the packet/payload, input builder, sized) for one option's scripts
+    sender = runner.load_script(os.path.join(benchmark.REPO, option, "sender.py"), "bench_sender")
+    receiver = runner.load_script(os.path.join(benchmark.REPO, option, "receiver.py"), "bench_receiver")
+    checksum = getattr(sender, "calculate_checksum", None) or sender.calculate_crc16
+    cases = []
+
+    def add(name, func, build, source):
+        key = (name, inspect.getsource(source))
+        if key not in seen:  # Identical copy in an earlier option, its numbers stand for this one too
+            seen.add(key)
+            cases.append((f"{option}:{name}", func, build, True))
+
+    add(checksum.__name__, checksum, payload, checksum)
+    add("make_packet", lambda data: sender.make_packet(0, data), payload, sender.make_packet)
+    if "is_corrupt" in vars(receiver):
+        add("is_corrupt", lambda packet: receiver.is_corrupt(packet[3:], packet[1:3]),
+            lambda size: sender.make_packet(0, payload(size)), receiver.is_corrupt)
+    return cases
+
+
+def thread_cases():
+    sys.path.insert(0, os.path.join(benchmark.REPO, THREAD))
+    import protocol
+    return [
+        (f"{THREAD}:calculate_checksum", protocol.calculate_checksum, payload, True),
+        (f"{THREAD}:make_packet", lambda data: protocol.make_packet(protocol.DATA, 1 << 20, data), payload, True),
+        (f"{THREAD}:parse_packet", protocol.parse_packet,
+         lambda size: protocol.make_packet(protocol.DATA, 1 << 20, payload(size)), True),
+        (f"{THREAD}:parse_ack", protocol.parse_ack, lambda size: protocol.make_ack(1 << 20, 1 << 22), False),
+    ]
+
+
+def common_cases():
+    return [
+        ("stop-and-wait:unpack_header", lambda packet: (SEQ_HEADER.unpack(packet[:3]), packet[3:]),
+         lambda size: b"\x00\x12\x34" + payload(size), True),
+        ("stop-and-wait:ack_seq", lambda ack: ACK_SEQ.unpack(ack)[0] == 0, lambda size: b"\x00", False),
+    ]
+
+
+def payload(size):
+    return bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+
+
+def collect_cases():
+    cases = []
+    seen = set()
+    for option in benchmark.discover_options():
+        if option != THREAD:
+            cases += stop_and_wait_cases(option, seen)
+    return cases + thread_cases() + common_cases()
+
+
+def measure_case(func, build, size, sized, min_time, repeats):
+    #Case and calibration loop take turns, a busy neighbour slows both alike. Best of the repeats
+    #for each, plus the relative spread of their ratio over the repeats, taken from the median
+    #absolute deviation so one preempted repeat does not pass for a noisy case
+    arg = build(size)
+    calibrate = lambda _: calibration()
+    number = loop_count(func, arg, min_time)
+    calibration_number = loop_count(calibrate, None, min_time)
+    times = []
+    calibrations = []
+    for _ in range(repeats):
+        times.append(run_loop(func, arg, number) / number)
+        calibrations.append(run_loop(calibrate, None, calibration_number) / calibration_number)
+    ratios = [t / c for t, c in zip(times, calibrations)]
+    ns = min(times)
+    median = statistics.median(ratios)
+    deviation = 1.4826 * statistics.median(abs(ratio - median) for ratio in ratios)  # Equals sigma for normal noise
+    return {"ns": ns, "mb_s": size / ns * 1e3 if sized else None, "calibration_ns": min(calibrations),
+            "spread": deviation / median}
+
+
+def allowed(entry, old, threshold):
+    #Baselines saved before the spread was recorded count as noiseless
+    noise = math.hypot(entry.get("spread", 0.0), old.get("spread", 0.0))
+    return min(max(threshold, SIGMAS * noise), MAX_ALLOWANCE * threshold)
+
+
+def measure(cases, sizes, min_time, repeats):
+    #Size-independent cases (ACKs) are timed once, under size "ack"
+    results = {}
+    for name, func, build, sized in cases:
+        results[name] = {str(size): measure_case(func, build, size, sized, min_time, repeats)
+                         for size in (sizes if sized else ["ack"])}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Rows of (case, size, entry, baseline ns scaled, ratio, allowed slowdown), the regressions, and the
+    suspects: every case slower than the plain threshold, noisy or not."""
+    rows = []
+    regressions = []
+    suspects = []
+    for name, sizes in results.items():
+        for size, entry in sizes.items():
+            old = baseline.get(name, {}).get(size)
+            expected = old["ns"] * entry["calibration_ns"] / old["calibration_ns"] if old else None
+            ratio = entry["ns"] / expected if expected else None
+            limit = allowed(entry, old, threshold) if old else None
+            rows.append((name, size, entry, expected, ratio, limit))
+            if ratio is not None and ratio > 1 + limit:
+                regressions.append((name, size, ratio, limit))
+            if ratio is not None and ratio > 1 + threshold:
+                suspects.append((name, size, ratio, limit))
+    return rows, regressions, suspects
+
+
+def confirm(cases, results, baseline, suspects, args):
+    #Time each suspect again and keep its best ratio, a real regression survives every retry
+    by_name = {case[0]: case for case in cases}
+    for name, size, ratio, _ in suspects:
+        _, func, build, sized = by_name[name]
+        old = baseline[name][size]
+        for _ in range(args.retries):
+            entry = measure_case(func, build, int(size) if sized else size, sized, args.min_time, args.repeats)
+            retry = (entry["ns"] / entry["calibration_ns"]) / (old["ns"] / old["calibration_ns"])
+            if retry < ratio:
+                results[name][size], ratio = entry, retry
+
+
+def report(rows):
+    print(f"{'case':<46}{'size':>6}{'ns/packet':>12}{'MB/s':>9}{'baseline':>11}{'change':>9}{'allowed':>9}")
+    for name, size, entry, expected, ratio, limit in rows:
+        mb_s = f"{entry['mb_s']:.1f}" if entry["mb_s"] else ""
+        base = f"{expected:.0f}" if expected else "new"
+        change = f"{ratio - 1:+.1%}" if ratio else ""
+        allowance = f"{limit:.0%}" if limit is not None else ""
+        print(f"{name:<46}{size:>6}{entry['ns']:>12.0f}{mb_s:>9}{base:>11}{change:>9}{allowance:>9}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Time the per-packet hot path and check it against a baseline")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="payload sizes in bytes")
+    parser.add_argument("--filter", default="", help="comma-separated substrings to select cases")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="smallest slowdown that counts, 0.15 = 15%%; noisy cases get 3 sigma of their spread, "
+                             "up to twice this")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds per timed repeat")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--retries", type=int, default=RETRIES, help="re-timings before a slowdown counts")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--json", default=None, help="also write this run's results here")
+    parser.add_argument("--list", action="store_true", help="print the case names and exit")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.save and args.filter:
+        parser.error("--save replaces the whole baseline, run it without --filter")
+    cases = collect_cases()
+    if args.filter:
+        wanted = benchmark.split_list(args.filter, str)
+        cases = [case for case in cases if any(w in case[0] for w in wanted)]
+    if args.list:
+        print("\n".join(case[0] for case in cases))
+        return 0
+
+    results = measure(cases, benchmark.split_list(args.sizes, int), args.min_time, args.repeats)
+    current = {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        baseline = results
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    else:
+        print(f"No baseline at {args.baseline}, run with --save to create one")
+        baseline = {}
+
+    rows, regressions, suspects = compare(results, baseline, args.threshold)
+    if suspects:
+        confirm(cases, results, baseline, suspects, args)
+        rows, regressions, _ = compare(results, baseline, args.threshold)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(current, f, indent=2)
+    report(rows)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond the allowed slowdown:")
+        for name, size, ratio, limit in regressions:
+            print(f"  {name} at {size} bytes: {ratio - 1:+.1%}, {limit:.0%} allowed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Base class for the instrumentation tools/runner.py attaches to a run.
+
+It lives outside runner.py so that the probes and the runner share one class
+when runner.py runs as __main__; importing it from runner would load a second copy.
+"""
+
+
+class Probe:
+    """Instrumentation attached to a run; override only the hooks you need.
+
+    sent/received/timed_out are called from the socket with a perf_counter_ns
+    timestamp, receiving is True on the bound (receiver) side.
+    """
+
+    def attach(self, module):
+        pass
+
+    def sent(self, data, now, receiving):
+        pass
+
+    def received(self, data, now, receiving):
+        pass
+
+    def timed_out(self, now):
+        pass
+
+    def finish(self, result):
+        pass
+
+
+class SendTracker:
+    """Tells new data packets from resent ones by sequence number or offset, never by payload.
+
+    Stop-and-wait scripts alternate a one-byte sequence number, so a datagram repeating the
+    previous one's number is a resend. The pipelined engine (a module with HEADER and DATA)
+    puts a byte offset in its header and has many packets in flight, so anything below the
+    highest offset sent so far is a resend.
+    """
+
+    def __init__(self, header_size=3):
+        self.header_size = header_size
+        self.header = None  # Pipelined header struct, None for stop-and-wait
+        self.data_kind = None
+        self.last_seq = None
+        self.offset = 0  # Where the last new stop-and-wait packet starts
+        self.next_offset = 0
+
+    def attach(self, module):
+        if hasattr(module, "HEADER") and hasattr(module, "DATA"):
+            self.header = module.HEADER
+            self.data_kind = module.DATA
+
+    def classify(self, data):
+        """(resent, seq, offset, payload length), resent is None for pipelined control packets."""
+        if self.header is None:
+            seq = data[0] if data else 0
+            length = max(0, len(data) - self.header_size)
+            if seq == self.last_seq:
+                return True, seq, self.offset, length
+            self.last_seq = seq
+            self.offset = self.next_offset
+            self.next_offset += length
+            return False, seq, self.offset, length
+        if len(data) < self.header.size:
+            return None, 0, 0, 0
+        kind, offset = self.header.unpack_from(data)[:2]
+        length = len(data) - self.header.size
+        if kind != self.data_kind:
+            return None, kind, offset, length
+        if offset < self.next_offset:
+            return True, kind, offset, length
+        self.next_offset = offset + length
+        return False, kind, offset, length
+
+    def acked(self, data, default):
+        #Cumulative offset of a pipelined ACK; stop-and-wait ACKs only carry the sequence number
+        if self.header is None or len(data) < self.header.size:
+            return default
+        return self.header.unpack_from(data)[1]
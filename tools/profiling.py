@@ -0,0 +1,189 @@
+"""Per-transfer profiling for any sender/receiver run through tools/runner.py.
+
+Two modes, picked with runner.py --profile or the RDT_PROFILE environment
+variable (which also reaches every run tools/benchmark.py launches):
+
+    sample   a thread walks sys._current_frames() every few milliseconds;
+             low overhead, sees every thread, wall-clock (blocking waits show up)
+    cprofile deterministic cProfile of the thread the transfer runs on, plus the
+             sampler for the stacks
+
+Both write <prefix>.collapsed (one "frame;frame;frame count" line per stack,
+the input flamegraph.pl, speedscope and inferno take) and <prefix>.top.txt,
+and put the top-N functions into the run's JSON result.  cprofile also writes
+<prefix>.prof for pstats/snakeviz.
+
+By default only the steady state is profiled: recording starts once skip
+datagrams have gone through the socket and stops at the first EOF/FIN, so
+socket setup, file opening and the close handshake stay out of the picture.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from probe import Probe
+
+MODES = ("sample", "cprofile")
+SKIP = 32  # Datagrams before the steady state is considered reached
+INTERVAL = 0.002  # Seconds between samples
+TOP = 20
+EOF_MARKER = 255  # First byte of the stop-and-wait EOF packet and its ACK
+
+
+class Sampler:
+    """Counts the Python stacks of every other thread at a fixed interval."""
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.active = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="profiling-sampler", daemon=True)
+
+    def start(self):
+        # A waiting thread only gets the GIL at the holder's next switch point; without a short
+        # switch interval nearly every sample would land on a blocking socket call
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval / 20))
+        self.thread.start()
+        return self
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            if not self.active:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.stacks[collapse(frame)] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+
+    def top(self, count):
+        #(function, self samples, total samples), total counts a function once per stack
+        own = Counter()
+        total = Counter()
+        for stack, samples in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += samples
+            for name in set(frames):
+                total[name] += samples
+        return [(name, samples, total[name]) for name, samples in own.most_common(count)]
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, samples in sorted(self.stacks.items()):
+                f.write(f"{stack} {samples}\n")
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfileProbe(Probe):
+    """Profiles the transfer between the skip-th datagram and the first EOF/FIN."""
+
+    def __init__(self, mode, prefix, top=TOP, skip=SKIP, interval=INTERVAL):
+        if mode not in MODES:
+            raise ValueError(f"profile mode must be one of {', '.join(MODES)}, not {mode!r}")
+        self.mode = mode
+        self.prefix = prefix
+        self.count = top
+        self.skip = skip
+        self.datagrams = 0
+        self.marker = EOF_MARKER
+        self.sampler = Sampler(interval).start()
+        self.profiler = cProfile.Profile() if mode == "cprofile" else None
+        self.state = "waiting"  # -> "recording" -> "done"
+        self.started = self.stopped = None
+
+    def attach(self, module):
+        self.marker = getattr(module, "FIN", EOF_MARKER)  # The pipelined engine has a FIN packet type
+        if self.skip <= 0:
+            self.begin()
+
+    def begin(self):
+        self.state = "recording"
+        self.started = time.perf_counter()
+        self.sampler.active = True
+        if self.profiler:
+            self.profiler.enable()  # Follows the thread that called it, the one doing socket I/O
+
+    def end(self):
+        if self.state != "recording":
+            self.state = "done"
+            return
+        if self.profiler:
+            self.profiler.disable()
+        self.sampler.active = False
+        self.stopped = time.perf_counter()
+        self.state = "done"
+
+    def seen(self, data):
+        if self.state == "done":
+            return
+        if data[:1] and data[0] == self.marker:
+            self.end()
+            return
+        self.datagrams += 1
+        if self.state == "waiting" and self.datagrams >= self.skip:
+            self.begin()
+
+    def sent(self, data, now, receiving):
+        self.seen(data)
+
+    def received(self, data, now, receiving):
+        self.seen(data)
+
+    def finish(self, result):
+        self.end()
+        self.sampler.stop()
+        files = [self.prefix + ".collapsed", self.prefix + ".top.txt"]
+        self.sampler.write(files[0])
+        if self.profiler:
+            files.append(self.prefix + ".prof")
+            self.profiler.dump_stats(files[2])
+            top = self.cprofile_top()
+        else:
+            top = [{"function": name, "self_samples": own, "total_samples": total}
+                   for name, own, total in self.sampler.top(self.count)]
+        with open(files[1], "w") as f:
+            f.write(self.render(top))
+        result["profile"] = {"mode": self.mode, "seconds": (self.stopped or 0.0) - (self.started or 0.0),
+                             "samples": self.sampler.samples, "files": files, "top": top}
+
+    def cprofile_top(self):
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, name), (_, calls, own, total, _) in stats.stats.items():
+            rows.append({"function": f"{name} ({os.path.basename(filename)}:{line})", "calls": calls,
+                         "self_seconds": own, "total_seconds": total})
+        rows.sort(key=lambda row: row["self_seconds"], reverse=True)
+        return rows[:self.count]
+
+    def render(self, top):
+        window = f"steady state after {self.skip} datagrams" if self.skip > 0 else "whole run"
+        lines = [f"{self.mode} profile, {window}, {(self.stopped or 0.0) - (self.started or 0.0):.3f} s"]
+        if self.profiler:
+            lines.append(f"{'self s':>10}{'total s':>10}{'calls':>10}  function")
+            lines += [f"{row['self_seconds']:>10.4f}{row['total_seconds']:>10.4f}{row['calls']:>10}  {row['function']}"
+                      for row in top]
+        else:
+            lines.append(f"{'self':>8}{'total':>8}  function  ({self.sampler.samples} samples)")
+            lines += [f"{row['self_samples']:>8}{row['total_samples']:>8}  {row['function']}" for row in top]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,257 @@
+"""Run any sender.py/receiver.py non-interactively and report its stats.
+
+The scripts keep their settings in module globals and ask for the error rate
+with input(), so the runner loads the script as a module, overrides those
+globals (port, error rate, timeout, delay count), answers input() itself and
+calls main().  Whatever the script counted in its globals is written out as
+JSON when the transfer ends.
+
+    python tools/runner.py "Phase 3/Option5/receiver.py" --port 40000 --error-rate 20
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import random
+import resource
+import socket
+import sys
+import time
+import types
+
+from probe import Probe
+
+# Globals that hold an error/loss probability as a 0-1 fraction
+PROBABILITY_KNOBS = ("ERROR_RATE", "ERROR_PROBABILITY", "LOSS_PROBABILITY", "ACK_LOSS_PROBABILITY")
+# Globals the scripts count into, reported after the run
+STAT_GLOBALS = ("retransmissions", "drops", "errors", "total_delay", "delay_count", "pipeline_stats", "writer_stats",
+                "latency_stats", "confirmed")
+
+
+def load_script(path, name=None):
+    #Import a sender/receiver script by path without running its __main__ block
+    path = os.path.abspath(path)
+    folder = os.path.dirname(path)
+    if folder not in sys.path:
+        sys.path.insert(0, folder)  # Same as running the script directly, its sibling modules import
+    name = name or "rdt_" + os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_socket_module(socket_class):
+    #Copy of the socket module whose socket() builds socket_class instead
+    shim = types.ModuleType("socket")
+    shim.__dict__.update(socket.__dict__)
+    shim.socket = socket_class
+    return shim
+
+
+def instrumented_socket(ready_path=None, probes=()):
+    #Socket class that signals bind() on ready_path and feeds every probe
+    sent_hooks = [p.sent for p in probes if type(p).sent is not Probe.sent]
+    received_hooks = [p.received for p in probes if type(p).received is not Probe.received]
+    timeout_hooks = [p.timed_out for p in probes if type(p).timed_out is not Probe.timed_out]
+    clock = time.perf_counter_ns
+
+    class RunnerSocket(socket.socket):
+        receiving = False
+
+        def bind(self, address):
+            super().bind(address)
+            self.receiving = True
+            if ready_path:
+                with open(ready_path, "w") as f:
+                    f.write(str(self.getsockname()[1]))
+
+        if sent_hooks:
+            def sendto(self, data, *args):
+                sent = super().sendto(data, *args)
+                now = clock()
+                for hook in sent_hooks:
+                    hook(data, now, self.receiving)
+                return sent
+
+        if received_hooks or timeout_hooks:
+            def recvfrom(self, *args):
+                try:
+                    data, addr = super().recvfrom(*args)
+                except socket.timeout:
+                    now = clock()
+                    for hook in timeout_hooks:
+                        hook(now)
+                    raise
+                now = clock()
+                for hook in received_hooks:
+                    hook(data, now, self.receiving)
+                return data, addr
+
+            def recvfrom_into(self, buffer, *args):
+                #The pipelined receiver reads straight into its own buffer
+                try:
+                    size, addr = super().recvfrom_into(buffer, *args)
+                except socket.timeout:
+                    now = clock()
+                    for hook in timeout_hooks:
+                        hook(now)
+                    raise
+                now = clock()
+                for hook in received_hooks:
+                    hook(memoryview(buffer)[:size], now, self.receiving)
+                return size, addr
+
+            def recvmsg(self, *args):
+                #Scripts reading kernel timestamps out of the ancillary data
+                try:
+                    data, ancdata, flags, addr = super().recvmsg(*args)
+                except socket.timeout:
+                    now = clock()
+                    for hook in timeout_hooks:
+                        hook(now)
+                    raise
+                now = clock()
+                for hook in received_hooks:
+                    hook(data, now, self.receiving)
+                return data, ancdata, flags, addr
+
+    return RunnerSocket
+
+
+def configure(module, port, error_rate=0, timeout=None, delay_count=0, kernel_timestamps=False):
+    """Point the script at port and apply the error rate/timeout/delay/timestamp knobs."""
+    module.UDP_PORT = port
+    if kernel_timestamps and hasattr(module, "KERNEL_TIMESTAMPS"):
+        module.KERNEL_TIMESTAMPS = True
+    for knob in PROBABILITY_KNOBS:
+        if hasattr(module, knob):
+            setattr(module, knob, error_rate / 100)
+    if hasattr(module, "delay_count"):
+        module.delay_count = delay_count
+    if timeout is not None and hasattr(module, "TIMEOUT"):
+        module.TIMEOUT = timeout
+
+    def answer(prompt=""):
+        #Shadows the builtin inside the script only
+        return str(delay_count if "delay" in prompt.lower() else error_rate)
+
+    module.input = answer
+
+
+def collect_stats(module):
+    return {name: getattr(module, name) for name in STAT_GLOBALS if hasattr(module, name)}
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(script, port, error_rate=0, timeout=None, delay_count=0, seed=None,
+        ready_path=None, verbose=False, probes=(), kernel_timestamps=False):
+    """Run one script's main() and return a dict of timings and stats."""
+    if seed is not None:
+        random.seed(seed)
+    module = load_script(script)
+    configure(module, port, error_rate, timeout, delay_count, kernel_timestamps)
+    module.socket = make_socket_module(instrumented_socket(ready_path, probes))
+    for probe in probes:
+        probe.attach(module)
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    cpu_start = cpu_seconds()
+    start = time.perf_counter()
+    with output:
+        module.main()
+    wall = time.perf_counter() - start
+
+    result = {
+        "script": script,
+        "port": port,
+        "error_rate": error_rate,
+        "timeout": getattr(module, "TIMEOUT", None),
+        "wall_time": wall,
+        "cpu_time": cpu_seconds() - cpu_start,
+    }
+    result.update(collect_stats(module))
+    for probe in probes:
+        probe.finish(result)
+    return result
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run an RDT sender/receiver non-interactively")
+    parser.add_argument("script", help="path to a sender.py or receiver.py")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--error-rate", type=int, default=0, help="percent, 0-100")
+    parser.add_argument("--timeout", type=float, default=None, help="overrides TIMEOUT where the script has one")
+    parser.add_argument("--delay-count", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--kernel-timestamps", action="store_true",
+                        help="time receives by SO_TIMESTAMPNS where the script supports it (Linux)")
+    parser.add_argument("--ready", default=None, help="file created once the socket is bound")
+    parser.add_argument("--result", default=None, help="write the JSON result here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="keep the script's own prints")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus text on this port")
+    parser.add_argument("--metrics-file", default=None, help="rewrite live stats here (.json or Prometheus text)")
+    parser.add_argument("--metrics-interval", type=float, default=1.0, help="seconds between stats file writes")
+    parser.add_argument("--trace", default=None, help="write a binary per-packet event trace here")
+    parser.add_argument("--profile", choices=("sample", "cprofile"), default=os.environ.get("RDT_PROFILE") or None,
+                        help="profile the transfer (default from $RDT_PROFILE)")
+    parser.add_argument("--profile-out", default=None,
+                        help="prefix for the profile files, defaults to the --result path without .json")
+    parser.add_argument("--profile-top", type=int, default=20, help="functions listed in the summary")
+    parser.add_argument("--profile-skip", type=int, default=32,
+                        help="datagrams before recording starts, 0 profiles startup too")
+    parser.add_argument("--no-stages", dest="stages", action="store_false",
+                        help="skip the per-stage time table printed to stderr after the run")
+    parser.add_argument("--memory", action="store_true", default=bool(os.environ.get("RDT_MEMORY")),
+                        help="trace allocations and RSS during the transfer (default from $RDT_MEMORY)")
+    parser.add_argument("--memory-out", default=None,
+                        help="prefix for the memory report files, defaults to the --result path without .json")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    probes = []
+    writer = None
+    if args.metrics_port is not None or args.metrics_file:
+        import metrics
+        registry = metrics.Registry()
+        probes.append(metrics.MetricsProbe(registry))
+        if args.metrics_port is not None:
+            metrics.serve_http(registry, args.metrics_port)
+        if args.metrics_file:
+            writer = metrics.StatsFileWriter(registry, args.metrics_file, args.metrics_interval).start()
+    if args.trace:
+        import tracing
+        probes.append(tracing.TraceProbe(args.trace))
+    if args.profile:
+        import profiling
+        prefix = args.profile_out or os.path.splitext(args.result or "profile_" + os.path.basename(args.script))[0]
+        probes.append(profiling.ProfileProbe(args.profile, prefix, args.profile_top, args.profile_skip))
+    if args.stages:
+        import stages
+        probes.append(stages.StageProbe())
+    if args.memory:
+        import memory
+        prefix = args.memory_out or os.path.splitext(args.result or "memory_" + os.path.basename(args.script))[0]
+        probes.append(memory.MemoryProbe(prefix, args.profile_top, args.profile_skip))
+
+    result = run(args.script, args.port, args.error_rate, args.timeout, args.delay_count,
+                 args.seed, args.ready, args.verbose, probes, args.kernel_timestamps)
+    if writer:
+        writer.stop()
+    if args.result:
+        with open(args.result, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
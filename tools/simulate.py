@@ -0,0 +1,482 @@
+"""Discrete-event simulation of the stop-and-wait options on a virtual clock.
+
+The option's own sender.py and receiver.py run unmodified (send_file, Timer,
+is_corrupt and all), loaded the way tools/runner.py loads them, but their
+socket, time and open are swapped for simulated ones.  Datagrams cross a
+modelled channel (latency, jitter, bandwidth, loss, corruption) and every
+timeout or sleep moves a virtual clock forward instead of waiting, so a run
+that takes minutes of real timeouts finishes in well under a second and the
+same seed always gives the same result.  Rows have the same fields as
+tools/benchmark.py rows, wall_time and goodput in virtual seconds.
+
+    python tools/simulate.py --options "Phase 3" --sizes 64K --loss 0,10,40 --latencies 0.001,0.02 --repeats 5
+"""
+import argparse
+import collections
+import concurrent.futures
+import errno
+import functools
+import heapq
+import io
+import itertools
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import types
+
+import benchmark
+import runner
+
+# The pipelined engine runs on select() and its own threads, the simulated
+# socket only models the blocking calls the stop-and-wait scripts make
+SKIP = benchmark.SKIP + ("extra/thread",)
+KEY = benchmark.KEY + ("loss", "ack_loss", "corrupt", "latency")
+UDP_PORT = 5005
+OP_COST = 1e-6  # Virtual seconds every socket call takes, so time always moves forward
+FIRST_EPHEMERAL = 40000
+
+
+class SimulationOver(BaseException):
+    """Raised inside a script still blocked when the simulation ends, unwinds it like Ctrl-C would."""
+
+
+class Task:
+    """One script's main() on its own thread, run only while the simulation hands it the baton."""
+
+    def __init__(self, sim, name, target):
+        self.sim = sim
+        self.name = name
+        self.target = target
+        self.go = threading.Event()
+        self.thread = threading.Thread(target=self.main, name=name, daemon=True)
+        self.started_at = None
+        self.finished_at = None
+        self.done = False
+        self.error = None
+
+    def main(self):
+        self.go.wait()
+        self.go.clear()
+        self.started_at = self.sim.now
+        try:
+            self.target()
+        except SimulationOver:
+            self.error = "still blocked when the simulation ended"
+        except BaseException as e:
+            self.error = repr(e)
+        finally:
+            self.finished_at = self.sim.now
+            self.done = True
+            self.sim.switch.set()
+
+    def resume(self):
+        if self.thread.ident is None:
+            self.thread.start()
+        self.go.set()
+
+
+class Simulation:
+    """Event heap plus a virtual clock; exactly one script thread runs at any moment."""
+
+    def __init__(self, limit=3600.0):
+        self.now = 0.0
+        self.limit = limit  # Virtual seconds before blocked scripts are given up on
+        self.events = []  # [time, order, callback], callback None once cancelled
+        self.order = itertools.count()
+        self.tasks = []
+        self.runnable = collections.deque()
+        self.current = None
+        self.switch = threading.Event()  # Set by the running script when it blocks or ends
+        self.over = False
+        self.sockets = {}  # port -> SimSocket
+        self.ports = itertools.count(FIRST_EPHEMERAL)
+        self.processed = 0
+
+    def schedule(self, delay, callback):
+        event = [self.now + delay, next(self.order), callback]
+        heapq.heappush(self.events, event)
+        return event
+
+    def spawn(self, name, target):
+        task = Task(self, name, target)
+        self.tasks.append(task)
+        self.runnable.append(task)
+        return task
+
+    def tick(self):
+        self.now += OP_COST
+
+    def wake(self, task):
+        self.runnable.append(task)
+
+    def block(self):
+        #Called on a script thread: give the baton back and wait to be woken
+        if self.over:
+            raise SimulationOver()
+        task = self.current
+        self.switch.set()
+        task.go.wait()
+        task.go.clear()
+        if self.over:
+            raise SimulationOver()
+
+    def sleep(self, seconds):
+        if seconds < 0:
+            raise ValueError("sleep length must be non-negative")
+        self.tick()
+        self.schedule(seconds, functools.partial(self.wake, self.current))
+        self.block()
+
+    def run(self):
+        while True:
+            while self.runnable:
+                self.current = self.runnable.popleft()
+                self.switch.clear()
+                self.current.resume()
+                self.switch.wait()
+            self.current = None
+            if all(task.done for task in self.tasks):
+                break
+            event = self.next_event()
+            if event is None or event[0] > self.limit:
+                break  # Deadlock or out of virtual time
+            self.now = max(self.now, event[0])
+            self.processed += 1
+            event[2]()
+
+        self.over = True
+        for task in self.tasks:
+            if task.thread.is_alive():
+                task.go.set()
+                task.thread.join()
+
+    def next_event(self):
+        while self.events:
+            event = heapq.heappop(self.events)
+            if event[2] is not None:
+                return event
+        return None
+
+    def socket_module(self, channel):
+        return runner.make_socket_module(lambda *args, **kwargs: SimSocket(self, channel))
+
+    def time_module(self):
+        #Copy of the time module that reads and advances the virtual clock
+        shim = types.ModuleType("time")
+        shim.__dict__.update(time.__dict__)
+        shim.time = shim.perf_counter = shim.monotonic = lambda: self.now
+        shim.time_ns = shim.perf_counter_ns = shim.monotonic_ns = lambda: int(self.now * 1e9)
+        shim.sleep = self.sleep
+        return shim
+
+
+class SimSocket:
+    """The blocking UDP calls the scripts use, against the simulated channel."""
+
+    def __init__(self, sim, channel):
+        self.sim = sim
+        self.channel = channel
+        self.address = None
+        self.bound = False
+        self.timeout = None
+        self.queue = collections.deque()
+        self.waiter = None
+        self.timer = None
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def register(self, address):
+        if address[1] in self.sim.sockets:
+            raise OSError(errno.EADDRINUSE, "Address already in use")
+        self.address = address
+        self.sim.sockets[address[1]] = self
+
+    def bind(self, address):
+        self.register((address[0] or "0.0.0.0", address[1] or next(self.sim.ports)))
+        self.bound = True
+
+    def getsockname(self):
+        return self.address or ("0.0.0.0", 0)
+
+    def setsockopt(self, *args):
+        pass
+
+    def getsockopt(self, *args):
+        return 0
+
+    def settimeout(self, value):
+        if value is not None and value < 0:
+            raise ValueError("Timeout value out of range")
+        self.timeout = value
+
+    def gettimeout(self):
+        return self.timeout
+
+    def setblocking(self, flag):
+        self.timeout = None if flag else 0.0
+
+    def sendto(self, data, address):
+        self.sim.tick()
+        if self.address is None:
+            self.register(("127.0.0.1", next(self.sim.ports)))  # Implicit bind, like the kernel
+        data = bytes(data)
+        self.channel.transmit(data, self.address, address[1])
+        return len(data)
+
+    def recvfrom(self, bufsize, flags=0):
+        self.sim.tick()
+        if not self.queue and self.timeout != 0:
+            self.waiter = self.sim.current
+            if self.timeout is not None:
+                self.timer = self.sim.schedule(self.timeout, self.expire)
+            self.sim.block()
+        if not self.queue:
+            if self.timeout == 0:
+                raise BlockingIOError(errno.EAGAIN, "Resource temporarily unavailable")
+            raise socket.timeout("timed out")
+        data, source = self.queue.popleft()
+        return data[:bufsize], source  # UDP truncates, it does not split
+
+    def deliver(self, data, source):
+        if self.closed:
+            return
+        self.queue.append((data, source))
+        if self.waiter:
+            if self.timer:
+                self.timer[2] = None
+            self.sim.wake(self.waiter)
+            self.waiter = self.timer = None
+
+    def expire(self):
+        waiter, self.waiter, self.timer = self.waiter, None, None
+        if waiter:
+            self.sim.wake(waiter)
+
+    def close(self):
+        self.closed = True
+        if self.address and self.sim.sockets.get(self.address[1]) is self:
+            del self.sim.sockets[self.address[1]]
+
+
+class Channel:
+    """One-way latency/jitter, a serializing link per direction, loss and single-bit corruption.
+
+    "Data" is anything sent to a bound socket (towards the receiver), "ack" the
+    way back; each direction has its own loss rate and its own link queue.
+    """
+
+    def __init__(self, sim, rng, loss=0.0, ack_loss=0.0, corrupt=0.0, latency=0.0, jitter=0.0, bandwidth=0.0):
+        self.sim = sim
+        self.rng = rng
+        self.loss = {"data": loss, "ack": ack_loss}
+        self.corrupt = corrupt
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth  # Bytes per second, 0 for unlimited
+        self.busy = {"data": 0.0, "ack": 0.0}  # When each link finishes its current datagram
+        self.stats = {"datagrams": 0, "lost": 0, "corrupted": 0, "unreachable": 0}
+
+    def transmit(self, data, source, port):
+        target = self.sim.sockets.get(port)
+        direction = "data" if target is not None and target.bound else "ack"
+        self.stats["datagrams"] += 1
+        departure = self.sim.now
+        if self.bandwidth:
+            departure = max(departure, self.busy[direction]) + len(data) / self.bandwidth
+            self.busy[direction] = departure
+        if self.rng.random() < self.loss[direction]:
+            self.stats["lost"] += 1
+            return
+        if data and self.rng.random() < self.corrupt:
+            bit = self.rng.randrange(len(data) * 8)
+            data = bytearray(data)
+            data[bit // 8] ^= 1 << (bit % 8)
+            data = bytes(data)
+            self.stats["corrupted"] += 1
+        arrival = departure + self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        self.sim.schedule(arrival - self.sim.now, functools.partial(self.arrive, data, source, port))
+
+    def arrive(self, data, source, port):
+        target = self.sim.sockets.get(port)
+        if target is None:
+            self.stats["unreachable"] += 1  # Nobody bound there, the kernel would drop it too
+            return
+        target.deliver(data, source)
+
+
+class MemoryFiles:
+    """open() for the scripts: image.jpg reads the payload, anything written is kept in memory."""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.written = {}
+
+    def open(self, name, mode="r", *args, **kwargs):
+        if "r" in mode:
+            if os.path.basename(name) == "image.jpg":
+                return io.BytesIO(self.payload)
+            raise FileNotFoundError(errno.ENOENT, "No such file or directory", name)
+        return CapturedFile(self.written, name)
+
+
+class CapturedFile(io.BytesIO):
+    def __init__(self, store, name):
+        super().__init__()
+        self.store = store
+        self.name = name
+
+    def close(self):
+        if not self.closed:
+            self.store[self.name] = self.getvalue()
+        super().close()
+
+
+def quiet(*args, **kwargs):
+    #Shadows print inside the script only, formatting thousands of progress lines costs real time
+    pass
+
+
+@functools.lru_cache(maxsize=8)
+def payload_bytes(option, size, seed):
+    if size is None:
+        with open(os.path.join(benchmark.REPO, option, "image.jpg"), "rb") as f:
+            return f.read()
+    return random.Random(seed).randbytes(size)
+
+
+def simulate(config, verbose=False):
+    """Run one sender/receiver pair through the simulator and return a benchmark-style row."""
+    payload = payload_bytes(config["option"], config["size"], config["payload_seed"])
+    random.seed(config["seed"])  # Both scripts draw from random, in the same order every run
+    sim = Simulation(config["limit"])
+    channel = Channel(sim, random.Random(config["seed"] + 1), config["loss"] / 100, config["ack_loss"] / 100,
+                      config["corrupt"] / 100, config["latency"], config["jitter"], config["bandwidth"])
+    files = MemoryFiles(payload)
+    modules = {}
+    for side in ("receiver", "sender"):
+        module = runner.load_script(os.path.join(benchmark.REPO, config["option"], side + ".py"), "sim_" + side)
+        runner.configure(module, UDP_PORT, config["error_rate"], config["timeout"], config["delay_count"])
+        module.socket = sim.socket_module(channel)
+        module.time = sim.time_module()
+        module.open = files.open
+        if not verbose:
+            module.print = quiet
+        modules[side] = module
+
+    receiver = sim.spawn("receiver", modules["receiver"].main)  # First, so it binds before anything is sent
+    sender = sim.spawn("sender", modules["sender"].main)
+    cpu_start = runner.cpu_seconds()
+    start = time.perf_counter()
+    sim.run()
+
+    row = {name: config[name] for name in config if name not in ("size", "payload_seed", "limit")}
+    row["effective_timeout"] = getattr(modules["sender"], "TIMEOUT", None)  # "timeout" stays the configured key
+    row["bytes"] = len(payload)
+    sent, received = runner.collect_stats(modules["sender"]), runner.collect_stats(modules["receiver"])
+    row["ok"] = sender.done and sender.error is None and files.written.get("received.jpg") == payload
+    if sender.error or not sender.done:
+        row["failure"] = sender.error or "sender never finished"
+    elif receiver.error and not row["ok"]:
+        row["failure"] = "receiver: " + receiver.error
+    elif row["ok"] and not sent.get("confirmed", True):
+        row["ok"] = False
+        row["failure"] = "receiver never confirmed the file"
+    row["wall_time"] = sender.finished_at - sender.started_at
+    row["goodput"] = row["bytes"] / row["wall_time"] if row["ok"] and row["wall_time"] else 0.0
+    row["cpu_time"] = runner.cpu_seconds() - cpu_start
+    row["real_time"] = time.perf_counter() - start
+    for name in ("retransmissions", "drops", "errors"):
+        row[name] = sent.get(name, 0) + received.get(name, 0)
+    row.update(channel.stats)
+    row["events"] = sim.processed
+    return row
+
+
+def discover_options():
+    return [option for option in benchmark.discover_options() if not any(s in option for s in SKIP)]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sweep the RDT options through the discrete-event simulator")
+    parser.add_argument("--options", default="", help="comma-separated substrings to select options")
+    parser.add_argument("--error-rates", default="0", help="script-side error knobs in percent, e.g. 0,10,20")
+    parser.add_argument("--timeouts", default="default", help="seconds, 'default' keeps the script's own")
+    parser.add_argument("--sizes", default="native", help="e.g. native,64K,1M")
+    parser.add_argument("--loss", default="0", help="channel loss towards the receiver in percent, e.g. 0,10,40")
+    parser.add_argument("--ack-loss", default=None, help="channel loss towards the sender, defaults to --loss")
+    parser.add_argument("--corrupt", default="0", help="percent of datagrams with one bit flipped")
+    parser.add_argument("--latencies", default="0.0005", help="one-way delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform 0..jitter seconds per datagram")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="link rate in bytes/s, 0 for unlimited")
+    parser.add_argument("--delay-count", type=int, default=0, help="for the extra/delays option")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--limit", type=float, default=3600.0, help="virtual seconds before a run is abandoned")
+    parser.add_argument("--csv", default="simulate.csv")
+    parser.add_argument("--json", default="simulate.json")
+    parser.add_argument("--verbose", action="store_true", help="keep the scripts' own prints, forces --jobs 1")
+    parser.add_argument("--list", action="store_true", help="print the options that can be simulated and exit")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = discover_options()
+    if args.options:
+        wanted = benchmark.split_list(args.options, str)
+        options = [o for o in options if any(w in o for w in wanted)]
+    if args.list:
+        print("\n".join(options))
+        return
+
+    losses = benchmark.split_list(args.loss, float)
+    ack_losses = benchmark.split_list(args.ack_loss, float) if args.ack_loss is not None else [None]
+    configs = []
+    for option, size, error_rate, timeout, loss, ack_loss, corrupt, latency, repeat in itertools.product(
+            options, benchmark.split_list(args.sizes, benchmark.parse_size),
+            benchmark.split_list(args.error_rates, int), benchmark.split_list(args.timeouts, benchmark.optional_float),
+            losses, ack_losses, benchmark.split_list(args.corrupt, float),
+            benchmark.split_list(args.latencies, float), range(args.repeats)):
+        configs.append({"option": option, "error_rate": error_rate, "timeout": timeout,
+                        "loss": loss, "ack_loss": loss if ack_loss is None else ack_loss, "corrupt": corrupt,
+                        "latency": latency, "jitter": args.jitter, "bandwidth": args.bandwidth,
+                        "delay_count": args.delay_count, "repeat": repeat,
+                        "seed": args.seed * 1000 + repeat * 2, "size": size, "payload_seed": args.seed,
+                        "limit": args.limit})
+
+    jobs = 1 if args.verbose else args.jobs
+    print(f"{len(configs)} simulated runs over {len(options)} options, {jobs} at a time")
+    rows = []
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(simulate, config, args.verbose) for config in configs]
+        for future in concurrent.futures.as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            status = "ok" if row["ok"] else row.get("failure", "corrupt output")
+            print(f"[{len(rows)}/{len(configs)}] {row['option']} err={row['error_rate']} loss={row['loss']} "
+                  f"latency={row['latency']} timeout={row['timeout']}: {status}, "
+                  f"{row['wall_time']:.3f} virtual s in {row['real_time']:.3f} s")
+    elapsed = time.perf_counter() - start
+
+    rows.sort(key=lambda r: (r["option"], r["bytes"], r["error_rate"], r["loss"], r["ack_loss"], r["corrupt"],
+                             r["latency"], str(r["timeout"]), r["repeat"]))
+    benchmark.write_csv(args.csv, rows)
+    with open(args.json, "w") as f:
+        json.dump({"runs": rows, "summary": benchmark.aggregate(rows, KEY)}, f, indent=2)
+    print(f"{len(rows)} runs in {elapsed:.1f} s ({len(rows) / elapsed * 60:.0f}/min), "
+          f"results written to {args.csv} and {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Where a run's time goes, stage by stage, for any script run through tools/runner.py.
+
+On by default (runner.py --no-stages turns it off). The probe wraps the
+script's own globals rather than editing the scripts: open() so file reads
+and writes are timed, make_packet (framing and checksum), is_corrupt
+(the receiver's verification), and the socket class (sendto, and the
+receive calls, which are where a sender waits for its ACK and a receiver
+for its next packet). Each call is timed with perf_counter_ns into a fixed
+power-of-two histogram, so the cost is two clock reads and an index per call.
+
+At the end of the run the probe prints a table to stderr: per stage, the
+time, its share of the wall clock and cycles per file byte. It also prints
+user and system CPU time from getrusage. The same figures go into the JSON
+result under "stages".
+"""
+import builtins
+import functools
+import resource
+import sys
+import time
+
+from probe import Probe
+
+BUCKETS = 48  # Histogram bucket n holds calls that took [2^(n-1), 2^n) ns, the last one everything longer
+# Stage name -> script global it wraps, in pipeline order
+FUNCTIONS = {"checksum": "make_packet", "verify": "is_corrupt"}
+ORDER = ("read", "checksum", "send", "wait", "verify", "write")
+RECEIVES = ("recv", "recvfrom", "recvfrom_into", "recvmsg", "recv_into")
+
+
+def cpu_hz():
+    #Nominal clock of the first CPU, None where /proc/cpuinfo has no "cpu MHz" (cycles are then left out)
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("cpu MHz"):
+                    return float(line.split(":")[1]) * 1e6
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class Stage:
+    """Calls, total nanoseconds and a log2 histogram of one stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0
+        self.bytes = 0  # File bytes, for read and write
+        self.buckets = [0] * BUCKETS
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        self.buckets[min(elapsed.bit_length(), BUCKETS - 1)] += 1
+
+    def quantile(self, q):
+        #Upper bound of the bucket holding the q-th call, in nanoseconds
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= q * self.calls:
+                return 1 << bucket
+        return 0
+
+
+class TimedFile:
+    """File object whose read/readinto/write calls count towards the read and write stages."""
+
+    def __init__(self, f, probe):
+        self.f = f
+        self.probe = probe
+
+    def read(self, *args):
+        start = time.perf_counter_ns()
+        data = self.f.read(*args)
+        self.probe.count("read", start, len(data))
+        return data
+
+    def readinto(self, buffer):
+        start = time.perf_counter_ns()
+        size = self.f.readinto(buffer)
+        self.probe.count("read", start, size or 0)
+        return size
+
+    def write(self, data):
+        start = time.perf_counter_ns()
+        size = self.f.write(data)
+        self.probe.count("write", start, len(data))
+        return size
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __iter__(self):
+        return iter(self.f)
+
+    def __enter__(self):
+        self.f.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.f.__exit__(*exc)
+
+
+class StageProbe(Probe):
+    """Times the read/checksum/send/wait/verify/write stages of one run."""
+
+    def __init__(self, hz=None, stream=None):
+        self.hz = hz or cpu_hz()
+        self.stream = stream or sys.stderr
+        self.stages = {name: Stage(name) for name in ORDER}
+        self.started = self.usage = None
+
+    def count(self, name, start, size=0):
+        stage = self.stages[name]
+        stage.add(time.perf_counter_ns() - start)
+        stage.bytes += size
+
+    def timed(self, name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.count(name, start)
+        return wrapper
+
+    def attach(self, module):
+        probe = self
+        for name, function in FUNCTIONS.items():
+            if callable(getattr(module, function, None)):
+                setattr(module, function, self.timed(name, getattr(module, function)))
+
+        inner = getattr(module, "open", builtins.open)  # Another probe's open, e.g. tracing's, stays in the chain
+
+        def timed_open(*args, **kwargs):
+            return TimedFile(inner(*args, **kwargs), probe)
+        module.open = timed_open  # Shadows the builtin inside the script only, like runner.configure's input
+
+        class TimedSocket(module.socket.socket):
+            sendto = self.timed("send", module.socket.socket.sendto)
+
+        for method in RECEIVES:
+            setattr(TimedSocket, method, self.timed("wait", getattr(module.socket.socket, method)))
+        module.socket.socket = TimedSocket  # module.socket is the runner's private copy, not the real module
+        self.usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.started = time.perf_counter_ns()
+
+    def finish(self, result):
+        if self.started is None:
+            return
+        wall = time.perf_counter_ns() - self.started
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        user = usage.ru_utime - self.usage.ru_utime
+        system = usage.ru_stime - self.usage.ru_stime
+        # The file is read on the sending side and written on the receiving one
+        size = max(self.stages["read"].bytes, self.stages["write"].bytes)
+        rows = []
+        for stage in self.stages.values():
+            if stage.calls:
+                rows.append(self.row(stage.name, stage.calls, stage.total, wall, size, stage))
+        rows.append(self.row("other", None, max(0, wall - sum(s.total for s in self.stages.values())), wall, size))
+        result["stages"] = {"wall_ns": wall, "bytes": size, "cpu_hz": self.hz, "user_time": user,
+                            "system_time": system, "rows": rows}
+        self.stream.write(self.render(result["stages"]))
+
+    def row(self, name, calls, total, wall, size, stage=None):
+        return {"stage": name, "calls": calls, "ns": total, "share": total / wall if wall else 0.0,
+                "cycles_per_byte": total / 1e9 * self.hz / size if self.hz and size else None,
+                "p50_ns": stage.quantile(0.5) if stage else None, "p99_ns": stage.quantile(0.99) if stage else None}
+
+    def render(self, report):
+        lines = [f"{'stage':<10}{'calls':>9}{'ms':>11}{'share':>8}{'p50 us':>10}{'p99 us':>10}{'cyc/byte':>10}"]
+        for row in report["rows"]:
+            calls = "" if row["calls"] is None else row["calls"]
+            p50 = "" if row["p50_ns"] is None else f"{row['p50_ns'] / 1e3:.1f}"
+            p99 = "" if row["p99_ns"] is None else f"{row['p99_ns'] / 1e3:.1f}"
+            cycles = "-" if row["cycles_per_byte"] is None else f"{row['cycles_per_byte']:.1f}"
+            lines.append(f"{row['stage']:<10}{calls:>9}{row['ns'] / 1e6:>11.2f}{row['share']:>8.1%}"
+                         f"{p50:>10}{p99:>10}{cycles:>10}")
+        cpu = report["user_time"] + report["system_time"]
+        cycles = (f", {cpu * report['cpu_hz'] / report['bytes']:.1f} cycles/byte"
+                  if report["cpu_hz"] and report["bytes"] else "")
+        lines.append(f"wall {report['wall_ns'] / 1e9:.3f} s, CPU user {report['user_time']:.3f} s, "
+                     f"system {report['system_time']:.3f} s{cycles}, {report['bytes']} file bytes")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,161 @@
+"""Compact binary per-packet event trace.
+
+A trace file is an 8-byte header (magic, version, record size) followed by
+fixed-size little-endian records:
+
+    u64 monotonic ns | u8 event | u8 pad | u32 length | u32 seq | u64 offset
+
+Records go into a preallocated buffer with struct.pack_into and hit the disk
+only when the buffer fills, so tracing costs one pack per event.  A lock keeps the
+pipelined engine's send and ACK threads from writing over each other's records.  Use
+tools/analyze_trace.py to turn a trace into NumPy arrays and plots.
+"""
+import struct
+import threading
+import time
+
+from probe import Probe, SendTracker
+
+MAGIC = b"RDTT"
+VERSION = 2  # 2: length widened to u32, 64 KB payloads and large writes overflowed u16
+HEADER = struct.Struct("<4sHH")
+RECORD = struct.Struct("<QBxIIQ")
+
+SEND = 1
+RETRANSMIT = 2
+ACK = 3          # ACK arrived at the sender
+TIMEOUT = 4
+CORRUPT = 5
+DELIVER = 6      # Payload written to the output file
+RECEIVE = 7      # Datagram arrived at the receiver
+ACK_SENT = 8
+
+EVENT_NAMES = {SEND: "send", RETRANSMIT: "retransmit", ACK: "ack", TIMEOUT: "timeout",
+               CORRUPT: "corrupt", DELIVER: "deliver", RECEIVE: "receive", ACK_SENT: "ack_sent"}
+
+
+class TraceWriter:
+    """Buffered writer of fixed-size trace records."""
+
+    def __init__(self, path, buffer_records=8192):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.position = 0
+        self.clock = time.monotonic_ns
+        self.lock = threading.Lock()
+
+    def record(self, event, seq=0, offset=0, length=0, now=None):
+        with self.lock:
+            if self.position == len(self.buffer):
+                self.flush()
+            RECORD.pack_into(self.buffer, self.position, now or self.clock(), event, length, seq, offset)
+            self.position += RECORD.size
+
+    def flush(self):
+        #Caller holds the lock, or is the only thread left
+        self.file.write(memoryview(self.buffer)[:self.position])
+        self.position = 0
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.file.close()
+
+
+def read_records(path):
+    #Plain-Python reader, yields (ns, event, length, seq, offset)
+    with open(path, "rb") as f:
+        magic, version, size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or size != RECORD.size:
+            raise ValueError(f"{path} is not an RDT trace (version {version})")
+        data = f.read()
+    return list(RECORD.iter_unpack(data[:len(data) - len(data) % size]))
+
+
+class TracedFile:
+    #File proxy that records every write as a DELIVER event
+    def __init__(self, file, writer):
+        self._file = file
+        self._writer = writer
+        self._offset = 0
+
+    def write(self, data):
+        self._writer.record(DELIVER, 0, self._offset, len(data))
+        self._offset += len(data)
+        return self._file.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._file.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class TraceProbe(Probe):
+    """Writes send/retransmit/ACK/timeout/corrupt/deliver events for a run.
+
+    Timestamps come from the runner's perf_counter_ns hooks, which is
+    CLOCK_MONOTONIC on Linux, the same clock as time.monotonic_ns.
+    """
+
+    def __init__(self, path, header_size=3):
+        self.writer = TraceWriter(path)
+        self.sends = SendTracker(header_size)
+        self.offset = 0  # Offset of the last data packet sent, what stop-and-wait ACKs and timeouts refer to
+
+    def attach(self, module):
+        writer = self.writer
+        if hasattr(module, "is_corrupt"):
+            original = module.is_corrupt
+
+            def is_corrupt(*args):
+                bad = original(*args)
+                if bad:
+                    writer.record(CORRUPT)
+                return bad
+
+            module.is_corrupt = is_corrupt
+
+        def traced_open(path, mode="r", *args, **kwargs):
+            file = open(path, mode, *args, **kwargs)
+            return TracedFile(file, writer) if "w" in mode else file
+
+        module.open = traced_open
+
+        if hasattr(module, "WriteBehind"):
+            # The pipelined receiver hands payloads to a write-behind writer, which writes with pwritev
+            class TracedWriter(module.WriteBehind):
+                def write(self, offset, data):
+                    writer.record(DELIVER, 0, offset, len(data))
+                    return super().write(offset, data)
+
+            module.WriteBehind = TracedWriter
+        self.sends.attach(module)
+
+    def sent(self, data, now, receiving):
+        seq = data[0] if data else 0
+        if receiving:
+            self.writer.record(ACK_SENT, seq, 0, len(data), now)
+        else:
+            resent, seq, offset, length = self.sends.classify(data)
+            if resent is not None:
+                self.offset = offset
+            self.writer.record(RETRANSMIT if resent else SEND, seq, offset, length, now)
+
+    def received(self, data, now, receiving):
+        seq = data[0] if data else 0
+        if receiving:
+            self.writer.record(RECEIVE, seq, 0, len(data), now)
+        else:
+            self.writer.record(ACK, seq, self.sends.acked(data, self.offset), len(data), now)
+
+    def timed_out(self, now):
+        self.writer.record(TIMEOUT, 0, self.offset, 0, now)
+
+    def finish(self, result):
+        self.writer.close()
+        result["trace"] = self.writer.file.name